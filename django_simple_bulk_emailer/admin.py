@@ -30,7 +30,9 @@ from .models import (
     BulkEmail,
     EmailDocument,
     EmailImage,
+    FailedDelivery,
     MonthlyStat,
+    SendRun,
     SiteProfile,
     Subscriber,
     Subscription,
@@ -162,7 +164,14 @@ admin.site.register(
 
 
 class SubscriberAdminForm(forms.ModelForm):
-    subscriptions = forms.ModelMultipleChoiceField(
+    def __init__(self, *args, **kwargs):
+        """ """
+        ''' Subscriptions are saved through memberships, which the admin cannot edit as a field of the subscriber, so they are chosen in a field of their own '''
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['subscription_choices'].initial = self.instance.subscriptions.all()
+
+    subscription_choices = forms.ModelMultipleChoiceField(
         queryset=Subscription.objects.order_by(
             'list_name',
         ),
@@ -177,6 +186,7 @@ class SubscriberAdminForm(forms.ModelForm):
     class Meta:
         model = Subscriber
         exclude = [
+            'subscriptions',
             'subscriber_key',
             'mc_email',
             'mc_synced',
@@ -196,7 +206,7 @@ class SubscriberAdmin(BaseAdmin):
                         'first_name',
                         'last_name',
                         'subscriber_email',
-                        'subscriptions',
+                        'subscription_choices',
                     ]
                 }
             ),
@@ -208,6 +218,11 @@ class SubscriberAdmin(BaseAdmin):
             return super().get_form(request, obj, **kwargs)
         return SubscriberAdminForm
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if 'subscription_choices' in form.cleaned_data:
+            form.instance.subscriptions.set(form.cleaned_data['subscription_choices'])
+
     search_fields = [
         'first_name',
         'last_name',
@@ -345,7 +360,6 @@ class BulkEmailAdminForm(forms.ModelForm):
             'sendable',
             'sending',
             'sent',
-            'send_history',
         ]
         widgets = {
             'headline': forms.TextInput(
@@ -446,6 +460,7 @@ class MonthlyStatAdmin(BaseAdmin):
         self.readonly_fields = [
             'month_and_year',
             'stat_table',
+            'opener_table',
         ] + self.readonly_fields
         self.top_fieldsets = [
             (
@@ -453,6 +468,7 @@ class MonthlyStatAdmin(BaseAdmin):
                     'fields': [
                         'month_and_year',
                         'stat_table',
+                        'opener_table',
                     ]
                 }
             ),
@@ -486,3 +502,138 @@ admin.site.register(
     MonthlyStat,
     MonthlyStatAdmin,
 )
+
+
+class FailedDeliveryAdmin(BaseAdmin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.readonly_fields = [
+            'tracker',
+            'subscriber',
+            'status',
+            'error_class',
+            'error_message',
+            'attempts',
+            'next_attempt',
+        ] + self.readonly_fields
+        self.top_fieldsets = [
+            (
+                None, {
+                    'fields': [
+                        'tracker',
+                        'subscriber',
+                        'status',
+                        'error_class',
+                        'error_message',
+                        'attempts',
+                        'next_attempt',
+                    ]
+                }
+            ),
+        ]
+        self.fieldsets = self.top_fieldsets + self.bottom_fieldsets
+
+    list_display = [
+        'subscriber',
+        'tracker',
+        'status',
+        'error_class',
+        'attempts',
+        'next_attempt',
+    ]
+    list_filter = [
+        'status',
+    ]
+    search_fields = [
+        'subscriber__subscriber_email',
+    ]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(
+    FailedDelivery,
+    FailedDeliveryAdmin,
+)
+
+
+class SendRunAdmin(BaseAdmin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.readonly_fields = [
+            'tracker',
+            'batch',
+            'worker',
+            'finished',
+            'recipient_count',
+            'number_sent',
+            'number_failed',
+            'send_rate',
+            'estimated_completion',
+            'query_seconds',
+            'render_seconds',
+            'deliver_seconds',
+        ] + self.readonly_fields
+        self.top_fieldsets = [
+            (
+                None, {
+                    'fields': [
+                        'tracker',
+                        'batch',
+                        'worker',
+                        'finished',
+                    ]
+                }
+            ),
+            (
+                'Progress', {
+                    'fields': [
+                        'recipient_count',
+                        'number_sent',
+                        'number_failed',
+                        'send_rate',
+                        'estimated_completion',
+                    ]
+                }
+            ),
+            (
+                'Time spent', {
+                    'fields': [
+                        'query_seconds',
+                        'render_seconds',
+                        'deliver_seconds',
+                    ]
+                }
+            ),
+        ]
+        self.fieldsets = self.top_fieldsets + self.bottom_fieldsets
+
+    list_display = [
+        'tracker',
+        'created',
+        'finished',
+        'recipient_count',
+        'number_sent',
+        'number_failed',
+        'send_rate',
+        'estimated_completion',
+    ]
+    list_select_related = [
+        'tracker',
+    ]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(
+    SendRun,
+    SendRunAdmin,
+)
@@ -1,6 +1,10 @@
 from django.apps import (
     AppConfig,
 )
+from django.core.checks import (
+    Tags,
+    register,
+)
 
 
 class Config(AppConfig):
@@ -9,6 +13,11 @@ class Config(AppConfig):
     verbose_name = 'Bulk email'
 
     def ready(self):
+        from .checks import (
+            check_email_classes,
+        )
         from .signals import (
             handlers,
         )
+        ''' Checks that query the database only run when a database is given, such as by migrate or check --database '''
+        register(check_email_classes, Tags.database)
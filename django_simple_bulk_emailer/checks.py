@@ -0,0 +1,53 @@
+from django.core.checks import (
+    Error,
+)
+from django.db import (
+    DatabaseError,
+    models,
+)
+
+
+from .models import (
+    Subscription,
+    import_email_class,
+)
+
+
+def check_email_classes(app_configs, databases=None, **kwargs):
+    """ """
+    ''' Report subscriptions whose associated model cannot be imported, rather than failing when an email is sent or a page is viewed '''
+    errors = []
+    for database in databases or []:
+        try:
+            associated_models = set(
+                Subscription.objects.using(
+                    database,
+                ).values_list(
+                    'associated_model',
+                    flat=True,
+                )
+            )
+        except DatabaseError:
+            continue
+        ''' Subscriptions only used to manage MailChimp subscribers have no email model '''
+        associated_models.discard('None')
+        for associated_model in sorted(associated_models):
+            try:
+                email_class = import_email_class(associated_model)
+            except (ImportError, AttributeError, ValueError):
+                errors.append(
+                    Error(
+                        f"Subscription associated model '{associated_model}' cannot be imported.",
+                        hint='Use the full dotted path to the model class, such as django_simple_bulk_emailer.models.BulkEmail.',
+                        id='django_simple_bulk_emailer.E001',
+                    )
+                )
+                continue
+            if not (isinstance(email_class, type) and issubclass(email_class, models.Model)):
+                errors.append(
+                    Error(
+                        f"Subscription associated model '{associated_model}' is not a model.",
+                        id='django_simple_bulk_emailer.E002',
+                    )
+                )
+    return errors
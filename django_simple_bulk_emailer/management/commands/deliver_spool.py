@@ -0,0 +1,114 @@
+from threading import (
+    Event,
+    Thread,
+)
+
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+from django.db import (
+    transaction,
+)
+from django.db.models import (
+    F,
+)
+
+
+from ...models import (
+    EmailTracker,
+)
+from ...sending import (
+    BulkMailer,
+    Spool,
+    get_spool_directory,
+    parse_spool_name,
+    record_failures,
+    update_send_records,
+)
+from .send_bulk_email import (
+    get_send_lease,
+)
+
+
+class Command(BaseCommand):
+    help = 'Delivers bulk emails written to the spool by send_bulk_email'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Deliver messages claimed by an interrupted run straight away',
+        )
+
+    def handle(self, *args, **options):
+        spool_directory = get_spool_directory()
+        if not spool_directory:
+            raise CommandError('EMAILER_SPOOL_DIRECTORY is not set')
+        spool = Spool(spool_directory)
+        ''' Messages claimed by a run that stopped are delivered again once its lease has passed '''
+        if options['resume']:
+            spool.release()
+        else:
+            spool.release(lease=get_send_lease())
+        self.claimed = []
+        self.number_sent = 0
+        self.stopped = Event()
+        keeper = Thread(target=self.keep_claimed, args=(spool,), daemon=True)
+        keeper.start()
+        try:
+            with BulkMailer() as mailer:
+                for name in spool.claim():
+                    self.claimed.append(name)
+                    mailer.add(
+                        spool.read(name),
+                        marker=name,
+                    )
+                    self.save_progress(spool, mailer)
+            self.save_progress(spool, mailer)
+        finally:
+            self.stopped.set()
+            keeper.join()
+        if options['verbosity'] >= 2:
+            self.stdout.write(f'Delivered {self.number_sent} emails')
+
+    def keep_claimed(self, spool):
+        """ """
+        ''' Renew the claim on messages not yet delivered on a timer, so a batch slowed by rate limits or throttling cannot outlast the lease '''
+        while not self.stopped.wait(get_send_lease() / 3):
+            spool.renew(list(self.claimed))
+
+    def save_progress(self, spool, mailer):
+        """ """
+        ''' Count each delivered batch on its trackers, keep failed recipients for retry_failed_deliveries and clear the batch from the spool '''
+        for marker, number_sent, failures in mailer.pop_delivered():
+            failures = dict(failures)
+            index = self.claimed.index(marker) + 1
+            names = self.claimed[:index]
+            self.claimed = self.claimed[index:]
+            tracker_sent = {}
+            tracker_failures = {}
+            for name in names:
+                tracker_pk, subscriber_pk = parse_spool_name(name)
+                if name in failures:
+                    tracker_failures.setdefault(tracker_pk, []).append((subscriber_pk, failures[name]))
+                else:
+                    tracker_sent[tracker_pk] = tracker_sent.get(tracker_pk, 0) + 1
+            with transaction.atomic():
+                for tracker_pk, tracker_number_sent in tracker_sent.items():
+                    EmailTracker.objects.filter(
+                        pk=tracker_pk,
+                    ).update(
+                        number_sent=F('number_sent') + tracker_number_sent,
+                    )
+                for tracker_pk, failed in tracker_failures.items():
+                    tracker = EmailTracker.objects.filter(
+                        pk=tracker_pk,
+                    ).first()
+                    if tracker:
+                        record_failures(tracker, failed)
+                update_send_records(tracker_sent.keys() | tracker_failures.keys())
+            for name in names:
+                spool.remove(name)
+            self.number_sent += number_sent
@@ -0,0 +1,75 @@
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+from django.db import (
+    transaction,
+)
+
+
+from ...models import (
+    EmailTracker,
+    OpenEvent,
+)
+from ...tracking import (
+    OpenBuffer,
+    fold_open_events,
+    get_flush_batch_size,
+    get_open_buffer_directory,
+)
+
+
+class Command(BaseCommand):
+    help = 'Saves email opens buffered by the tracking image view'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Also save opens from the current minute, for example once the site has stopped',
+        )
+
+    def handle(self, *args, **options):
+        open_buffer_directory = get_open_buffer_directory()
+        if not open_buffer_directory:
+            raise CommandError('EMAILER_OPEN_BUFFER_DIRECTORY is not set')
+        open_buffer = OpenBuffer(open_buffer_directory)
+        names = open_buffer.claim(everything=options['all'])
+        ''' Only each subscriber's earliest open of an email is kept '''
+        opens = {}
+        for name in names:
+            for tracker_pk, subscriber_key, opened in open_buffer.read(name):
+                if len(subscriber_key) > 255:
+                    continue
+                open_key = (tracker_pk, subscriber_key)
+                if open_key not in opens or opened < opens[open_key]:
+                    opens[open_key] = opened
+        tracker_pks = set(
+            EmailTracker.objects.filter(
+                pk__in={tracker_pk for tracker_pk, subscriber_key in opens},
+            ).values_list(
+                'pk',
+                flat=True,
+            )
+        )
+        open_events = [
+            OpenEvent(
+                tracker_id=tracker_pk,
+                subscriber_key=subscriber_key,
+                opened=opened,
+            )
+            for (tracker_pk, subscriber_key), opened in opens.items()
+            if tracker_pk in tracker_pks
+        ]
+        ''' Opens already saved are left as they are, so a file claimed twice is harmless '''
+        with transaction.atomic():
+            OpenEvent.objects.bulk_create(
+                open_events,
+                batch_size=get_flush_batch_size(),
+                ignore_conflicts=True,
+            )
+        for name in names:
+            open_buffer.remove(name)
+        fold_open_events()
+        if options['verbosity'] >= 2:
+            self.stdout.write(f'Saved {len(open_events)} opens from {len(names)} files')
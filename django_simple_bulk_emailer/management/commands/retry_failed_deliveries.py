@@ -0,0 +1,123 @@
+from django.core.exceptions import (
+    ObjectDoesNotExist,
+)
+from django.core.management.base import (
+    BaseCommand,
+)
+from django.db import (
+    transaction,
+)
+from django.db.models import (
+    F,
+)
+from django.utils import (
+    timezone,
+)
+
+
+from ...models import (
+    EmailTracker,
+    FailedDelivery,
+)
+from ...sending import (
+    BulkMailer,
+    EmailSend,
+    SendContext,
+    get_failure_status,
+    update_send_records,
+)
+
+
+class Command(BaseCommand):
+    help = 'Redelivers bulk emails that could not be delivered when they were sent'
+
+    def handle(self, *args, **options):
+        due_deliveries = FailedDelivery.objects.filter(
+            status=FailedDelivery.RETRYING,
+            next_attempt__lte=timezone.now(),
+        )
+        ''' Subscribers who have left the list since the send are not retried '''
+        left_deliveries = due_deliveries.exclude(
+            subscriber__subscriptions=F('tracker__subscription'),
+        )
+        tracker_pks = set(
+            left_deliveries.values_list(
+                'tracker',
+                flat=True,
+            )
+        )
+        left_deliveries.delete()
+        update_send_records(tracker_pks)
+        deliveries = list(
+            due_deliveries.select_related(
+                'tracker__subscription',
+                'subscriber',
+            ).order_by(
+                'tracker',
+                'pk',
+            )
+        )
+        if not deliveries:
+            return
+        send_context = SendContext()
+        email_sends = {}
+        self.queued = []
+        with BulkMailer() as mailer:
+            for delivery in deliveries:
+                tracker = delivery.tracker
+                if tracker.pk not in email_sends:
+                    email_sends[tracker.pk] = self.get_email_send(tracker, send_context)
+                email_send = email_sends[tracker.pk]
+                if not email_send:
+                    self.record_dead_letter(delivery)
+                    continue
+                mailer.add(
+                    email_send.create_message(delivery.subscriber),
+                    marker=delivery.pk,
+                )
+                self.queued.append(delivery)
+                self.save_results(mailer)
+        self.save_results(mailer)
+
+    def save_results(self, mailer):
+        """ """
+        ''' Save each delivered batch as it comes back, so a run that stops part way does not deliver those messages again '''
+        for marker, number_sent, failures in mailer.pop_delivered():
+            failures = dict(failures)
+            index = [delivery.pk for delivery in self.queued].index(marker) + 1
+            delivered = self.queued[:index]
+            self.queued = self.queued[index:]
+            with transaction.atomic():
+                for delivery in delivered:
+                    if delivery.pk in failures:
+                        self.record_failure(delivery, failures[delivery.pk])
+                    else:
+                        delivery.delete()
+                        EmailTracker.objects.filter(
+                            pk=delivery.tracker_id,
+                        ).update(
+                            number_sent=F('number_sent') + 1,
+                        )
+                update_send_records({delivery.tracker_id for delivery in delivered})
+
+    def get_email_send(self, tracker, send_context):
+        if not tracker.subscription:
+            return None
+        try:
+            return EmailSend(tracker, send_context)
+        except ObjectDoesNotExist:
+            return None
+
+    def record_failure(self, delivery, error):
+        delivery.attempts += 1
+        delivery.status, delivery.next_attempt = get_failure_status(error, delivery.attempts)
+        delivery.error_class = type(error).__name__
+        delivery.error_message = str(error)
+        delivery.save()
+
+    def record_dead_letter(self, delivery):
+        delivery.status = FailedDelivery.DEAD
+        delivery.next_attempt = None
+        delivery.error_class = 'ObjectDoesNotExist'
+        delivery.error_message = 'The email for this send no longer exists'
+        delivery.save()
@@ -1,117 +1,711 @@
-from django.contrib.sites.models import (
-    Site,
+from datetime import (
+    timedelta,
+)
+from os import (
+    getpid,
+)
+from socket import (
+    gethostname,
+)
+from threading import (
+    Event,
+    Thread,
+)
+from time import (
+    monotonic,
+)
+
+
+from django.conf import (
+    settings,
+)
+from django.core.exceptions import (
+    ObjectDoesNotExist,
 )
 from django.core.management.base import (
     BaseCommand,
 )
-from django.urls import (
-    reverse,
+from django.db import (
+    connection,
+    transaction,
+)
+from django.db.models import (
+    F,
+    Q,
 )
 from django.utils import (
     timezone,
 )
-from django.utils.formats import (
-    localize,
+from django.utils.crypto import (
+    get_random_string,
 )
 
 
-from ...views import (
-    get_universal_email_directory,
-    send_email,
-)
 from ...models import (
     EmailTracker,
-    SiteProfile,
-    Subscriber,
+    OpenBitmap,
+    SendBatch,
+    SendRecord,
+    SendRun,
     Subscription,
+    get_month_number,
+)
+from ...sending import (
+    BulkMailer,
+    EmailSend,
+    PhaseTimer,
+    SendContext,
+    Spool,
+    SpoolMailer,
+    ThreadedMailer,
+    count_recipients,
+    get_peak_memory,
+    get_rate_limiter,
+    get_recipients,
+    get_spool_directory,
+    iterate_recipients,
+    record_failures,
 )
 
 
+def get_shard_size():
+    try:
+        return settings.EMAILER_SHARD_SIZE
+    except AttributeError:
+        return 1000
+
+
+def get_send_lease():
+    try:
+        return settings.EMAILER_SEND_LEASE
+    except AttributeError:
+        return 600
+
+
+def get_lease_expiry():
+    return timezone.now() + timedelta(seconds=get_send_lease())
+
+
+def get_worker_token():
+    return f'{gethostname()}:{getpid()}:{get_random_string(8)}'
+
+
+def claimable_batches():
+    """ """
+    ''' Pending batches, and claimed ones whose worker has not saved progress within the lease '''
+    return Q(status=SendBatch.PENDING) | Q(
+        status=SendBatch.CLAIMED,
+        claimed_at__lt=timezone.now() - timedelta(seconds=get_send_lease()),
+    )
+
+
+def claim_tracker(tracker_pk, worker_token, force=False):
+    """ """
+    ''' Take over an unfinished send whose lease has run out, or any unfinished send if forced '''
+    trackers = EmailTracker.objects.filter(
+        pk=tracker_pk,
+        sending=True,
+    )
+    if not force:
+        trackers = trackers.filter(
+            Q(lease_expires__lt=timezone.now()) | Q(lease_expires__isnull=True),
+        )
+    return trackers.update(
+        claimed_by=worker_token,
+        lease_expires=get_lease_expiry(),
+    )
+
+
+def claim_batch(worker_token):
+    pending_batches = SendBatch.objects.filter(
+        claimable_batches(),
+    ).order_by(
+        'pk',
+    )
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            batch = pending_batches.select_for_update(
+                skip_locked=True,
+            ).first()
+            if batch:
+                batch.status = SendBatch.CLAIMED
+                batch.claimed_by = worker_token
+                batch.claimed_at = timezone.now()
+                batch.save()
+            return batch
+    ''' Without SKIP LOCKED, claim with a conditional update and try the next batch if another worker got there first '''
+    while True:
+        batch_pk = pending_batches.values_list(
+            'pk',
+            flat=True,
+        ).first()
+        if batch_pk is None:
+            return None
+        claimed = SendBatch.objects.filter(
+            claimable_batches(),
+            pk=batch_pk,
+        ).update(
+            status=SendBatch.CLAIMED,
+            claimed_by=worker_token,
+            claimed_at=timezone.now(),
+        )
+        if claimed:
+            return SendBatch.objects.get(
+                pk=batch_pk,
+            )
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class OutOfTime(Exception):
+    pass
+
+
+class SendLease:
+    def __init__(self, worker_token, tracker, batch=None):
+        """ """
+        ''' A process holds a send, or with --worker a batch, for as long as it keeps renewing the lease under its own token '''
+        self.worker_token = worker_token
+        self.tracker = tracker
+        self.batch = batch
+        self.lost = False
+        self.stopped = Event()
+        self.thread = None
+
+    def held(self):
+        if self.batch:
+            return SendBatch.objects.filter(
+                pk=self.batch.pk,
+                status=SendBatch.CLAIMED,
+                claimed_by=self.worker_token,
+            )
+        return EmailTracker.objects.filter(
+            pk=self.tracker.pk,
+            sending=True,
+            claimed_by=self.worker_token,
+        )
+
+    def renew(self, **kwargs):
+        """ """
+        ''' Extend the lease, saving any progress along with it, unless another process has taken the send over '''
+        if self.batch:
+            kwargs['claimed_at'] = timezone.now()
+        else:
+            kwargs['lease_expires'] = get_lease_expiry()
+        if not self.held().update(**kwargs):
+            self.lost = True
+        return not self.lost
+
+    def release(self):
+        """ """
+        ''' Give the send, or batch, back straight away so the next run can continue it from the checkpoint '''
+        if self.batch:
+            self.held().update(
+                status=SendBatch.PENDING,
+                claimed_by='',
+                claimed_at=None,
+            )
+        else:
+            self.held().update(
+                lease_expires=None,
+            )
+
+    def keep(self):
+        """ """
+        ''' Renew the lease on a timer, so a group of messages slowed by rate limits or throttling cannot outlast it '''
+        try:
+            while not self.stopped.wait(get_send_lease() / 3):
+                if not self.renew():
+                    break
+        finally:
+            connection.close()
+
+    def start(self):
+        self.thread = Thread(target=self.keep, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def check(self):
+        if self.lost:
+            raise LeaseLost()
+
+
 class Command(BaseCommand):
     help = 'Sends bulk email'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of threads delivering mail, each over its own connection',
+        )
+        parser.add_argument(
+            '--worker',
+            action='store_true',
+            help='Split sends into batches shared with other worker processes and deliver batches until none remain',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue interrupted sends from their last checkpoint before starting new ones',
+        )
+        parser.add_argument(
+            '--drain',
+            action='store_true',
+            help='Keep sending queued emails until none remain',
+        )
+        parser.add_argument(
+            '--max-emails',
+            type=int,
+            help='Most emails to start sending in this run',
+        )
+        parser.add_argument(
+            '--time-budget',
+            type=float,
+            help='Seconds after which no further emails or batches are started',
+        )
+
     def handle(self, *args, **options):
-        subscriptions = Subscription.objects.order_by(
+        self.workers = options['workers']
+        self.verbosity = options['verbosity']
+        self.email_sends = {}
+        self.send_context = None
+        self.rate_limiter = get_rate_limiter()
+        self.mailer = None
+        self.spool = None
+        spool_directory = get_spool_directory()
+        if spool_directory:
+            self.spool = Spool(spool_directory)
+        self.number_sent = 0
+        self.email_count = 0
+        self.worker_token = get_worker_token()
+        self.deadline = None
+        if options['time_budget'] is not None:
+            self.deadline = monotonic() + options['time_budget']
+        ''' Workers already drain the queue, otherwise only one email is sent unless asked for more '''
+        if options['max_emails'] is not None:
+            self.max_emails = options['max_emails']
+        elif options['worker'] or options['drain'] or options['time_budget'] is not None:
+            self.max_emails = None
+        else:
+            self.max_emails = 1
+        try:
+            if options['worker']:
+                if options['resume']:
+                    self.release_batches()
+                while self.within_budget() and (self.send_batch() or self.start_next_email(batches=True)):
+                    pass
+            else:
+                if options['resume']:
+                    self.resume_sends()
+                while True:
+                    tracker = self.reclaim_send() or self.start_next_email()
+                    if not tracker:
+                        break
+                    self.send_tracker(tracker)
+        finally:
+            if self.mailer:
+                self.mailer.close()
+        if options['verbosity'] >= 2:
+            self.write_summary()
+
+    def within_budget(self):
+        return self.deadline is None or monotonic() < self.deadline
+
+    def can_start_email(self):
+        if self.max_emails is not None and self.email_count >= self.max_emails:
+            return False
+        return self.within_budget()
+
+    def write_summary(self):
+        summary = f'Sent {self.number_sent} emails'
+        peak_memory = get_peak_memory()
+        if peak_memory is not None:
+            summary = f'{summary}; peak memory {peak_memory} KB'
+        self.stdout.write(summary)
+
+    def get_next_email(self):
+        """ """
+        ''' Group subscriptions by their email model and query each model once for its highest-ranked, oldest sendable email '''
+        email_subscriptions = {}
+        ''' Subscriptions only used to manage MailChimp subscribers have no email model '''
+        subscriptions = Subscription.objects.exclude(
+            associated_model='None',
+        ).order_by(
             'sort_order',
         )
-        if subscriptions:
-            for subscription in subscriptions:
-                email_instance = subscription.get_email_class().objects.filter(
-                    sendable=True,
-                ).filter(
-                    subscription_list=subscription,
-                ).order_by(
-                    'updated',
-                ).first()
-                if email_instance:
-                    break
-            if email_instance:
-                ''' Make unavailable to other instances of the function '''
+        for subscription in subscriptions:
+            email_subscriptions.setdefault(subscription.associated_model, []).append(subscription)
+        next_email = None
+        for subscriptions in email_subscriptions.values():
+            email_instance = subscriptions[0].get_email_class().objects.filter(
+                sendable=True,
+                subscription_list__in=subscriptions,
+            ).select_related(
+                'subscription_list',
+            ).order_by(
+                'subscription_list__sort_order',
+                'updated',
+            ).first()
+            if email_instance and (not next_email or email_instance.subscription_list.sort_order < next_email.subscription_list.sort_order):
+                next_email = email_instance
+        return next_email
+
+    def get_send_context(self):
+        if self.send_context is None:
+            self.send_context = SendContext()
+        return self.send_context
+
+    def get_mailer(self, tracker):
+        ''' Spooled sends write each message to disk for deliver_spool instead of opening a mail connection '''
+        if self.spool:
+            return SpoolMailer(self.spool, tracker.pk)
+        ''' Open one mail connection for the whole run, or one per worker thread '''
+        if self.mailer is None:
+            if self.workers > 1:
+                self.mailer = ThreadedMailer(self.workers, rate_limiter=self.rate_limiter)
+            else:
+                self.mailer = BulkMailer(rate_limiter=self.rate_limiter)
+        return self.mailer
+
+    def get_email_send(self, tracker):
+        if tracker.pk not in self.email_sends:
+            self.email_sends[tracker.pk] = EmailSend(tracker, self.get_send_context())
+        return self.email_sends[tracker.pk]
+
+    def claim_next_email(self):
+        while True:
+            email_instance = self.get_next_email()
+            if not email_instance:
+                return None
+            ''' Make unavailable to other instances of the function, unless another instance got there first '''
+            claimed = type(email_instance).objects.filter(
+                pk=email_instance.pk,
+                sendable=True,
+            ).update(
+                sendable=False,
+            )
+            if claimed:
                 email_instance.sendable = False
-                email_instance.save()
-                ''' Create tracker '''
-                tracker = EmailTracker.objects.create(
-                    subject=email_instance.email_subject(),
-                    subscription_name=email_instance.subscription_list.list_name,
+                return email_instance
+
+    def start_next_email(self, batches=False):
+        if not self.can_start_email():
+            return None
+        with transaction.atomic():
+            email_instance = self.claim_next_email()
+            if not email_instance:
+                return None
+            ''' Create tracker '''
+            tracker = EmailTracker.objects.create(
+                subject=email_instance.email_subject(),
+                subscription_name=email_instance.subscription_list.list_name,
+                subscription=email_instance.subscription_list,
+                email_pk=email_instance.pk,
+                sending=True,
+                claimed_by=self.worker_token,
+                lease_expires=get_lease_expiry(),
+            )
+            ''' Snapshot the recipients so each open can be recorded as one bit '''
+            open_bitmap = OpenBitmap(
+                tracker=tracker,
+                first_month=get_month_number(timezone.now()),
+            )
+            ''' Keys are streamed from the list's index in order, the way recipients are read, and encoded as they arrive '''
+            open_bitmap.set_recipients(
+                get_recipients(
+                    tracker.subscription,
+                ).order_by(
+                    'subscriber_id',
+                ).values_list(
+                    'subscriber_id',
+                    flat=True,
+                ).iterator()
+            )
+            open_bitmap.save()
+            if batches:
+                batch_count = self.create_batches(tracker, open_bitmap.iterate_recipient_pks())
+        self.email_count += 1
+        self.email_sends[tracker.pk] = EmailSend(tracker, self.get_send_context(), email_instance)
+        if batches and not batch_count:
+            self.finish(tracker)
+        return tracker
+
+    def create_batches(self, tracker, subscriber_pks):
+        ''' Split the snapshot of subscribers into ranges of primary keys for workers to claim, reading it through once '''
+        shard_size = get_shard_size()
+        batches = []
+        for index, subscriber_pk in enumerate(subscriber_pks):
+            if index % shard_size == 0:
+                batches.append(
+                    SendBatch(
+                        tracker=tracker,
+                        first_subscriber_pk=subscriber_pk,
+                    )
+                )
+            batches[-1].last_subscriber_pk = subscriber_pk
+        SendBatch.objects.bulk_create(batches)
+        return len(batches)
+
+    def has_email(self, tracker):
+        """ """
+        ''' An email can be deleted while its send is interrupted, and the send is then ended where it stopped instead of being resumed '''
+        try:
+            self.get_email_send(tracker)
+        except ObjectDoesNotExist:
+            self.abandon(tracker)
+            return False
+        return True
+
+    def abandon(self, tracker):
+        abandoned = EmailTracker.objects.filter(
+            pk=tracker.pk,
+            sending=True,
+        ).update(
+            sending=False,
+            send_complete=timezone.now(),
+        )
+        SendBatch.objects.filter(
+            tracker=tracker,
+        ).exclude(
+            status=SendBatch.DONE,
+        ).update(
+            status=SendBatch.DONE,
+        )
+        if abandoned and self.verbosity >= 1:
+            self.stderr.write(f'Stopped sending "{tracker.subject}" after {tracker.number_sent} emails because the email was deleted')
+
+    def send_tracker(self, tracker):
+        if not self.has_email(tracker):
+            return
+        subscriber_list = get_recipients(tracker.subscription)
+        try:
+            self.send_to_subscribers(
+                tracker,
+                subscriber_list,
+                after=(tracker.checkpoint_domain, tracker.checkpoint_pk),
+            )
+        except (LeaseLost, OutOfTime):
+            return
+        self.finish(tracker)
+
+    def reclaim_send(self, force=False):
+        """ """
+        ''' Sends split into batches are resumed by workers instead '''
+        if not force and not self.can_start_email():
+            return None
+        tracker_pks = EmailTracker.objects.filter(
+            sending=True,
+            batches__isnull=True,
+        ).order_by(
+            'pk',
+        ).values_list(
+            'pk',
+            flat=True,
+        )
+        for tracker_pk in tracker_pks:
+            if claim_tracker(tracker_pk, self.worker_token, force=force):
+                self.email_count += 1
+                return EmailTracker.objects.get(
+                    pk=tracker_pk,
                 )
-                ''' Create email '''
-                email_directory = subscription.email_directory
-                basic_template = f'{get_universal_email_directory()}/bulk_email_send.html'
-                text_template = f'{email_directory}/email_template_text.txt'
-                html_template = f'{email_directory}/email_template_html.html'
-                site_domain = Site.objects.get_current().domain
-                site_profile = SiteProfile.objects.filter(
-                    domain=site_domain,
-                ).first()
-                protocol_domain = site_profile.protocol_domain()
-                email_content = {
-                    'basic_template': basic_template,
-                    'protocol_domain': protocol_domain,
-                    'email_instance': email_instance,
-                }
-                ''' Get subscribers '''
-                subscriber_list = Subscriber.objects.filter(
-                    subscriptions=subscription,
+        return None
+
+    def resume_sends(self):
+        while self.within_budget():
+            tracker = self.reclaim_send(force=True)
+            if not tracker:
+                break
+            self.send_tracker(tracker)
+
+    def release_batches(self):
+        SendBatch.objects.filter(
+            status=SendBatch.CLAIMED,
+        ).update(
+            status=SendBatch.PENDING,
+            claimed_by='',
+            claimed_at=None,
+        )
+
+    def send_batch(self):
+        batch = claim_batch(self.worker_token)
+        if not batch:
+            return False
+        tracker = batch.tracker
+        if not self.has_email(tracker):
+            return True
+        subscriber_list = get_recipients(tracker.subscription).filter(
+            subscriber__gte=batch.first_subscriber_pk,
+            subscriber__lte=batch.last_subscriber_pk,
+        )
+        try:
+            self.send_to_subscribers(
+                tracker,
+                subscriber_list,
+                after=(batch.checkpoint_domain, batch.checkpoint_pk),
+                batch=batch,
+            )
+        except (LeaseLost, OutOfTime):
+            return True
+        done = SendBatch.objects.filter(
+            pk=batch.pk,
+            claimed_by=self.worker_token,
+        ).update(
+            status=SendBatch.DONE,
+        )
+        if not done:
+            return True
+        ''' Whichever worker completes the last batch finishes the send '''
+        if not tracker.batches.exclude(status=SendBatch.DONE).exists():
+            self.finish(tracker)
+        return True
+
+    def send_to_subscribers(self, tracker, subscriber_list, after, batch=None):
+        email_send = self.get_email_send(tracker)
+        mailer = self.get_mailer(tracker)
+        connection_count = mailer.connection_count
+        timer = PhaseTimer()
+        with timer.time('query'):
+            recipient_count = count_recipients(subscriber_list, after=after)
+        send_run = SendRun.objects.create(
+            tracker=tracker,
+            batch=batch,
+            worker=self.worker_token,
+            recipient_count=recipient_count,
+        )
+        recipients = iterate_recipients(subscriber_list, after=after)
+        lease = SendLease(self.worker_token, tracker, batch)
+        lease.start()
+        out_of_time = False
+        try:
+            try:
+                while True:
+                    with timer.time('query'):
+                        subscriber = next(recipients, None)
+                    if subscriber is None:
+                        break
+                    with timer.time('render'):
+                        message = email_send.create_message(subscriber)
+                    ''' Queue email for sending in batches, marked with the recipient's position in the send '''
+                    with timer.time('deliver'):
+                        mailer.add(
+                            message,
+                            marker=subscriber,
+                        )
+                    self.save_checkpoint(tracker, mailer, send_run, timer, lease)
+            except OutOfTime:
+                ''' Stop queueing once the time budget is spent, but deliver and checkpoint what is already queued '''
+                out_of_time = True
+            ''' Batches delivered before one that failed are still checkpointed '''
+            try:
+                with timer.time('deliver'):
+                    mailer.join()
+            finally:
+                try:
+                    self.save_checkpoint(tracker, mailer, send_run, timer, lease)
+                except OutOfTime:
+                    pass
+        except LeaseLost:
+            ''' Another process has taken the send over and continues it from the last checkpoint, so messages not yet delivered are dropped '''
+            mailer.discard()
+            raise
+        finally:
+            lease.stop()
+        self.update_run(
+            send_run,
+            timer,
+            finished=timezone.now(),
+        )
+        EmailTracker.objects.filter(
+            pk=tracker.pk,
+        ).update(
+            connection_count=F('connection_count') + mailer.connection_count - connection_count,
+        )
+        if out_of_time:
+            lease.release()
+            raise OutOfTime()
+
+    def update_run(self, send_run, timer, **kwargs):
+        """ """
+        ''' Add the time spent in each phase since the run was last updated '''
+        for phase, seconds in timer.pop().items():
+            kwargs[f'{phase}_seconds'] = F(f'{phase}_seconds') + seconds
+        SendRun.objects.filter(
+            pk=send_run.pk,
+        ).update(
+            updated=timezone.now(),
+            **kwargs,
+        )
+
+    def save_checkpoint(self, tracker, mailer, send_run, timer, lease):
+        """ """
+        ''' Record the last subscriber of each delivered batch so an interrupted send can continue after it, then stop if the time budget is spent '''
+        lease.check()
+        checkpoint = mailer.checkpoint()
+        if not checkpoint:
+            return
+        recipient, number_sent, failures = checkpoint
+        with transaction.atomic():
+            ''' Only the process holding the lease saves progress, renewing the lease with it '''
+            if not lease.renew(
+                checkpoint_pk=recipient.pk,
+                checkpoint_domain=recipient.email_domain,
+                number_sent=F('number_sent') + number_sent,
+            ):
+                raise LeaseLost()
+            ''' Keep failed recipients for retry_failed_deliveries '''
+            record_failures(tracker, [(failed.pk, error) for failed, error in failures])
+            self.update_run(
+                send_run,
+                timer,
+                number_sent=F('number_sent') + number_sent,
+                number_failed=F('number_failed') + len(failures),
+            )
+            if lease.batch:
+                EmailTracker.objects.filter(
+                    pk=tracker.pk,
+                ).update(
+                    number_sent=F('number_sent') + number_sent,
                 )
-                ''' Set number_sent at 0 '''
-                number_sent = 0
-                for subscriber in subscriber_list:
-                    ''' Get subscriber-specific information '''
-                    tracking_image = reverse(
-                        'django_simple_bulk_emailer:opened_email',
-                        kwargs={
-                            'pk': tracker.pk,
-                            'subscriber_key': subscriber.subscriber_key,
-                        },
-                    )
-                    email_content['tracking_image'] = tracking_image
-                    to_address = f'"{subscriber.first_name} {subscriber.last_name}" <{subscriber.subscriber_email}>'
-                    ''' Send email '''
-                    send_email(
-                        email_content,
-                        list_slug=subscription.list_slug,
-                        subscriber_key=subscriber.subscriber_key,
-                        text_template=text_template,
-                        html_template=html_template,
-                        subject=email_instance.email_subject(),
-                        to_address=to_address,
-                    )
-                    ''' Increase number_sent by 1 '''
-                    number_sent += 1
-                ''' Create send history '''
-                send_complete = timezone.now()
-                email_instance.send_history = f'<ul>' \
-                                              f'<li>Completed: {localize(timezone.localtime(send_complete))}' \
-                                              f'<ul>' \
-                                              f'<li>Sent to: {email_instance.subscription_list}</li>' \
-                                              f'</ul>' \
-                                              f'</li>' \
-                                              f'</ul>' \
-                                              f'{email_instance.send_history}'
-                ''' Release email to be sent again '''
-                email_instance.sending = False
-                email_instance.save()
-                ''' Update tracker '''
-                tracker.send_complete = send_complete
-                tracker.number_sent = number_sent
-                tracker.save()
+        self.number_sent += number_sent
+        if not self.within_budget():
+            raise OutOfTime()
+
+    def finish(self, tracker):
+        send_complete = timezone.now()
+        ''' Only one worker can mark the tracker finished '''
+        finished = EmailTracker.objects.filter(
+            pk=tracker.pk,
+            sending=True,
+        ).update(
+            sending=False,
+            send_complete=send_complete,
+        )
+        if not finished:
+            return
+        email_instance = self.get_email_send(tracker).email_instance
+        try:
+            email_instance.refresh_from_db()
+        except ObjectDoesNotExist:
+            return
+        ''' Create send history '''
+        SendRecord.objects.create(
+            email_model=email_instance.email_model(),
+            email_pk=email_instance.pk,
+            tracker=tracker,
+            completed=send_complete,
+            subscription_name=str(email_instance.subscription_list),
+            number_sent=EmailTracker.objects.get(
+                pk=tracker.pk,
+            ).number_sent,
+            number_failed=tracker.failed_deliveries.count(),
+        )
+        ''' Release email to be sent again '''
+        email_instance.sending = False
+        email_instance.save()
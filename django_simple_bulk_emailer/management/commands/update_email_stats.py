@@ -12,6 +12,15 @@ from django.utils import (
 from ...models import (
     EmailTracker,
     MonthlyStat,
+    OpenerSketch,
+)
+from ...sketches import (
+    empty_sketch,
+    estimate_sketch,
+    merge_sketches,
+)
+from ...tracking import (
+    fold_open_events,
 )
 
 
@@ -28,6 +37,8 @@ class Command(BaseCommand):
             tracking_months = settings.EMAILER_TRACKING_MONTHS
         except AttributeError:
             tracking_months = 3
+        ''' Move opens into each send's bitmap before counting them '''
+        fold_open_events()
         for tracker in EmailTracker.objects.all():
             ''' Find and delete outdated trackers '''
             deletion_datetime_months = tracker.send_complete.year * 12 + tracker.send_complete.month + tracking_months
@@ -38,17 +49,12 @@ class Command(BaseCommand):
                 ''' Find and attach any appropriate unattached trackers as current or older '''
                 if tracker not in monthly_stat.current_trackers.all() \
                         and tracker not in monthly_stat.older_trackers.all() \
-                        and tracker.json_data:
-                    for key, value in tracker.json_data.items():
-                        year = value[0]
-                        month = value[1]
-                        if year == current_datetime.year and month == current_datetime.month:
-                            if current_datetime.year == tracker.send_complete.year \
-                                    and current_datetime.month == tracker.send_complete.month:
-                                monthly_stat.current_trackers.add(tracker)
-                            else:
-                                monthly_stat.older_trackers.add(tracker)
-                            break
+                        and tracker.month_open_count(current_datetime.year, current_datetime.month):
+                    if current_datetime.year == tracker.send_complete.year \
+                            and current_datetime.month == tracker.send_complete.month:
+                        monthly_stat.current_trackers.add(tracker)
+                    else:
+                        monthly_stat.older_trackers.add(tracker)
         ''' Create sorted list of subscription names '''
         subscription_names = []
         month_trackers = monthly_stat.current_trackers.all()
@@ -83,20 +89,14 @@ class Command(BaseCommand):
             stat_dict = {}
             for tracker in subscription_trackers:
                 ''' Calculate tracker's opened number for current month '''
-                if tracker.json_data:
-                    opens = 0
-                    for key, value in tracker.json_data.items():
-                        year = value[0]
-                        month = value[1]
-                        if year == current_datetime.year and month == current_datetime.month:
-                            opens += 1
-                        ''' Create a list of stat data and add to stat dictionary '''
-                        stat_dict[tracker.pk] = [
-                            opens,
-                            tracker.number_sent,
-                            tracker.subject,
-                            tracker.send_complete_string(),
-                        ]
+                opens = tracker.month_open_count(current_datetime.year, current_datetime.month)
+                ''' Create a list of stat data and add to stat dictionary '''
+                stat_dict[tracker.pk] = [
+                    opens,
+                    tracker.number_sent,
+                    tracker.subject,
+                    tracker.send_complete_string(),
+                ]
             ''' Sort stat dictionary '''
             sorted_by_value = sorted(stat_dict.items(), key=lambda kv: kv[1], reverse=True)
             if sorted_by_value:
@@ -144,4 +144,41 @@ class Command(BaseCommand):
                 f'<td id="emailer_numerical">{total_opens}<br><br></td>' \
                 f'<td id="emailer_numerical">{total_percentage}<br><br></td>' \
                 f'</tr>'
+        ''' Merge sketches to estimate each list's unique openers this month and over all tracked months '''
+        month_sketches = {}
+        tracked_sketches = {}
+        opener_sketches = OpenerSketch.objects.values_list(
+            'tracker__subscription_name',
+            'year_int',
+            'month_int',
+            'registers',
+        )
+        for name, year_int, month_int, registers in opener_sketches.iterator():
+            tracked_sketches[name] = merge_sketches(tracked_sketches.get(name, empty_sketch()), registers)
+            if year_int == current_datetime.year and month_int == current_datetime.month:
+                month_sketches[name] = merge_sketches(month_sketches.get(name, empty_sketch()), registers)
+        monthly_stat.opener_data = ''
+        if tracked_sketches:
+            monthly_stat.opener_data = \
+                f'<tr id="emailer_title_row">' \
+                f'<td>&nbsp;</td>' \
+                f'<td>Unique openers (estimated)</td>' \
+                f'<td id="emailer_numerical">This month</td>' \
+                f'<td id="emailer_numerical">All tracked months</td>' \
+                f'</tr>'
+        for row_number, name in enumerate(sorted(tracked_sketches), 1):
+            if row_number & 1:
+                row_id = 'emailer_row_odd'
+            else:
+                row_id = 'emailer_row_even'
+            month_openers = estimate_sketch(month_sketches.get(name, empty_sketch()))
+            tracked_openers = estimate_sketch(tracked_sketches[name])
+            monthly_stat.opener_data = \
+                f'{monthly_stat.opener_data}' \
+                f'<tr id="{row_id}">' \
+                f'<td id="emailer_numerical">{row_number}.</td>' \
+                f'<td>{name}</td>' \
+                f'<td id="emailer_numerical">{month_openers:,}</td>' \
+                f'<td id="emailer_numerical">{tracked_openers:,}</td>' \
+                f'</tr>'
         monthly_stat.save()
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0004_bulkemail_update_datetime'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailtracker',
+            name='connection_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='mail connections opened'),
+        ),
+    ]
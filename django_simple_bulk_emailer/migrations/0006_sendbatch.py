@@ -0,0 +1,46 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0005_emailtracker_connection_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailtracker',
+            name='email_pk',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='emailtracker',
+            name='sending',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='emailtracker',
+            name='subscription',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='django_simple_bulk_emailer.subscription'),
+        ),
+        migrations.CreateModel(
+            name='SendBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='last updated')),
+                ('first_subscriber_pk', models.PositiveBigIntegerField()),
+                ('last_subscriber_pk', models.PositiveBigIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('claimed', 'Claimed'), ('done', 'Done')], default='pending', max_length=255)),
+                ('claimed_by', models.CharField(blank=True, max_length=255)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('number_sent', models.PositiveIntegerField(default=0)),
+                ('tracker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='django_simple_bulk_emailer.emailtracker')),
+            ],
+            options={
+                'verbose_name_plural': 'send batches',
+                'ordering': ['pk'],
+            },
+        ),
+    ]
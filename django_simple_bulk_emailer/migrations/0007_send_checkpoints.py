@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0006_sendbatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailtracker',
+            name='checkpoint_pk',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sendbatch',
+            name='checkpoint_pk',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
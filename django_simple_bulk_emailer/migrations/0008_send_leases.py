@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0007_send_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailtracker',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='emailtracker',
+            name='lease_expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0008_send_leases'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bulkemail',
+            index=models.Index(fields=['sendable', 'subscription_list', 'updated'], name='bulkemail_sendable_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0009_bulkemail_sendable_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FailedDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='last updated')),
+                ('status', models.CharField(choices=[('retrying', 'Retrying'), ('dead', 'Dead letter')], default='retrying', max_length=255)),
+                ('error_class', models.CharField(max_length=255)),
+                ('error_message', models.TextField(blank=True)),
+                ('attempts', models.PositiveIntegerField(default=1)),
+                ('next_attempt', models.DateTimeField(blank=True, null=True)),
+                ('subscriber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='django_simple_bulk_emailer.subscriber')),
+                ('tracker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='failed_deliveries', to='django_simple_bulk_emailer.emailtracker')),
+            ],
+            options={
+                'verbose_name_plural': 'failed deliveries',
+                'ordering': ['next_attempt'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='faileddelivery',
+            constraint=models.UniqueConstraint(fields=('tracker', 'subscriber'), name='unique_failed_delivery'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0010_faileddelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailtracker',
+            name='checkpoint_domain',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='sendbatch',
+            name='checkpoint_domain',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
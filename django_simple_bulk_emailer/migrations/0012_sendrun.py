@@ -0,0 +1,33 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0011_checkpoint_domain'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SendRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='last updated')),
+                ('worker', models.CharField(blank=True, max_length=255)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('recipient_count', models.PositiveIntegerField(default=0, verbose_name='recipients')),
+                ('number_sent', models.PositiveIntegerField(default=0)),
+                ('number_failed', models.PositiveIntegerField(default=0)),
+                ('query_seconds', models.FloatField(default=0, verbose_name='seconds querying recipients')),
+                ('render_seconds', models.FloatField(default=0, verbose_name='seconds rendering messages')),
+                ('deliver_seconds', models.FloatField(default=0, verbose_name='seconds delivering messages')),
+                ('batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='runs', to='django_simple_bulk_emailer.sendbatch')),
+                ('tracker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='django_simple_bulk_emailer.emailtracker')),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
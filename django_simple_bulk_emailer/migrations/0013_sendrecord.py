@@ -0,0 +1,67 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_send_history(apps, schema_editor):
+    """ """
+    ''' Keep each email's existing history as one record, dated when the email was last saved '''
+    BulkEmail = apps.get_model('django_simple_bulk_emailer', 'BulkEmail')
+    SendRecord = apps.get_model('django_simple_bulk_emailer', 'SendRecord')
+    send_records = []
+    emails = BulkEmail.objects.exclude(
+        send_history='',
+    ).select_related(
+        'subscription_list',
+    )
+    for email in emails:
+        if email.subscription_list:
+            email_model = email.subscription_list.associated_model
+        else:
+            email_model = 'django_simple_bulk_emailer.models.BulkEmail'
+        send_records.append(
+            SendRecord(
+                email_model=email_model,
+                email_pk=email.pk,
+                completed=email.updated,
+                legacy_history=email.send_history,
+            )
+        )
+    SendRecord.objects.bulk_create(send_records)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0012_sendrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SendRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='last updated')),
+                ('email_model', models.CharField(max_length=255)),
+                ('email_pk', models.PositiveBigIntegerField()),
+                ('completed', models.DateTimeField()),
+                ('subscription_name', models.CharField(blank=True, max_length=255)),
+                ('number_sent', models.PositiveIntegerField(default=0)),
+                ('number_failed', models.PositiveIntegerField(default=0)),
+                ('legacy_history', models.TextField(blank=True)),
+                ('tracker', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='send_records', to='django_simple_bulk_emailer.emailtracker')),
+            ],
+            options={
+                'ordering': ['-completed'],
+                'indexes': [models.Index(fields=['email_model', 'email_pk'], name='sendrecord_email_idx')],
+            },
+        ),
+        migrations.RunPython(
+            move_send_history,
+            migrations.RunPython.noop,
+        ),
+        migrations.RemoveField(
+            model_name='bulkemail',
+            name='send_history',
+        ),
+    ]
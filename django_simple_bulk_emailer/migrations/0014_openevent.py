@@ -0,0 +1,64 @@
+from datetime import (
+    datetime,
+    timezone,
+)
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def move_open_data(apps, schema_editor):
+    """ """
+    ''' Trackers only kept the year and month of each first open, so opens are dated at the start of their month '''
+    EmailTracker = apps.get_model('django_simple_bulk_emailer', 'EmailTracker')
+    OpenEvent = apps.get_model('django_simple_bulk_emailer', 'OpenEvent')
+    for tracker in EmailTracker.objects.exclude(json_data=None).iterator():
+        OpenEvent.objects.bulk_create(
+            [
+                OpenEvent(
+                    tracker=tracker,
+                    subscriber_key=subscriber_key,
+                    opened=datetime(value[0], value[1], 1, tzinfo=timezone.utc),
+                )
+                for subscriber_key, value in tracker.json_data.items()
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0013_sendrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpenEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='last updated')),
+                ('subscriber_key', models.CharField(max_length=255)),
+                ('opened', models.DateTimeField(default=django.utils.timezone.now)),
+                ('tracker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='open_events', to='django_simple_bulk_emailer.emailtracker')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tracker', 'opened'], name='openevent_opened_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='openevent',
+            constraint=models.UniqueConstraint(fields=('tracker', 'subscriber_key'), name='unique_open_event'),
+        ),
+        migrations.RunPython(
+            move_open_data,
+            migrations.RunPython.noop,
+        ),
+        migrations.RemoveField(
+            model_name='emailtracker',
+            name='json_data',
+        ),
+    ]
@@ -0,0 +1,28 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0014_openevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpenBitmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='last updated')),
+                ('recipients', models.BinaryField(default=b'')),
+                ('opens', models.BinaryField(default=b'')),
+                ('first_month', models.PositiveIntegerField()),
+                ('month_counts', models.BinaryField(default=b'')),
+                ('tracker', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='open_bitmap', to='django_simple_bulk_emailer.emailtracker')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
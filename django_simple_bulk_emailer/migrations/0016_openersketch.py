@@ -0,0 +1,34 @@
+import django.db.models.deletion
+import django_simple_bulk_emailer.sketches
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0015_openbitmap'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthlystat',
+            name='opener_data',
+            field=models.TextField(blank=True),
+        ),
+        migrations.CreateModel(
+            name='OpenerSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='last updated')),
+                ('year_int', models.PositiveIntegerField()),
+                ('month_int', models.PositiveIntegerField()),
+                ('registers', models.BinaryField(default=django_simple_bulk_emailer.sketches.empty_sketch)),
+                ('tracker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='opener_sketches', to='django_simple_bulk_emailer.emailtracker')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='openersketch',
+            constraint=models.UniqueConstraint(fields=('tracker', 'year_int', 'month_int'), name='unique_opener_sketch'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0016_openersketch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bulkemail',
+            index=models.Index(fields=['subscription_list', 'published', 'publication_date', 'created'], name='bulkemail_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bulkemail',
+            index=models.Index(fields=['deletion_date'], name='bulkemail_deletion_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailtracker',
+            index=models.Index(condition=models.Q(('sending', True)), fields=['id'], name='emailtracker_sending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(fields=['subscriber_key'], name='subscriber_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(condition=models.Q(('mc_synced', False)), fields=['mc_synced'], name='subscriber_mc_synced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['list_slug'], name='subscription_slug_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import Lower, StrIndex, Substr
+
+
+def fill_email_domains(apps, schema_editor):
+    """ """
+    ''' Existing subscribers get the domain the send command used to work out from each address '''
+    Subscriber = apps.get_model('django_simple_bulk_emailer', 'Subscriber')
+    Subscriber.objects.update(
+        email_domain=Lower(
+            Substr(
+                'subscriber_email',
+                StrIndex('subscriber_email', Value('@')) + 1,
+            ),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0017_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriber',
+            name='email_domain',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(
+            fill_email_domains,
+            migrations.RunPython.noop,
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(fields=['email_domain', 'id'], name='subscriber_domain_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from array import array
+from itertools import chain
+from operator import sub
+import sys
+import zlib
+
+from django.db import migrations
+
+
+def compress_recipients(apps, schema_editor):
+    """ """
+    ''' Snapshots saved as plain primary keys are stored again as compressed gaps between them '''
+    OpenBitmap = apps.get_model('django_simple_bulk_emailer', 'OpenBitmap')
+    for open_bitmap in OpenBitmap.objects.only('recipients').iterator():
+        recipient_pks = array('Q', bytes(open_bitmap.recipients))
+        if sys.byteorder == 'big':
+            recipient_pks.byteswap()
+        gaps = array('Q', map(sub, recipient_pks, chain([0], recipient_pks)))
+        if sys.byteorder == 'big':
+            gaps.byteswap()
+        OpenBitmap.objects.filter(
+            pk=open_bitmap.pk,
+        ).update(
+            recipients=zlib.compress(gaps.tobytes()),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0018_subscriber_email_domain'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            compress_recipients,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,81 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_membership_domains(apps, schema_editor):
+    """ """
+    ''' Existing memberships get the domain already stored on each subscriber '''
+    Membership = apps.get_model('django_simple_bulk_emailer', 'Membership')
+    Subscriber = apps.get_model('django_simple_bulk_emailer', 'Subscriber')
+    Membership.objects.update(
+        email_domain=Subquery(
+            Subscriber.objects.filter(
+                pk=OuterRef('subscriber'),
+            ).values(
+                'email_domain',
+            )[:1],
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_simple_bulk_emailer', '0019_openbitmap_recipient_gaps'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Membership',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('subscriber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='django_simple_bulk_emailer.subscriber')),
+                        ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='django_simple_bulk_emailer.subscription')),
+                    ],
+                    options={
+                        'db_table': 'django_simple_bulk_emailer_subscriber_subscriptions',
+                        'unique_together': {('subscriber', 'subscription')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='subscriber',
+                    name='subscriptions',
+                    field=models.ManyToManyField(blank=True, through='django_simple_bulk_emailer.Membership', to='django_simple_bulk_emailer.subscription'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='email_domain',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(
+            fill_membership_domains,
+            migrations.RunPython.noop,
+        ),
+        migrations.AlterField(
+            model_name='membership',
+            name='id',
+            field=models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID'),
+        ),
+        migrations.AlterField(
+            model_name='membership',
+            name='subscription',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='django_simple_bulk_emailer.subscription'),
+        ),
+        migrations.AddIndex(
+            model_name='membership',
+            index=models.Index(fields=['subscription', 'subscriber'], name='membership_subscriber_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='membership',
+            index=models.Index(fields=['subscription', 'email_domain', 'subscriber'], name='membership_domain_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='subscriber',
+            name='subscriber_domain_idx',
+        ),
+    ]
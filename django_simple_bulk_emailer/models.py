@@ -1,10 +1,21 @@
+from array import (
+    array,
+)
+from bisect import (
+    bisect_left,
+)
 import calendar
 from datetime import (
+    datetime,
     timedelta,
+    timezone as dt_timezone,
 )
 from importlib import (
     import_module,
 )
+import re
+import sys
+import zlib
 
 
 from django.conf import (
@@ -48,6 +59,12 @@ from django_simple_file_handler.models import (
 )
 
 
+from .sketches import (
+    empty_sketch,
+    estimate_sketch,
+)
+
+
 class BaseMixin(models.Model):
     created = models.DateTimeField(
         auto_now_add=True,
@@ -74,6 +91,21 @@ class SiteProfile(BaseMixin, Site):
         return f'{self.protocol}{self.domain}'
 
 
+email_class_registry = {}
+
+
+def import_email_class(associated_model):
+    split_path = associated_model.rsplit('.', 1)
+    module_path = split_path[0]
+    class_name = split_path[-1]
+    module = import_module(module_path)
+    return getattr(module, class_name)
+
+
+def clear_email_class_registry():
+    email_class_registry.clear()
+
+
 def create_default_key():
     return get_random_string(20)
 
@@ -146,11 +178,11 @@ class Subscription(BaseMixin):
         return self.list_name
 
     def get_email_class(self):
-        split_path = self.associated_model.rsplit('.', 1)
-        module_path = split_path[0]
-        class_name = split_path[-1]
-        module = import_module(module_path)
-        return getattr(module, class_name)
+        """ """
+        ''' Import each associated model once per process; saving a subscription clears the registry '''
+        if self.associated_model not in email_class_registry:
+            email_class_registry[self.associated_model] = import_email_class(self.associated_model)
+        return email_class_registry[self.associated_model]
 
     def list_link(self):
         if self.publicly_visible and self.use_pages:
@@ -183,6 +215,14 @@ class Subscription(BaseMixin):
         ordering = [
             'sort_order',
         ]
+        indexes = [
+            models.Index(
+                fields=[
+                    'list_slug',
+                ],
+                name='subscription_slug_idx',
+            ),
+        ]
 
 
 class Subscriber(BaseMixin):
@@ -204,9 +244,15 @@ class Subscriber(BaseMixin):
         'email address',
         unique=True,
     )
+    email_domain = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+    )
     subscriptions = models.ManyToManyField(
         Subscription,
         blank=True,
+        through='Membership',
     )
     mc_email = models.EmailField(
         'MailChimp email address',
@@ -225,6 +271,74 @@ class Subscriber(BaseMixin):
         )
         return ''.join(f'{subscription_item}, ' for subscription_item in subscription_set)[:-2]
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=[
+                    'subscriber_key',
+                ],
+                name='subscriber_key_idx',
+            ),
+            models.Index(
+                fields=[
+                    'mc_synced',
+                ],
+                condition=models.Q(
+                    mc_synced=False,
+                ),
+                name='subscriber_mc_synced_idx',
+            ),
+        ]
+
+
+class Membership(models.Model):
+    def __init__(self, *args, **kwargs):
+        """ """
+        ''' Each subscriber's domain is copied onto their memberships, so a list's members can be read in domain order from an index '''
+        super().__init__(*args, **kwargs)
+
+    subscriber = models.ForeignKey(
+        Subscriber,
+        on_delete=models.CASCADE,
+    )
+    subscription = models.ForeignKey(
+        Subscription,
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    email_domain = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+    )
+
+    class Meta:
+        ''' The table is the one created for the subscriptions field before it had a model, and both indexes lead with the list '''
+        db_table = 'django_simple_bulk_emailer_subscriber_subscriptions'
+        unique_together = [
+            [
+                'subscriber',
+                'subscription',
+            ],
+        ]
+        indexes = [
+            models.Index(
+                fields=[
+                    'subscription',
+                    'subscriber',
+                ],
+                name='membership_subscriber_idx',
+            ),
+            models.Index(
+                fields=[
+                    'subscription',
+                    'email_domain',
+                    'subscriber',
+                ],
+                name='membership_domain_idx',
+            ),
+        ]
+
 
 def get_deletion_date():
     try:
@@ -281,9 +395,19 @@ class BulkEmail(BaseMixin):
     sent = models.BooleanField(
         default=False,
     )
-    send_history = models.TextField(
-        blank=True,
-    )
+    ''' Set while sending so domain lookups come from the run's shared context '''
+    send_context = None
+
+    def email_model(self):
+        return f'{self.__class__.__module__}.{self.__class__.__name__}'
+
+    def send_records(self):
+        """ """
+        ''' Send history is only queried where it is shown '''
+        return SendRecord.objects.filter(
+            email_model=self.email_model(),
+            email_pk=self.pk,
+        )
 
     def short_headline(self):
         if len(self.headline) > 30:
@@ -401,6 +525,8 @@ class BulkEmail(BaseMixin):
     email_preview.short_description = 'preview'
 
     def protocol_domain(self):
+        if self.send_context:
+            return self.send_context.protocol_domain
         site = Site.objects.get(
             id=settings.SITE_ID,
         )
@@ -410,12 +536,16 @@ class BulkEmail(BaseMixin):
         return site_profile.protocol_domain()
 
     def static_domain(self):
+        if self.send_context:
+            return self.send_context.static_domain
         if any(protocol in settings.STATIC_URL for protocol in ['http://', 'https://']):
             return ''
         else:
             return self.protocol_domain()
 
     def media_domain(self):
+        if self.send_context:
+            return self.send_context.media_domain
         if any(protocol in settings.MEDIA_URL for protocol in ['http://', 'https://']):
             return ''
         else:
@@ -430,6 +560,33 @@ class BulkEmail(BaseMixin):
                 self.update_datetime = saved.update_datetime
         super().save(*args, **kwargs)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=[
+                    'sendable',
+                    'subscription_list',
+                    'updated',
+                ],
+                name='bulkemail_sendable_idx',
+            ),
+            models.Index(
+                fields=[
+                    'subscription_list',
+                    'published',
+                    'publication_date',
+                    'created',
+                ],
+                name='bulkemail_published_idx',
+            ),
+            models.Index(
+                fields=[
+                    'deletion_date',
+                ],
+                name='bulkemail_deletion_idx',
+            ),
+        ]
+
 
 class EmailImage(ProcessedImage):
     def __init__(self, *args, **kwargs):
@@ -501,7 +658,35 @@ class EmailTracker(BaseMixin):
     number_sent = models.PositiveIntegerField(
         default=0,
     )
-    json_data = models.JSONField(
+    connection_count = models.PositiveIntegerField(
+        'mail connections opened',
+        default=0,
+    )
+    subscription = models.ForeignKey(
+        Subscription,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    email_pk = models.PositiveBigIntegerField(
+        blank=True,
+        null=True,
+    )
+    sending = models.BooleanField(
+        default=False,
+    )
+    checkpoint_pk = models.PositiveBigIntegerField(
+        default=0,
+    )
+    checkpoint_domain = models.CharField(
+        max_length=255,
+        blank=True,
+    )
+    claimed_by = models.CharField(
+        max_length=255,
+        blank=True,
+    )
+    lease_expires = models.DateTimeField(
         blank=True,
         null=True,
     )
@@ -509,6 +694,567 @@ class EmailTracker(BaseMixin):
     def send_complete_string(self):
         return localize(timezone.localtime(self.send_complete))
 
+    def counted_opens(self):
+        """ """
+        ''' The recipient snapshot is only needed while opens are waiting to be folded, so it is left unread until then '''
+        return OpenBitmap.objects.defer(
+            'recipients',
+        ).filter(
+            tracker=self,
+        ).first()
+
+    def open_count(self):
+        """ """
+        ''' Opens folded into the bitmap are counted there, and any not yet folded are counted as events '''
+        open_bitmap = self.counted_opens()
+        bitmap_count = open_bitmap.open_count() if open_bitmap else 0
+        return bitmap_count + self.unfolded_count(open_bitmap, self.open_events.all())
+
+    def month_open_count(self, year, month):
+        month_start, month_end = get_month_range(year, month)
+        open_bitmap = self.counted_opens()
+        bitmap_count = open_bitmap.month_count(year, month) if open_bitmap else 0
+        return bitmap_count + self.unfolded_count(
+            open_bitmap,
+            self.open_events.filter(
+                opened__gte=month_start,
+                opened__lt=month_end,
+            ),
+        )
+
+    def unfolded_count(self, open_bitmap, open_events):
+        """ """
+        ''' An open waiting to be folded is counted only if folding it would set a bit, so a recipient who opens again after a fold is not counted twice '''
+        if not open_bitmap:
+            return open_events.count()
+        subscriber_keys = list(
+            open_events.values_list(
+                'subscriber_key',
+                flat=True,
+            )
+        )
+        if not subscriber_keys:
+            return 0
+        subscriber_pks = resolve_opener_keys(subscriber_keys)
+        new_ordinals = set()
+        unfolded_count = 0
+        for subscriber_key in subscriber_keys:
+            ordinal = None
+            if subscriber_key in subscriber_pks:
+                ordinal = open_bitmap.ordinal(subscriber_pks[subscriber_key])
+            if ordinal is None:
+                unfolded_count += 1
+            elif ordinal not in new_ordinals and not open_bitmap.is_open(ordinal):
+                new_ordinals.add(ordinal)
+                unfolded_count += 1
+        return unfolded_count
+
+    def __str__(self):
+        return self.subject
+
+    class Meta:
+        ''' Only unfinished sends are indexed, in the order they are resumed '''
+        indexes = [
+            models.Index(
+                fields=[
+                    'id',
+                ],
+                condition=models.Q(
+                    sending=True,
+                ),
+                name='emailtracker_sending_idx',
+            ),
+        ]
+
+
+class SendBatch(BaseMixin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    PENDING = 'pending'
+    CLAIMED = 'claimed'
+    DONE = 'done'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (CLAIMED, 'Claimed'),
+        (DONE, 'Done'),
+    ]
+
+    tracker = models.ForeignKey(
+        EmailTracker,
+        on_delete=models.CASCADE,
+        related_name='batches',
+    )
+    first_subscriber_pk = models.PositiveBigIntegerField(
+    )
+    last_subscriber_pk = models.PositiveBigIntegerField(
+    )
+    status = models.CharField(
+        max_length=255,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    claimed_by = models.CharField(
+        max_length=255,
+        blank=True,
+    )
+    claimed_at = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+    number_sent = models.PositiveIntegerField(
+        default=0,
+    )
+    checkpoint_pk = models.PositiveBigIntegerField(
+        default=0,
+    )
+    checkpoint_domain = models.CharField(
+        max_length=255,
+        blank=True,
+    )
+
+    class Meta:
+        ordering = [
+            'pk',
+        ]
+        verbose_name_plural = 'send batches'
+
+
+class SendRun(BaseMixin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    tracker = models.ForeignKey(
+        EmailTracker,
+        on_delete=models.CASCADE,
+        related_name='runs',
+    )
+    batch = models.ForeignKey(
+        SendBatch,
+        on_delete=models.SET_NULL,
+        related_name='runs',
+        blank=True,
+        null=True,
+    )
+    worker = models.CharField(
+        max_length=255,
+        blank=True,
+    )
+    finished = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+    recipient_count = models.PositiveIntegerField(
+        'recipients',
+        default=0,
+    )
+    number_sent = models.PositiveIntegerField(
+        default=0,
+    )
+    number_failed = models.PositiveIntegerField(
+        default=0,
+    )
+    query_seconds = models.FloatField(
+        'seconds querying recipients',
+        default=0,
+    )
+    render_seconds = models.FloatField(
+        'seconds rendering messages',
+        default=0,
+    )
+    deliver_seconds = models.FloatField(
+        'seconds delivering messages',
+        default=0,
+    )
+
+    def elapsed_seconds(self):
+        return ((self.finished or self.updated) - self.created).total_seconds()
+
+    def send_rate(self):
+        """ """
+        ''' Messages sent per second over the run so far '''
+        elapsed_seconds = self.elapsed_seconds()
+        if not elapsed_seconds:
+            return 0
+        return round(self.number_sent / elapsed_seconds, 1)
+
+    send_rate.short_description = 'messages per second'
+
+    def estimated_completion(self):
+        """ """
+        ''' Projected from the rate so far and the recipients left when progress was last saved '''
+        if self.finished:
+            return self.finished
+        remaining = self.recipient_count - self.number_sent - self.number_failed
+        send_rate = self.send_rate()
+        if remaining <= 0 or not send_rate:
+            return None
+        return self.updated + timedelta(seconds=remaining / send_rate)
+
+    def __str__(self):
+        return f'{self.tracker.subject} — {localize(timezone.localtime(self.created))}'
+
+    class Meta:
+        ordering = [
+            '-created',
+        ]
+
+
+class OpenEvent(BaseMixin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    tracker = models.ForeignKey(
+        EmailTracker,
+        on_delete=models.CASCADE,
+        related_name='open_events',
+    )
+    subscriber_key = models.CharField(
+        max_length=255,
+    )
+    opened = models.DateTimeField(
+        default=timezone.now,
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'tracker',
+                    'subscriber_key',
+                ],
+                name='unique_open_event',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=[
+                    'tracker',
+                    'opened',
+                ],
+                name='openevent_opened_idx',
+            ),
+        ]
+
+
+''' Opens by a signed token are stored under the subscriber's primary key, which no subscriber key can match '''
+OPENER_KEY_PATTERN = re.compile(r'pk-([0-9]{1,18})')
+
+
+def make_opener_key(subscriber_pk):
+    return f'pk-{subscriber_pk}'
+
+
+def read_opener_key(subscriber_key):
+    opener_key_match = OPENER_KEY_PATTERN.fullmatch(subscriber_key)
+    if opener_key_match:
+        return int(opener_key_match.group(1))
+    return None
+
+
+def resolve_opener_keys(subscriber_keys):
+    """ """
+    ''' Opens by signed tokens already carry the subscriber's primary key, and only subscriber keys are looked up '''
+    subscriber_pks = {}
+    for subscriber_key in subscriber_keys:
+        subscriber_pk = read_opener_key(subscriber_key)
+        if subscriber_pk is not None:
+            subscriber_pks[subscriber_key] = subscriber_pk
+    lookup_keys = set(subscriber_keys) - subscriber_pks.keys()
+    if lookup_keys:
+        subscriber_pks.update(
+            Subscriber.objects.filter(
+                subscriber_key__in=lookup_keys,
+            ).values_list(
+                'subscriber_key',
+                'pk',
+            )
+        )
+    return subscriber_pks
+
+
+def get_month_range(year, month):
+    """ """
+    ''' Opens are counted by calendar month in UTC, as they always have been '''
+    month_start = datetime(year, month, 1, tzinfo=dt_timezone.utc)
+    if month == 12:
+        month_end = datetime(year + 1, 1, 1, tzinfo=dt_timezone.utc)
+    else:
+        month_end = datetime(year, month + 1, 1, tzinfo=dt_timezone.utc)
+    return month_start, month_end
+
+
+def unpack_array(typecode, data):
+    values = array(typecode, bytes(data or b''))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def pack_array(values):
+    """ """
+    ''' Arrays are stored little-endian so the data reads the same on any server '''
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+''' Snapshots are encoded and decoded this many keys, or bytes, at a time '''
+SNAPSHOT_PIECE_SIZE = 65536
+
+
+def get_month_number(opened):
+    opened = opened.astimezone(dt_timezone.utc)
+    return opened.year * 12 + opened.month - 1
+
+
+class OpenBitmap(BaseMixin):
+    def __init__(self, *args, **kwargs):
+        """ """
+        ''' Recipients are numbered by their place in the snapshot of the send, and each open sets that recipient's bit '''
+        super().__init__(*args, **kwargs)
+        self._recipient_pks = None
+
+    tracker = models.OneToOneField(
+        EmailTracker,
+        on_delete=models.CASCADE,
+        related_name='open_bitmap',
+    )
+    recipients = models.BinaryField(
+        default=b'',
+    )
+    opens = models.BinaryField(
+        default=b'',
+    )
+    first_month = models.PositiveIntegerField(
+    )
+    month_counts = models.BinaryField(
+        default=b'',
+    )
+
+    def recipient_pks(self):
+        if self._recipient_pks is None:
+            self._recipient_pks = array('Q', self.iterate_recipient_pks())
+        return self._recipient_pks
+
+    def iterate_recipient_pks(self):
+        """ """
+        ''' Decode the snapshot a piece at a time, so reading it through never holds every key '''
+        decompressor = zlib.decompressobj()
+        recipients = memoryview(bytes(self.recipients or b''))
+        subscriber_pk = 0
+        pending = b''
+        for start in range(0, len(recipients) + SNAPSHOT_PIECE_SIZE, SNAPSHOT_PIECE_SIZE):
+            if start < len(recipients):
+                pending += decompressor.decompress(recipients[start:start + SNAPSHOT_PIECE_SIZE])
+            else:
+                pending += decompressor.flush()
+            whole_length = len(pending) - len(pending) % 8
+            for gap in unpack_array('Q', pending[:whole_length]):
+                subscriber_pk += gap
+                yield subscriber_pk
+            pending = pending[whole_length:]
+
+    def set_recipients(self, subscriber_pks):
+        """ """
+        ''' Primary keys must be given in ascending order, and are compressed as the gaps between them as they are read, taking about a byte each '''
+        compressor = zlib.compressobj()
+        pieces = []
+        gaps = array('Q')
+        recipient_count = 0
+        previous_pk = 0
+        for subscriber_pk in subscriber_pks:
+            gaps.append(subscriber_pk - previous_pk)
+            previous_pk = subscriber_pk
+            if len(gaps) == SNAPSHOT_PIECE_SIZE:
+                pieces.append(compressor.compress(pack_array(gaps)))
+                recipient_count += len(gaps)
+                gaps = array('Q')
+        pieces.append(compressor.compress(pack_array(gaps)))
+        pieces.append(compressor.flush())
+        recipient_count += len(gaps)
+        self.recipients = b''.join(pieces)
+        self.opens = bytes((recipient_count + 7) // 8)
+        self._recipient_pks = None
+
+    def ordinal(self, subscriber_pk):
+        recipient_pks = self.recipient_pks()
+        index = bisect_left(recipient_pks, subscriber_pk)
+        if index < len(recipient_pks) and recipient_pks[index] == subscriber_pk:
+            return index
+        return None
+
+    def is_open(self, ordinal):
+        return bool(self.opens[ordinal >> 3] & (1 << (ordinal & 7)))
+
+    def add_open(self, ordinal, opened):
+        """ """
+        ''' Set the recipient's bit and count the open in its month, returning False if the recipient had already opened the email '''
+        if self.is_open(ordinal):
+            return False
+        if not isinstance(self.opens, bytearray):
+            self.opens = bytearray(self.opens)
+        self.opens[ordinal >> 3] |= 1 << (ordinal & 7)
+        month_counts = unpack_array('I', self.month_counts)
+        index = max(get_month_number(opened) - self.first_month, 0)
+        if index >= len(month_counts):
+            month_counts.extend([0] * (index + 1 - len(month_counts)))
+        month_counts[index] += 1
+        self.month_counts = pack_array(month_counts)
+        return True
+
+    def open_count(self):
+        return bin(int.from_bytes(self.opens, 'little')).count('1')
+
+    def month_count(self, year, month):
+        month_counts = unpack_array('I', self.month_counts)
+        index = year * 12 + month - 1 - self.first_month
+        if 0 <= index < len(month_counts):
+            return month_counts[index]
+        return 0
+
+
+class OpenerSketch(BaseMixin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    tracker = models.ForeignKey(
+        EmailTracker,
+        on_delete=models.CASCADE,
+        related_name='opener_sketches',
+    )
+    year_int = models.PositiveIntegerField(
+    )
+    month_int = models.PositiveIntegerField(
+    )
+    registers = models.BinaryField(
+        default=empty_sketch,
+    )
+
+    def estimate(self):
+        return estimate_sketch(bytearray(self.registers))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'tracker',
+                    'year_int',
+                    'month_int',
+                ],
+                name='unique_opener_sketch',
+            ),
+        ]
+
+
+class SendRecord(BaseMixin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    email_model = models.CharField(
+        max_length=255,
+    )
+    email_pk = models.PositiveBigIntegerField(
+    )
+    tracker = models.ForeignKey(
+        EmailTracker,
+        on_delete=models.SET_NULL,
+        related_name='send_records',
+        blank=True,
+        null=True,
+    )
+    completed = models.DateTimeField(
+    )
+    subscription_name = models.CharField(
+        max_length=255,
+        blank=True,
+    )
+    number_sent = models.PositiveIntegerField(
+        default=0,
+    )
+    number_failed = models.PositiveIntegerField(
+        default=0,
+    )
+    legacy_history = models.TextField(
+        blank=True,
+    )
+
+    def __str__(self):
+        return f'{self.subscription_name} — {localize(timezone.localtime(self.completed))}'
+
+    class Meta:
+        ordering = [
+            '-completed',
+        ]
+        indexes = [
+            models.Index(
+                fields=[
+                    'email_model',
+                    'email_pk',
+                ],
+                name='sendrecord_email_idx',
+            ),
+        ]
+
+
+class FailedDelivery(BaseMixin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    RETRYING = 'retrying'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (RETRYING, 'Retrying'),
+        (DEAD, 'Dead letter'),
+    ]
+
+    tracker = models.ForeignKey(
+        EmailTracker,
+        on_delete=models.CASCADE,
+        related_name='failed_deliveries',
+    )
+    subscriber = models.ForeignKey(
+        Subscriber,
+        on_delete=models.CASCADE,
+    )
+    status = models.CharField(
+        max_length=255,
+        choices=STATUS_CHOICES,
+        default=RETRYING,
+    )
+    error_class = models.CharField(
+        max_length=255,
+    )
+    error_message = models.TextField(
+        blank=True,
+    )
+    attempts = models.PositiveIntegerField(
+        default=1,
+    )
+    next_attempt = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+
+    def __str__(self):
+        return f'{self.subscriber} — {self.tracker.subject}'
+
+    class Meta:
+        ordering = [
+            'next_attempt',
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'tracker',
+                    'subscriber',
+                ],
+                name='unique_failed_delivery',
+            ),
+        ]
+        verbose_name_plural = 'failed deliveries'
+
 
 class MonthlyStat(BaseMixin):
     def __init__(self, *args, **kwargs):
@@ -521,6 +1267,9 @@ class MonthlyStat(BaseMixin):
     stat_data = models.TextField(
         blank=True,
     )
+    opener_data = models.TextField(
+        blank=True,
+    )
     current_trackers = models.ManyToManyField(
         EmailTracker,
         related_name='current',
@@ -543,3 +1292,11 @@ class MonthlyStat(BaseMixin):
             )
         else:
             return ''
+
+    def opener_table(self):
+        if self.opener_data:
+            return mark_safe(
+                f'<table id="emailer_table">{self.opener_data}</table>'
+            )
+        else:
+            return ''
@@ -0,0 +1,965 @@
+from collections import (
+    namedtuple,
+)
+from contextlib import (
+    contextmanager,
+)
+from datetime import (
+    timedelta,
+)
+from email import (
+    message_from_bytes,
+    policy,
+)
+from email.parser import (
+    BytesHeaderParser,
+)
+from email.utils import (
+    parseaddr,
+)
+from os import (
+    listdir,
+    makedirs,
+    path,
+    remove,
+    replace,
+    stat,
+    utime,
+)
+from queue import (
+    Empty,
+    Queue,
+)
+import re
+from smtplib import (
+    SMTPException,
+    SMTPRecipientsRefused,
+    SMTPServerDisconnected,
+)
+import sys
+from threading import (
+    Lock,
+    Thread,
+)
+from time import (
+    monotonic,
+    sleep,
+    time,
+)
+from urllib.parse import (
+    quote,
+)
+
+
+from django.conf import (
+    settings,
+)
+from django.contrib.sites.models import (
+    Site,
+)
+from django.core.mail import (
+    EmailMultiAlternatives,
+    get_connection,
+)
+from django.db.models import (
+    Q,
+)
+from django.template.loader import (
+    get_template,
+)
+from django.urls import (
+    reverse,
+)
+from django.utils import (
+    timezone,
+)
+from django.utils.crypto import (
+    get_random_string,
+)
+from django.utils.html import (
+    conditional_escape,
+)
+from django.utils.http import (
+    RFC3986_SUBDELIMS,
+)
+
+
+from .models import (
+    EmailTracker,
+    FailedDelivery,
+    Membership,
+    SendRecord,
+    SiteProfile,
+)
+from .tokens import (
+    get_subscriber_token,
+)
+
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def get_send_batch_size():
+    try:
+        return settings.EMAILER_SEND_BATCH_SIZE
+    except AttributeError:
+        return 100
+
+
+def get_rate_limit():
+    try:
+        return settings.EMAILER_RATE_LIMIT
+    except AttributeError:
+        return None
+
+
+def get_domain_rate_limits():
+    try:
+        return settings.EMAILER_DOMAIN_RATE_LIMITS
+    except AttributeError:
+        return {}
+
+
+def get_throttle_retries():
+    try:
+        return settings.EMAILER_THROTTLE_RETRIES
+    except AttributeError:
+        return 3
+
+
+def get_throttle_delay():
+    try:
+        return settings.EMAILER_THROTTLE_DELAY
+    except AttributeError:
+        return 1
+
+
+def get_group_by_domain():
+    try:
+        return settings.EMAILER_GROUP_BY_DOMAIN
+    except AttributeError:
+        return False
+
+
+def get_spool_directory():
+    try:
+        return settings.EMAILER_SPOOL_DIRECTORY
+    except AttributeError:
+        return None
+
+
+def get_universal_email_directory():
+    try:
+        return settings.EMAILER_EMAIL_TEMPLATES
+    except AttributeError:
+        return 'django_simple_bulk_emailer/universal/emails'
+
+
+def get_recipient_domain(message):
+    return parseaddr(message.to[0])[1].rpartition('@')[2].lower()
+
+
+def get_error_codes(error):
+    if isinstance(error, SMTPRecipientsRefused):
+        codes = [code for code, message in error.recipients.values()]
+    else:
+        codes = [getattr(error, 'smtp_code', None)]
+    return [code for code in codes if isinstance(code, int)]
+
+
+def is_throttled(error):
+    """ """
+    ''' 4xx replies are temporary refusals, such as rate limits, that may succeed if tried again later '''
+    return any(400 <= code < 500 for code in get_error_codes(error))
+
+
+def is_permanent_failure(error):
+    codes = get_error_codes(error)
+    return bool(codes) and all(500 <= code < 600 for code in codes)
+
+
+def get_retry_limit():
+    try:
+        return settings.EMAILER_RETRY_LIMIT
+    except AttributeError:
+        return 5
+
+
+def get_retry_delay():
+    try:
+        return settings.EMAILER_RETRY_DELAY
+    except AttributeError:
+        return 300
+
+
+def get_failure_status(error, attempts):
+    if is_permanent_failure(error) or attempts >= get_retry_limit():
+        return FailedDelivery.DEAD, None
+    ''' Wait twice as long after each failed attempt '''
+    next_attempt = timezone.now() + timedelta(seconds=get_retry_delay() * 2 ** (attempts - 1))
+    return FailedDelivery.RETRYING, next_attempt
+
+
+def record_failures(tracker, failures):
+    failed_deliveries = []
+    for subscriber_pk, error in failures:
+        status, next_attempt = get_failure_status(error, 1)
+        failed_deliveries.append(
+            FailedDelivery(
+                tracker=tracker,
+                subscriber_id=subscriber_pk,
+                status=status,
+                error_class=type(error).__name__,
+                error_message=str(error),
+                next_attempt=next_attempt,
+            )
+        )
+    FailedDelivery.objects.bulk_create(
+        failed_deliveries,
+        ignore_conflicts=True,
+    )
+
+
+def update_send_records(tracker_pks):
+    """ """
+    ''' Send history outlives trackers, so messages delivered or failed after a send finished are counted on it too '''
+    trackers = EmailTracker.objects.filter(
+        pk__in=tracker_pks,
+        send_records__isnull=False,
+    ).values_list(
+        'pk',
+        'number_sent',
+    ).distinct()
+    for tracker_pk, number_sent in trackers:
+        SendRecord.objects.filter(
+            tracker=tracker_pk,
+        ).update(
+            number_sent=number_sent,
+            number_failed=FailedDelivery.objects.filter(
+                tracker=tracker_pk,
+            ).count(),
+        )
+
+
+class TokenBucket:
+    def __init__(self, rate, clock=monotonic):
+        self.max_rate = rate
+        self.rate = rate
+        self.clock = clock
+        self.tokens = max(1, rate)
+        self.updated = clock()
+        self.lock = Lock()
+
+    def take(self):
+        """ """
+        ''' Reserve a token and return how long to wait for it, so threads sharing the bucket queue up in turn '''
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(max(1, self.rate), self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def increase(self):
+        with self.lock:
+            self.rate = min(self.rate + self.max_rate / 100, self.max_rate)
+
+    def decrease(self):
+        with self.lock:
+            self.rate = max(self.rate / 2, self.max_rate / 64)
+
+
+class RateLimiter:
+    def __init__(self, rate=None, domain_rates=None):
+        """ """
+        ''' A domain rate under the '*' key applies to each domain without its own rate '''
+        if rate:
+            self.bucket = TokenBucket(rate)
+        else:
+            self.bucket = None
+        self.domain_rates = domain_rates or {}
+        self.domain_buckets = {}
+        self.lock = Lock()
+
+    def get_buckets(self, domain):
+        buckets = []
+        if self.bucket:
+            buckets.append(self.bucket)
+        with self.lock:
+            if domain not in self.domain_buckets:
+                domain_rate = self.domain_rates.get(domain, self.domain_rates.get('*'))
+                if domain_rate:
+                    self.domain_buckets[domain] = TokenBucket(domain_rate)
+                else:
+                    self.domain_buckets[domain] = None
+            if self.domain_buckets[domain]:
+                buckets.append(self.domain_buckets[domain])
+        return buckets
+
+    def wait(self, domain):
+        for bucket in self.get_buckets(domain):
+            delay = bucket.take()
+            if delay:
+                sleep(delay)
+
+    def delivered(self, domain):
+        for bucket in self.get_buckets(domain):
+            bucket.increase()
+
+    def throttled(self, domain, attempt):
+        """ """
+        ''' Halve the rates the domain is sent at, which climb back gradually as deliveries succeed, and back off before retrying '''
+        for bucket in self.get_buckets(domain):
+            bucket.decrease()
+        sleep(get_throttle_delay() * 2 ** attempt)
+
+
+def get_rate_limiter():
+    return RateLimiter(
+        rate=get_rate_limit(),
+        domain_rates=get_domain_rate_limits(),
+    )
+
+
+def get_recipient_chunk_size():
+    try:
+        return settings.EMAILER_RECIPIENT_CHUNK_SIZE
+    except AttributeError:
+        return 2000
+
+
+''' Only the fields used to build messages are read for each recipient '''
+Recipient = namedtuple(
+    'Recipient',
+    [
+        'pk',
+        'subscriber_key',
+        'first_name',
+        'last_name',
+        'subscriber_email',
+        'email_domain',
+    ],
+)
+
+
+def get_recipients(subscription):
+    """ """
+    ''' Recipients are read from the list's memberships, so only its members are read, in the order of an index that leads with the list '''
+    return Membership.objects.filter(
+        subscription=subscription,
+    )
+
+
+def recipients_after(email_domain, pk, group_by_domain):
+    if group_by_domain:
+        return Q(email_domain__gt=email_domain) | Q(email_domain=email_domain, subscriber__gt=pk)
+    return Q(subscriber__gt=pk)
+
+
+def count_recipients(subscriber_list, after=None, group_by_domain=None):
+    if group_by_domain is None:
+        group_by_domain = get_group_by_domain()
+    if after is not None:
+        subscriber_list = subscriber_list.filter(
+            recipients_after(*after, group_by_domain),
+        )
+    return subscriber_list.count()
+
+
+def iterate_recipients(subscriber_list, chunk_size=None, after=None, group_by_domain=None):
+    """ """
+    ''' Fetch recipients in chunks keyed on the last one seen '''
+    if chunk_size is None:
+        chunk_size = get_recipient_chunk_size()
+    if group_by_domain is None:
+        group_by_domain = get_group_by_domain()
+    ''' Each membership's domain is indexed with the list and subscriber, so every chunk is read from the index in order '''
+    if group_by_domain:
+        subscriber_list = subscriber_list.order_by(
+            'email_domain',
+            'subscriber_id',
+        )
+    else:
+        subscriber_list = subscriber_list.order_by(
+            'subscriber_id',
+        )
+    subscriber_list = subscriber_list.values_list(
+        'subscriber_id',
+        'subscriber__subscriber_key',
+        'subscriber__first_name',
+        'subscriber__last_name',
+        'subscriber__subscriber_email',
+        'email_domain',
+    )
+    while True:
+        chunk = subscriber_list
+        if after is not None:
+            chunk = chunk.filter(
+                recipients_after(*after, group_by_domain),
+            )
+        chunk = list(map(Recipient._make, chunk[:chunk_size]))
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        after = (chunk[-1].email_domain, chunk[-1].pk)
+
+
+class PhaseTimer:
+    def __init__(self, clock=monotonic):
+        self.clock = clock
+        self.seconds = {}
+
+    @contextmanager
+    def time(self, phase):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.seconds[phase] = self.seconds.get(phase, 0) + self.clock() - start
+
+    def pop(self):
+        seconds = self.seconds
+        self.seconds = {}
+        return seconds
+
+
+def get_peak_memory():
+    """ """
+    ''' Peak resident memory of this process in kilobytes, or None where the platform cannot report it '''
+    if resource is None:
+        return None
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_memory //= 1024
+    return peak_memory
+
+
+def get_sender_addresses():
+    try:
+        from_address = settings.EMAILER_FROM_ADDRESS
+    except AttributeError:
+        from_address = settings.DEFAULT_FROM_EMAIL
+    try:
+        reply_address = settings.EMAILER_REPLY_ADDRESS
+    except AttributeError:
+        reply_address = from_address
+    return from_address, reply_address
+
+
+def create_message(subject, text_email, html_email, to_address, send_context=None):
+    if send_context:
+        from_address = send_context.from_address
+        reply_address = send_context.reply_address
+    else:
+        from_address, reply_address = get_sender_addresses()
+    message = EmailMultiAlternatives(
+        subject,
+        text_email,
+        from_address,
+        [to_address],
+        reply_to=[reply_address],
+    )
+    message.attach_alternative(html_email, 'text/html')
+    return message
+
+
+def get_url_domain(url, protocol_domain):
+    if any(protocol in url for protocol in ['http://', 'https://']):
+        return ''
+    else:
+        return protocol_domain
+
+
+class SendContext:
+    """ """
+    ''' Site, profile and settings lookups shared by every message in a run '''
+    def __init__(self):
+        self.site = Site.objects.get_current()
+        self.site_profile = SiteProfile.objects.filter(
+            domain=self.site.domain,
+        ).first()
+        self.protocol_domain = self.site_profile.protocol_domain()
+        self.static_domain = get_url_domain(settings.STATIC_URL, self.protocol_domain)
+        self.media_domain = get_url_domain(settings.MEDIA_URL, self.protocol_domain)
+        self.from_address, self.reply_address = get_sender_addresses()
+
+
+def get_splice_rendering():
+    try:
+        return settings.EMAILER_SPLICE_RENDERING
+    except AttributeError:
+        return True
+
+
+class BulkMailer:
+    def __init__(self, connection=None, batch_size=None, rate_limiter=None, group_by_domain=None):
+        if batch_size is None:
+            batch_size = get_send_batch_size()
+        if rate_limiter is None:
+            rate_limiter = get_rate_limiter()
+        if group_by_domain is None:
+            group_by_domain = get_group_by_domain()
+        self.connection = connection
+        self.batch_size = batch_size
+        self.rate_limiter = rate_limiter
+        self.group_by_domain = group_by_domain
+        self.domain = None
+        self.batch = []
+        self.delivered = []
+        self.connection_open = False
+        self.connection_count = 0
+        self.number_sent = 0
+
+    def open(self):
+        if not self.connection_open:
+            if self.connection is None:
+                self.connection = get_connection()
+            self.connection.open()
+            self.connection_open = True
+            self.connection_count += 1
+
+    def close(self):
+        if self.connection_open:
+            self.connection_open = False
+            try:
+                self.connection.close()
+            except (SMTPException, OSError):
+                pass
+
+    def add(self, message, marker=None):
+        self.batch.append((marker, message))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        batch = self.batch
+        self.batch = []
+        if batch:
+            self.delivered.append((batch[-1][0], *self.deliver(batch)))
+
+    def deliver(self, batch):
+        """ """
+        ''' Messages go out one at a time over the open connection so a dropped session only resends the message that failed '''
+        number_sent = 0
+        failures = []
+        for marker, message in batch:
+            domain = get_recipient_domain(message)
+            ''' Recipients grouped by domain get a new connection for each domain '''
+            if self.group_by_domain and domain != self.domain:
+                self.close()
+            self.domain = domain
+            reconnected = False
+            throttled = 0
+            while True:
+                self.rate_limiter.wait(domain)
+                try:
+                    self.open()
+                    number_sent += self.connection.send_messages([message])
+                    self.rate_limiter.delivered(domain)
+                    break
+                except SMTPServerDisconnected as e:
+                    self.close()
+                    error = e
+                except SMTPException as e:
+                    if not is_throttled(e) or throttled >= get_throttle_retries():
+                        failures.append((marker, e))
+                        break
+                    self.rate_limiter.throttled(domain, throttled)
+                    throttled += 1
+                    continue
+                except OSError as e:
+                    self.close()
+                    error = e
+                if reconnected:
+                    failures.append((marker, error))
+                    break
+                reconnected = True
+        self.number_sent += number_sent
+        return number_sent, failures
+
+    def join(self):
+        self.flush()
+
+    def discard(self):
+        self.batch = []
+        self.delivered = []
+
+    def pop_delivered(self):
+        delivered = self.delivered
+        self.delivered = []
+        return delivered
+
+    def checkpoint(self):
+        """ """
+        ''' Return the marker of the last message in the latest delivered batch, the number sent since the previous checkpoint and the markers and errors of messages that failed '''
+        delivered = self.pop_delivered()
+        if not delivered:
+            return None
+        number_sent = 0
+        failures = []
+        for marker, batch_sent, batch_failures in delivered:
+            number_sent += batch_sent
+            failures += batch_failures
+        return delivered[-1][0], number_sent, failures
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+        self.close()
+
+
+class ThreadedMailer(BulkMailer):
+    def __init__(self, workers, batch_size=None, rate_limiter=None):
+        super().__init__(batch_size=batch_size, rate_limiter=rate_limiter)
+        self.queue = Queue(maxsize=workers * 2)
+        self.queued_count = 0
+        self.results = {}
+        self.result_index = 0
+        ''' Worker threads share one rate limiter '''
+        self.mailers = [BulkMailer(batch_size=batch_size, rate_limiter=self.rate_limiter, group_by_domain=self.group_by_domain) for worker in range(workers)]
+        self.threads = [Thread(target=self.work, args=(mailer,), daemon=True) for mailer in self.mailers]
+        for thread in self.threads:
+            thread.start()
+
+    def work(self, mailer):
+        """ """
+        ''' Each worker delivers whole batches over its own connection until told to stop '''
+        while True:
+            queued = self.queue.get()
+            if queued is None:
+                self.queue.task_done()
+                break
+            index, batch = queued
+            try:
+                number_sent, failures = mailer.deliver(batch)
+            except Exception as e:
+                ''' A batch that failed outright is reported with every message in it failed, so later batches are still checkpointed and its recipients are left for retry_failed_deliveries '''
+                mailer.close()
+                number_sent, failures = 0, [(marker, e) for marker, message in batch]
+            self.results[index] = (batch[-1][0], number_sent, failures)
+            self.queue.task_done()
+        mailer.close()
+
+    def flush(self):
+        batch = self.batch
+        self.batch = []
+        if batch:
+            self.queue.put((self.queued_count, batch))
+            self.queued_count += 1
+
+    def pop_delivered(self):
+        """ """
+        ''' Batches can finish out of order, so only report those with every earlier batch also delivered '''
+        delivered = []
+        while self.result_index in self.results:
+            delivered.append(self.results.pop(self.result_index))
+            self.result_index += 1
+        return delivered
+
+    def join(self):
+        """ """
+        ''' Wait for every queued batch to be delivered while keeping the threads and their connections open '''
+        self.flush()
+        self.queue.join()
+        self.collect()
+
+    def discard(self):
+        """ """
+        ''' Drop queued batches without delivering them and wait for those already being delivered '''
+        self.batch = []
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Empty:
+                break
+            self.queue.task_done()
+        self.queue.join()
+        self.results = {}
+        self.result_index = self.queued_count
+
+    def collect(self):
+        self.number_sent = sum(mailer.number_sent for mailer in self.mailers)
+        self.connection_count = sum(mailer.connection_count for mailer in self.mailers)
+
+    def close(self):
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.collect()
+
+
+def get_spool_name(tracker_pk, subscriber_pk):
+    return f'{tracker_pk}-{subscriber_pk}.eml'
+
+
+def parse_spool_name(name):
+    tracker_pk, subscriber_pk = path.splitext(name)[0].split('-')
+    return int(tracker_pk), int(subscriber_pk)
+
+
+class SpooledMessage:
+    encoding = None
+
+    def __init__(self, data):
+        """ """
+        ''' Only the headers are parsed, to give mail backends the envelope they would read from an EmailMessage '''
+        self.data = data
+        headers = BytesHeaderParser(policy=policy.default).parsebytes(data)
+        self.from_email = str(headers['From'])
+        self.to = [str(address) for address in headers['To'].addresses]
+        self.subject = str(headers['Subject'])
+
+    def recipients(self):
+        return self.to
+
+    def message(self):
+        return message_from_bytes(self.data)
+
+
+class Spool:
+    def __init__(self, directory):
+        """ """
+        ''' Messages are written to tmp, wait in new and are moved to cur while being delivered, as in a maildir '''
+        self.directory = directory
+        for folder in ['tmp', 'new', 'cur']:
+            makedirs(self.file_path(folder), exist_ok=True)
+
+    def file_path(self, folder, name=''):
+        return path.join(self.directory, folder, name)
+
+    def write(self, name, message):
+        """ """
+        ''' Moving the finished file into new is atomic, so delivery never reads a partly written message '''
+        temporary_path = self.file_path('tmp', name)
+        with open(temporary_path, 'wb') as spool_file:
+            spool_file.write(message.message().as_bytes(linesep='\r\n'))
+        replace(temporary_path, self.file_path('new', name))
+
+    def claim(self):
+        """ """
+        ''' Move waiting messages into cur one at a time, skipping any another delivery process took first '''
+        for name in sorted(listdir(self.file_path('new'))):
+            claimed_path = self.file_path('cur', name)
+            try:
+                replace(self.file_path('new', name), claimed_path)
+            except FileNotFoundError:
+                continue
+            utime(claimed_path)
+            yield name
+
+    def renew(self, names):
+        """ """
+        ''' Mark claimed messages as still being delivered, so a release with a lease leaves them where they are '''
+        for name in names:
+            try:
+                utime(self.file_path('cur', name))
+            except FileNotFoundError:
+                pass
+
+    def read(self, name):
+        with open(self.file_path('cur', name), 'rb') as spool_file:
+            return SpooledMessage(spool_file.read())
+
+    def remove(self, name):
+        remove(self.file_path('cur', name))
+
+    def release(self, lease=None):
+        """ """
+        ''' Return messages claimed by delivery processes to new, or only those claimed longer ago than the lease '''
+        for name in listdir(self.file_path('cur')):
+            claimed_path = self.file_path('cur', name)
+            try:
+                if lease is None or stat(claimed_path).st_mtime < time() - lease:
+                    replace(claimed_path, self.file_path('new', name))
+            except FileNotFoundError:
+                pass
+
+
+class SpoolMailer(BulkMailer):
+    def __init__(self, spool, tracker_pk, batch_size=None):
+        super().__init__(batch_size=batch_size)
+        self.spool = spool
+        self.tracker_pk = tracker_pk
+
+    def deliver(self, batch):
+        """ """
+        ''' Messages are only written to the spool here, and are counted as sent once deliver_spool delivers them '''
+        for marker, message in batch:
+            self.spool.write(get_spool_name(self.tracker_pk, marker.pk), message)
+        return 0, []
+
+
+class UrlTemplate:
+    def __init__(self, viewname, variable, **kwargs):
+        """ """
+        ''' Reverse the URL once with a placeholder for the variable argument and keep the text on either side '''
+        self.viewname = viewname
+        self.variable = variable
+        self.kwargs = kwargs
+        sentinel = get_random_string(16)
+        url_parts = reverse(
+            viewname,
+            kwargs=dict(kwargs, **{variable: sentinel}),
+        ).split(sentinel)
+        if len(url_parts) == 2:
+            self.prefix, self.suffix = url_parts
+        else:
+            self.prefix = self.suffix = None
+
+    def build(self, value):
+        if self.prefix is None:
+            return reverse(
+                self.viewname,
+                kwargs=dict(self.kwargs, **{self.variable: value}),
+            )
+        ''' Quote the value the same way reverse() does '''
+        return f'{self.prefix}{quote(str(value), safe=RFC3986_SUBDELIMS + "/~:@")}{self.suffix}'
+
+
+class SubscriberUrls:
+    def __init__(self, protocol_domain, list_slug='', tracker_pk=None):
+        self.protocol_domain = protocol_domain
+        self.manage_url = UrlTemplate(
+            'django_simple_bulk_emailer:manage_subscriptions',
+            'subscriber_key',
+        )
+        if list_slug != '':
+            self.unsubscribe_url = UrlTemplate(
+                'django_simple_bulk_emailer:quick_unsubscribe',
+                'subscriber_key',
+                list_slug=list_slug,
+            )
+        else:
+            self.unsubscribe_url = None
+        if tracker_pk is not None:
+            self.tracking_image = UrlTemplate(
+                'django_simple_bulk_emailer:opened_email',
+                'subscriber_key',
+                pk=tracker_pk,
+            )
+        else:
+            self.tracking_image = None
+
+    def build(self, subscriber_key):
+        if self.unsubscribe_url:
+            unsubscribe_url = self.unsubscribe_url.build(subscriber_key)
+        else:
+            unsubscribe_url = ''
+        subscriber_urls = {
+            'subscriptions_url': f'{self.protocol_domain}{self.manage_url.build(subscriber_key)}',
+            'quick_unsubscribe_url': f'{self.protocol_domain}{unsubscribe_url}',
+        }
+        if self.tracking_image:
+            subscriber_urls['tracking_image'] = self.tracking_image.build(subscriber_key)
+        return subscriber_urls
+
+
+class EmailRenderer:
+    recipient_fields = [
+        'tracking_image',
+        'subscriptions_url',
+        'quick_unsubscribe_url',
+    ]
+
+    def __init__(self, email_content, text_template, html_template):
+        self.email_content = email_content
+        self.text_template = get_template(text_template)
+        self.html_template = get_template(html_template)
+        self.spliceable = get_splice_rendering()
+        self.verified = False
+        if self.spliceable:
+            ''' Render both bodies once with a placeholder token standing in for each recipient field '''
+            nonce = get_random_string(16)
+            token_content = dict(email_content)
+            for index, field in enumerate(self.recipient_fields):
+                token_content[field] = f'{nonce}x{index}x'
+            self.token_pattern = re.compile(f'{nonce}x(\\d+)x')
+            self.text_parts = self.split(self.text_template.render(token_content))
+            self.html_parts = self.split(self.html_template.render(token_content))
+
+    def split(self, rendered):
+        parts = self.token_pattern.split(rendered)
+        for index in range(1, len(parts), 2):
+            parts[index] = self.recipient_fields[int(parts[index])]
+        return parts
+
+    def splice(self, parts, values):
+        return ''.join(values[part] if index & 1 else part for index, part in enumerate(parts))
+
+    def full_render(self, recipient_content):
+        context = dict(self.email_content)
+        context.update(recipient_content)
+        return self.text_template.render(context), self.html_template.render(context)
+
+    def render(self, recipient_content):
+        if not self.spliceable:
+            return self.full_render(recipient_content)
+        values = {field: conditional_escape(recipient_content.get(field, '')) for field in self.recipient_fields}
+        rendered = self.splice(self.text_parts, values), self.splice(self.html_parts, values)
+        if not self.verified:
+            ''' Compare the first spliced email with a full render and fall back if the templates transform a recipient field '''
+            self.verified = True
+            full_rendered = self.full_render(recipient_content)
+            if rendered != full_rendered:
+                self.spliceable = False
+                return full_rendered
+        return rendered
+
+
+class EmailSend:
+    def __init__(self, tracker, send_context, email_instance=None):
+        self.tracker = tracker
+        self.send_context = send_context
+        self.subscription = tracker.subscription
+        if email_instance is None:
+            email_instance = self.subscription.get_email_class().objects.get(
+                pk=tracker.email_pk,
+            )
+        email_instance.send_context = send_context
+        self.email_instance = email_instance
+        ''' Create email '''
+        email_directory = self.subscription.email_directory
+        basic_template = f'{get_universal_email_directory()}/bulk_email_send.html'
+        text_template = f'{email_directory}/email_template_text.txt'
+        html_template = f'{email_directory}/email_template_html.html'
+        email_content = {
+            'basic_template': basic_template,
+            'protocol_domain': send_context.protocol_domain,
+            'email_instance': email_instance,
+            'send_context': send_context,
+        }
+        ''' Render email bodies once for all subscribers '''
+        self.renderer = EmailRenderer(
+            email_content,
+            text_template,
+            html_template,
+        )
+        self.subject = email_instance.email_subject()
+        ''' Reverse subscriber URLs once and fill in each subscriber's key '''
+        self.subscriber_urls = SubscriberUrls(
+            send_context.protocol_domain,
+            list_slug=self.subscription.list_slug,
+            tracker_pk=tracker.pk,
+        )
+
+    def create_message(self, subscriber):
+        ''' Get subscriber-specific information '''
+        recipient_content = self.subscriber_urls.build(get_subscriber_token(subscriber, self.subscription.pk))
+        text_email, html_email = self.renderer.render(recipient_content)
+        to_address = f'"{subscriber.first_name} {subscriber.last_name}" <{subscriber.subscriber_email}>'
+        return create_message(
+            self.subject,
+            text_email,
+            html_email,
+            to_address,
+            send_context=self.send_context,
+        )
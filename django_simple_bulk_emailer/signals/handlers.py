@@ -12,16 +12,24 @@ from string import (
 from django.core.exceptions import (
     ObjectDoesNotExist,
 )
+from django.db.models import (
+    OuterRef,
+    Subquery,
+)
 from django.db.models.signals import (
     m2m_changed,
+    post_delete,
+    post_save,
     pre_delete,
     pre_save,
 )
 
 
 from ..models import (
+    Membership,
     Subscriber,
     Subscription,
+    clear_email_class_registry,
 )
 
 
@@ -41,6 +49,7 @@ def class_set(input_set):
 def save_sync(sender, instance, *args, **kwargs):
     instance.subscriber_key = ''.join(choice(ascii_lowercase + ascii_uppercase + digits) for _ in range(64))
     instance.subscriber_email = instance.subscriber_email.lower()
+    instance.email_domain = instance.subscriber_email.partition('@')[2]
     if not instance.mc_email:
         instance.mc_email = instance.subscriber_email
     try:
@@ -88,6 +97,59 @@ def delete_sync(sender, instance, *args, **kwargs):
                 pass
 
 
+def subscription_changed(sender, instance, *args, **kwargs):
+    clear_email_class_registry()
+
+
+def domain_saved(sender, instance, created, *args, **kwargs):
+    if created:
+        return
+    Membership.objects.filter(
+        subscriber=instance,
+    ).exclude(
+        email_domain=instance.email_domain,
+    ).update(
+        email_domain=instance.email_domain,
+    )
+
+
+def membership_added(sender, instance, action, reverse, pk_set, *args, **kwargs):
+    """ """
+    ''' Memberships are created without the subscriber's domain, which is copied onto them once they are added '''
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        Membership.objects.filter(
+            subscription=instance,
+            subscriber__in=pk_set,
+        ).update(
+            email_domain=Subquery(
+                Subscriber.objects.filter(
+                    pk=OuterRef('subscriber'),
+                ).values(
+                    'email_domain',
+                )[:1],
+            ),
+        )
+    else:
+        Membership.objects.filter(
+            subscriber=instance,
+            subscription__in=pk_set,
+        ).update(
+            email_domain=instance.email_domain,
+        )
+
+
+for class_item in class_set(set({Subscription})):
+    post_save.connect(subscription_changed, class_item)
+    post_delete.connect(subscription_changed, class_item)
+
+
+for class_item in class_set(set({Subscriber})):
+    post_save.connect(domain_saved, class_item)
+m2m_changed.connect(membership_added, Membership)
+
+
 try:
     from mailchimp3 import MailChimp
     from mailchimp3.mailchimpclient import MailChimpError
@@ -6,6 +6,7 @@ from datetime import (
 from io import (
     BytesIO,
 )
+import re
 
 
 from django.contrib.auth.models import (
@@ -31,6 +32,9 @@ from django.core.files.uploadedfile import (
 from django.core.management import (
     call_command,
 )
+from django.db import (
+    connection,
+)
 from django.http import (
     Http404,
 )
@@ -56,6 +60,7 @@ from django_simple_bulk_emailer.models import (
     EmailImage,
     EmailTracker,
     MonthlyStat,
+    OpenEvent,
     SiteProfile,
     Subscriber,
     Subscription,
@@ -187,15 +192,25 @@ def create_email(headline=None, list_name=None, body_text=None, published=False,
     return bulk_email
 
 
-def create_tracker(subject='Test email subject', subscription_name='Test subscription', send_complete=django_timezone.now(), number_sent=0, json_data=None):
-    if json_data is None:
-        json_data = {}
+def create_tracker(subject='Test email subject', subscription_name='Test subscription', send_complete=django_timezone.now(), number_sent=0, opens=None):
+    if opens is None:
+        opens = {}
     tracker = EmailTracker.objects.create(
         subject=subject,
         subscription_name=subscription_name,
         send_complete=send_complete,
         number_sent=number_sent,
-        json_data=json_data,
+    )
+    ''' Opens are given as the year and month each subscriber key first opened the email '''
+    OpenEvent.objects.bulk_create(
+        [
+            OpenEvent(
+                tracker=tracker,
+                subscriber_key=subscriber_key,
+                opened=datetime(year_month[0], year_month[1], 1, tzinfo=timezone.utc),
+            )
+            for subscriber_key, year_month in opens.items()
+        ]
     )
     return tracker
 
@@ -333,17 +348,21 @@ def create_subscription_email_state(self, list_name, state):
             email_two.save()
 
 
-def call_test_command(self):
+def call_test_command(self, *args, **kwargs):
     try:
         with self.settings(
                 SITE_ID=self.profile_instance.site_ptr.id,
         ):
             call_command(
                 self.test_command,
+                *args,
+                **kwargs,
             )
     except AttributeError:
         call_command(
             self.test_command,
+            *args,
+            **kwargs,
         )
 
 
@@ -637,16 +656,11 @@ def html_contains(self, test_string, true_strings=None, false_strings=None):
         self.assertFalse(string in test_string, error_msg)
 
 
-def json_contains(self, json_data=None, true_dict=None, false_dict=None):
+def json_contains(self, data, true_dict=None, false_dict=None):
     if true_dict is None:
         true_dict = {}
     if false_dict is None:
         false_dict = {}
-    if json_data is None:
-        self.tracker.refresh_from_db()
-        data = self.tracker.json_data
-    else:
-        data = json_data
     for key, value in true_dict.items():
         error_msg_key = f"For view '{self.view_name}', the JSON data did not contain the key '{str(key)}'"
         error_msg_value = f"For view '{self.view_name}', the JSON data value for key '{str(key)}' was '{str(data[key])}' and not '{str(value)}'"
@@ -671,7 +685,7 @@ def image_contains(self, image_dict=None):
         self.assertIs(image_property, value, error_msg)
 
 
-def check_http_response(self, form_load=False, status_code=200, redirect_url=None, true_strings=None, false_strings=None, true_dict=None, false_dict=None, image_dict=None):
+def check_http_response(self, form_load=False, status_code=200, redirect_url=None, true_strings=None, false_strings=None, image_dict=None):
     status_code_equals(
         self,
         status_code,
@@ -693,12 +707,6 @@ def check_http_response(self, form_load=False, status_code=200, redirect_url=Non
             true_strings=true_strings,
             false_strings=false_strings,
         )
-    if true_dict or false_dict:
-        json_contains(
-            self,
-            true_dict=true_dict,
-            false_dict=false_dict,
-        )
     if image_dict:
         image_contains(
             self,
@@ -817,3 +825,42 @@ def check_field_in_form(self, key, boolean):
 def compare_secret_keys(self, secret_key_old, secret_key_new):
     error_msg = 'The secret key was not changed'
     self.assertNotEqual(secret_key_old, secret_key_new, error_msg)
+
+
+def check_query_plans(self, queries, models, ordered=False):
+    """ """
+    ''' Ask SQLite how it would run each captured query and fail if it would read a model's table in full, or if ordered, sort the rows it selects from one '''
+    if connection.vendor != 'sqlite':
+        self.skipTest('Query plans are only checked on SQLite')
+    try:
+        inserted_text = f"view '{self.view_name}'"
+    except AttributeError:
+        inserted_text = f"command '{self.test_command}'"
+    table_names = {model._meta.db_table for model in models}
+    full_scans = []
+    with connection.cursor() as cursor:
+        ''' A partial index only holds the rows its condition picks out, so scanning one is not a full scan '''
+        partial_indexes = set()
+        for table_name in table_names:
+            cursor.execute(f'PRAGMA index_list("{table_name}")')
+            partial_indexes.update(row[1] for row in cursor.fetchall() if row[4])
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            ''' Subqueries name their tables by alias, which is what the plan shows '''
+            aliases = {alias: table_name for table_name, alias in re.findall(r'"(\w+)" (\w+)', sql)}
+            from_match = re.search(r'FROM "(\w+)"', sql)
+            selects_model = bool(from_match) and from_match.group(1) in table_names
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            for row in cursor.fetchall():
+                if ordered and selects_model and row[-1].startswith('USE TEMP B-TREE'):
+                    full_scans.append(f"'{row[-1]}' in '{sql}'")
+                scan_match = re.fullmatch(r'SCAN (?:TABLE )?(\w+)(?: USING (?:COVERING )?INDEX (\w+))?.*', row[-1])
+                if not scan_match:
+                    continue
+                table_name, index_name = scan_match.groups()
+                if aliases.get(table_name, table_name) in table_names and index_name not in partial_indexes:
+                    full_scans.append(f"'{row[-1]}' in '{sql}'")
+    error_msg = f"For {inserted_text}, SQLite planned full scans or sorts: {', '.join(full_scans)}"
+    self.assertEqual(full_scans, [], error_msg)
@@ -1,29 +1,103 @@
 from datetime import (
     timedelta,
 )
+from email.utils import (
+    parseaddr,
+)
+from io import (
+    StringIO,
+)
+from os import (
+    listdir,
+    path,
+)
+from shutil import (
+    rmtree,
+)
+from smtplib import (
+    SMTPRecipientsRefused,
+    SMTPServerDisconnected,
+)
+from tempfile import (
+    mkdtemp,
+)
+from threading import (
+    Event,
+)
+from time import (
+    sleep,
+)
 from unittest.mock import (
     patch,
 )
 
 
+from django.core import (
+    mail,
+)
+from django.core.management import (
+    call_command,
+)
+from django.db import (
+    connection,
+)
 from django.test import (
     TestCase,
 )
+from django.test.utils import (
+    CaptureQueriesContext,
+)
 from django.urls import (
     reverse,
 )
 from django.utils import (
     timezone,
 )
-from django.utils.formats import (
-    localize,
-)
 
 from mailchimp3.mailchimpclient import (
     MailChimpError,
 )
 
 
+from django_simple_bulk_emailer.management.commands.send_bulk_email import (
+    Command,
+    SendLease,
+)
+from django_simple_bulk_emailer.models import (
+    BulkEmail,
+    EmailTracker,
+    FailedDelivery,
+    Membership,
+    OpenBitmap,
+    OpenEvent,
+    OpenerSketch,
+    SendBatch,
+    SendRecord,
+    SendRun,
+    Subscriber,
+    get_month_number,
+)
+from django_simple_bulk_emailer.sending import (
+    BulkMailer,
+    EmailRenderer,
+    EmailSend,
+    RateLimiter,
+    SendContext,
+    Spool,
+    SubscriberUrls,
+    TokenBucket,
+    create_message,
+    get_recipients,
+    iterate_recipients,
+)
+from django_simple_bulk_emailer.tokens import (
+    make_subscriber_token,
+)
+from django_simple_bulk_emailer.tracking import (
+    OpenBuffer,
+)
+
+
 from .functions import (
     attribute_equals,
     call_test_command,
@@ -31,6 +105,7 @@ from .functions import (
     check_email,
     check_quantity_email_sent,
     check_quantity_trackers,
+    check_query_plans,
     check_site_profile,
     check_site_profile_count,
     clear_data_and_files,
@@ -116,6 +191,18 @@ class DeleteExpiredEmailsTests(MixinWrap.BaseMixin):
                 True,
             )
 
+    def test_query_plan(self):
+        create_email()
+        with CaptureQueriesContext(connection) as queries:
+            call_test_command(self)
+        check_query_plans(
+            self,
+            queries,
+            [
+                BulkEmail,
+            ],
+        )
+
 
 class DeleteExpiredStatsTests(MixinWrap.BaseMixin):
     def __init__(self, *args, **kwargs):
@@ -230,6 +317,259 @@ class DeleteUnsubscribedUsersTests(MixinWrap.BaseMixin):
             )
 
 
+class DeliverSpoolTests(MixinWrap.BaseMixin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def setUp(self):
+        self.profile_instance = create_site_profile()
+        self.test_command = 'deliver_spool'
+        self.spool_directory = mkdtemp()
+        self.headline = 'Headline for testing the spool'
+        subscription = create_subscription(
+            list_name='Test list',
+        )
+        create_email(
+            list_name='Test list',
+            headline=self.headline,
+            sendable=True,
+        )
+        for number in range(3):
+            subscriber = create_subscriber(
+                subscriber_email=f'subscriber_{number}@example.com',
+            )
+            subscriber.subscriptions.add(subscription)
+        super().setUp()
+
+    def tearDown(self):
+        rmtree(self.spool_directory)
+        super().tearDown()
+
+    def spooled_names(self, folder):
+        return listdir(path.join(self.spool_directory, folder))
+
+    def spool_send(self):
+        with self.settings(
+            EMAILER_SPOOL_DIRECTORY=self.spool_directory,
+            SITE_ID=self.profile_instance.site_ptr.id,
+        ):
+            call_command(
+                'send_bulk_email',
+            )
+
+    def deliver(self, connection=None, **kwargs):
+        with self.settings(
+            EMAILER_SPOOL_DIRECTORY=self.spool_directory,
+            EMAILER_THROTTLE_RETRIES=0,
+        ):
+            if connection:
+                with patch(
+                    'django_simple_bulk_emailer.sending.get_connection',
+                    return_value=connection,
+                ):
+                    call_test_command(self, **kwargs)
+            else:
+                call_test_command(self, **kwargs)
+
+    def test_spooled_send(self):
+        self.spool_send()
+        check_quantity_email_sent(
+            self,
+            0,
+        )
+        self.assertEqual(len(self.spooled_names('new')), 3, 'Messages were not written to the spool')
+        self.test_instance = get_tracker(self.headline)
+        attribute_equals(
+            self,
+            {
+                'sending': False,
+                'number_sent': 0,
+            },
+            command=True,
+        )
+        self.deliver()
+        self.assertEqual(sorted(parseaddr(message.to[0])[1] for message in mail.outbox), [f'subscriber_{number}@example.com' for number in range(3)], 'Spooled messages were not delivered to their recipients')
+        self.assertEqual(mail.outbox[0].message()['Subject'], mail.outbox[0].subject, 'The spooled message was not delivered intact')
+        self.assertEqual(self.spooled_names('new') + self.spooled_names('cur'), [], 'Delivered messages were left in the spool')
+        self.test_instance = get_tracker(self.headline)
+        attribute_equals(
+            self,
+            {
+                'number_sent': 3,
+            },
+            command=True,
+        )
+
+    def test_spooled_send_record(self):
+        self.spool_send()
+        self.test_instance = SendRecord.objects.get()
+        attribute_equals(
+            self,
+            {
+                'number_sent': 0,
+            },
+            command=True,
+        )
+        self.deliver()
+        self.test_instance = SendRecord.objects.get()
+        attribute_equals(
+            self,
+            {
+                'number_sent': 3,
+                'number_failed': 0,
+            },
+            command=True,
+        )
+
+    def test_spooled_failure(self):
+        self.spool_send()
+        self.deliver(ThrottlingConnection(throttle_count=1, code=550))
+        self.assertEqual(FailedDelivery.objects.filter(status=FailedDelivery.DEAD).count(), 1, 'A refused spooled message was not recorded as a failed delivery')
+        self.assertEqual(self.spooled_names('cur'), [], 'A refused message was left in the spool')
+        self.assertEqual(get_tracker(self.headline).number_sent, 2, 'A refused spooled message was counted as sent')
+
+    def test_interrupted_delivery(self):
+        self.spool_send()
+        ''' Leave one message claimed, as if a delivery run had stopped '''
+        next(Spool(self.spool_directory).claim())
+        self.deliver()
+        check_quantity_email_sent(
+            self,
+            2,
+        )
+        self.deliver(resume=True)
+        check_quantity_email_sent(
+            self,
+            3,
+        )
+
+    def test_slow_delivery_keeps_claim(self):
+        self.spool_send()
+        spool = Spool(self.spool_directory)
+        ''' Another delivery run releases expired claims while the batch is still being delivered '''
+        connection = SlowConnection(
+            delay=0.6,
+            during_send=lambda: spool.release(lease=0.2),
+        )
+        with self.settings(
+            EMAILER_SEND_LEASE=0.2,
+        ):
+            self.deliver(connection)
+        self.assertEqual(sorted(parseaddr(message.to[0])[1] for message in connection.sent), [f'subscriber_{number}@example.com' for number in range(3)], 'Messages were not delivered exactly once')
+        self.assertEqual(self.spooled_names('new') + self.spooled_names('cur'), [], 'Messages being delivered were released to another run')
+
+
+class FlushOpenEventsTests(MixinWrap.BaseMixin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def setUp(self):
+        self.test_command = 'flush_open_events'
+        self.buffer_directory = mkdtemp()
+        self.open_buffer = OpenBuffer(self.buffer_directory)
+        self.tracker = create_tracker()
+        self.earlier = fake_now().timestamp()
+        super().setUp()
+
+    def tearDown(self):
+        rmtree(self.buffer_directory)
+        super().tearDown()
+
+    def buffered_names(self, folder):
+        return listdir(path.join(self.buffer_directory, folder))
+
+    def flush(self, **kwargs):
+        with self.settings(
+            EMAILER_OPEN_BUFFER_DIRECTORY=self.buffer_directory,
+        ):
+            call_test_command(self, **kwargs)
+
+    def test_flush(self):
+        self.open_buffer.append(self.tracker.pk, 'test_key_1', self.earlier + 10)
+        self.open_buffer.append(self.tracker.pk, 'test_key_1', self.earlier)
+        self.open_buffer.append(self.tracker.pk, 'test key 2', self.earlier + 20)
+        self.open_buffer.append(self.tracker.pk + 1, 'test_key_3', self.earlier)
+        self.open_buffer.append(self.tracker.pk, 'x' * 256, self.earlier)
+        with open(path.join(self.buffer_directory, 'open', self.buffered_names('open')[0]), 'a') as buffer_file:
+            buffer_file.write(f'{self.tracker.pk} {self.earlier} test_ke')
+        with self.assertNumQueries(14):
+            self.flush()
+        self.assertEqual(dict(self.tracker.open_events.values_list('subscriber_key', 'opened')), {'test_key_1': fake_now(), 'test key 2': fake_now() + timedelta(seconds=20)}, 'Buffered opens were not saved once each at their earliest time')
+        self.assertEqual(self.buffered_names('open') + self.buffered_names('cur'), [], 'Saved opens were left in the buffer')
+
+    def test_flush_current_minute(self):
+        self.open_buffer.append(self.tracker.pk, 'test_key_1')
+        self.flush()
+        self.assertEqual(self.tracker.open_count(), 0, 'Opens from the current minute were saved while still being written')
+        self.flush(all=True)
+        self.assertEqual(self.tracker.open_count(), 1, 'Opens from the current minute were not saved with --all')
+
+    def test_flush_folds_opens(self):
+        subscriber = create_subscriber()
+        token_subscriber = create_subscriber(
+            subscriber_email='token@example.com',
+        )
+        open_bitmap = OpenBitmap(
+            tracker=self.tracker,
+            first_month=get_month_number(fake_now()),
+        )
+        open_bitmap.set_recipients([subscriber.pk, token_subscriber.pk])
+        open_bitmap.save()
+        self.open_buffer.append(self.tracker.pk, subscriber.subscriber_key, self.earlier)
+        self.open_buffer.append(self.tracker.pk, f'pk-{token_subscriber.pk}', self.earlier)
+        self.open_buffer.append(self.tracker.pk, 'test_key_1', self.earlier)
+        with self.settings(
+            EMAILER_OPEN_FLUSH_BATCH_SIZE=1,
+        ):
+            self.flush()
+        self.assertEqual(list(self.tracker.open_events.values_list('subscriber_key', flat=True)), ['test_key_1'], 'Opens by recipients in the snapshot were not folded into the bitmap')
+        open_bitmap = OpenBitmap.objects.get(pk=open_bitmap.pk)
+        self.assertTrue(open_bitmap.is_open(0) and open_bitmap.is_open(1), 'The opens were not set in the bitmap')
+        self.assertEqual(self.tracker.month_open_count(2020, 1), 3, 'Folded and unfolded opens were not both counted')
+        OpenEvent.objects.create(
+            tracker=self.tracker,
+            subscriber_key=f'pk-{subscriber.pk}',
+            opened=fake_now(),
+        )
+        self.assertEqual((self.tracker.open_count(), self.tracker.month_open_count(2020, 1)), (3, 3), 'A repeat open waiting to be folded was counted after the first was folded')
+        self.open_buffer.append(self.tracker.pk, subscriber.subscriber_key, self.earlier + 10)
+        self.flush()
+        self.assertEqual(list(self.tracker.open_events.values_list('subscriber_key', flat=True)), ['test_key_1'], 'Repeat opens by recipients in the snapshot were not folded')
+        self.assertEqual((self.tracker.open_count(), self.tracker.month_open_count(2020, 1)), (3, 3), 'A repeat open was counted after the first was folded')
+        self.assertEqual(self.tracker.opener_sketches.get().estimate(), 3, "A subscriber's opens by key and by signed token were not counted as one opener")
+
+    def test_flush_saved_open(self):
+        self.open_buffer.append(self.tracker.pk, 'test_key_1', self.earlier)
+        self.flush()
+        self.open_buffer.append(self.tracker.pk, 'test_key_1', self.earlier - 10)
+        self.flush()
+        self.assertEqual(list(self.tracker.open_events.values_list('opened', flat=True)), [fake_now()], 'A saved open was changed by a later flush')
+
+    def test_query_plan(self):
+        subscriber = create_subscriber()
+        open_bitmap = OpenBitmap(
+            tracker=self.tracker,
+            first_month=get_month_number(fake_now()),
+        )
+        open_bitmap.set_recipients([subscriber.pk])
+        open_bitmap.save()
+        self.open_buffer.append(self.tracker.pk, subscriber.subscriber_key, self.earlier)
+        self.open_buffer.append(self.tracker.pk, 'test_key_1', self.earlier)
+        ''' Opens waiting to be folded are read in full, since every one of them is folded '''
+        with CaptureQueriesContext(connection) as queries:
+            self.flush()
+        check_query_plans(
+            self,
+            queries,
+            [
+                EmailTracker,
+                OpenBitmap,
+                OpenerSketch,
+                Subscriber,
+            ],
+        )
+
+
 class ImportSitesTests(MixinWrap.BaseMixin):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -273,6 +613,134 @@ class ImportSitesTests(MixinWrap.BaseMixin):
         )
 
 
+class RetryFailedDeliveriesTests(MixinWrap.BaseMixin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def setUp(self):
+        self.profile_instance = create_site_profile()
+        self.test_command = 'retry_failed_deliveries'
+        self.list_name = 'Test list'
+        self.headline = 'Headline for testing failed deliveries'
+        self.subscription = create_subscription(
+            list_name=self.list_name,
+        )
+        create_email(
+            list_name=self.list_name,
+            headline=self.headline,
+            sendable=True,
+        )
+        for number in range(3):
+            subscriber = create_subscriber(
+                subscriber_email=f'subscriber_{number}@example.com',
+            )
+            subscriber.subscriptions.add(self.subscription)
+        super().setUp()
+
+    def send_with(self, connection):
+        with patch(
+            'django_simple_bulk_emailer.sending.get_connection',
+            return_value=connection,
+        ):
+            with self.settings(
+                EMAILER_THROTTLE_RETRIES=0,
+            ):
+                with self.settings(
+                    SITE_ID=self.profile_instance.site_ptr.id,
+                ):
+                    call_command(
+                        'send_bulk_email',
+                    )
+
+    def retry_with(self, connection):
+        FailedDelivery.objects.update(
+            next_attempt=timezone.now() - timedelta(seconds=1),
+        )
+        with patch(
+            'django_simple_bulk_emailer.sending.get_connection',
+            return_value=connection,
+        ):
+            call_test_command(self)
+
+    def test_permanent_failure_dead_lettered(self):
+        connection = ThrottlingConnection(throttle_count=1, code=550)
+        self.send_with(connection)
+        failed_delivery = FailedDelivery.objects.get()
+        self.assertEqual(failed_delivery.status, FailedDelivery.DEAD, 'A permanently refused recipient was not dead-lettered')
+        self.assertEqual(failed_delivery.error_class, 'SMTPRecipientsRefused', 'The error class was not recorded')
+        self.assertIsNone(failed_delivery.next_attempt, 'A dead-lettered recipient was scheduled for another attempt')
+        self.assertEqual(get_tracker(self.headline).number_sent, 2, 'Refused recipients were counted as sent')
+
+    def test_transient_failure_redelivered(self):
+        self.send_with(ThrottlingConnection(throttle_count=100))
+        self.assertEqual(FailedDelivery.objects.filter(status=FailedDelivery.RETRYING).count(), 3, 'Throttled recipients were not queued for retry')
+        self.assertTrue(all(failed_delivery.next_attempt > timezone.now() for failed_delivery in FailedDelivery.objects.all()), 'Retries were not scheduled after a delay')
+        connection = ThrottlingConnection(throttle_count=0)
+        self.retry_with(connection)
+        self.assertEqual(len(connection.sent), 3, 'Queued recipients were not redelivered')
+        self.assertFalse(FailedDelivery.objects.exists(), 'Redelivered recipients were left in the retry queue')
+        self.assertEqual(get_tracker(self.headline).number_sent, 3, 'Redelivered recipients were not counted as sent')
+        send_record = SendRecord.objects.get()
+        self.assertEqual((send_record.number_sent, send_record.number_failed), (3, 0), 'Redelivered recipients were not counted in the send history')
+
+    def test_retries_not_due_skipped(self):
+        self.send_with(ThrottlingConnection(throttle_count=100))
+        connection = ThrottlingConnection(throttle_count=0)
+        with patch(
+            'django_simple_bulk_emailer.sending.get_connection',
+            return_value=connection,
+        ):
+            call_test_command(self)
+        self.assertEqual(len(connection.sent), 0, 'Recipients were redelivered before their retry was due')
+        self.assertEqual(FailedDelivery.objects.count(), 3, 'Recipients were removed from the retry queue before their retry was due')
+
+    def test_backoff_and_retry_limit(self):
+        self.send_with(ThrottlingConnection(throttle_count=100))
+        with self.settings(
+            EMAILER_RETRY_LIMIT=3,
+            EMAILER_RETRY_DELAY=60,
+            EMAILER_THROTTLE_RETRIES=0,
+        ):
+            self.retry_with(ThrottlingConnection(throttle_count=100))
+            failed_delivery = FailedDelivery.objects.first()
+            self.assertEqual(failed_delivery.attempts, 2, 'The attempt count was not increased')
+            self.assertEqual(failed_delivery.status, FailedDelivery.RETRYING, 'A recipient was dead-lettered before the retry limit')
+            self.assertGreater(failed_delivery.next_attempt, timezone.now() + timedelta(seconds=100), 'The retry delay did not back off')
+            self.retry_with(ThrottlingConnection(throttle_count=100))
+        self.assertEqual(FailedDelivery.objects.filter(status=FailedDelivery.DEAD).count(), 3, 'Recipients were not dead-lettered at the retry limit')
+
+    def test_unsubscribed_not_retried(self):
+        self.send_with(ThrottlingConnection(throttle_count=100))
+        for subscriber in Subscriber.objects.all():
+            subscriber.subscriptions.remove(self.subscription)
+        connection = ThrottlingConnection(throttle_count=0)
+        self.retry_with(connection)
+        self.assertEqual(len(connection.sent), 0, 'Recipients who unsubscribed were redelivered')
+        self.assertFalse(FailedDelivery.objects.exists(), 'Recipients who unsubscribed were left in the retry queue')
+
+    def test_interrupted_retry_saves_delivered(self):
+        self.send_with(ThrottlingConnection(throttle_count=100))
+        calls = []
+
+        def interrupt_third_send():
+            calls.append(None)
+            if len(calls) == 3:
+                raise RuntimeError('Interrupted retry')
+
+        connection = SlowConnection(
+            delay=0,
+            during_send=interrupt_third_send,
+        )
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=1,
+        ):
+            with self.assertRaises(RuntimeError):
+                self.retry_with(connection)
+        self.assertEqual(len(connection.sent), 2, 'The retries before the interruption were not delivered')
+        self.assertEqual(FailedDelivery.objects.count(), 1, 'Recipients delivered before the interruption were left in the retry queue')
+        self.assertEqual(get_tracker(self.headline).number_sent, 2, 'Recipients delivered before the interruption were not counted as sent')
+
+
 class SendBulkEmailTests(MixinWrap.BaseMixin):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -409,180 +877,1281 @@ class SendBulkEmailTests(MixinWrap.BaseMixin):
                 body_text_two,
             ],
         )
-        call_test_command(self)
-        check_email(
+        call_test_command(self)
+        check_email(
+            self,
+            email_number=1,
+            text_strings=[
+                body_text_one,
+            ],
+        )
+
+    def test_sort_order_updated(self):
+        self.subscription_one = create_subscription(
+            list_name=self.list_one_name,
+        )
+        body_text_one = 'Newer update body text'
+        body_text_two = 'Older update body text'
+        updated_email = create_email(
+            list_name=self.list_one_name,
+            body_text=body_text_one,
+            sendable=True,
+        )
+        create_email(
+            list_name=self.list_one_name,
+            body_text=body_text_two,
+            sendable=True,
+        )
+        updated_email.save()
+        create_subscriber_subscription_state(
+            self,
+            self.subscriber_one_email,
+            'Anonymous',
+            'Subscriber',
+            2,
+        )
+        call_test_command(self)
+        check_email(
+            self,
+            text_strings=[
+                body_text_two,
+            ],
+        )
+        call_test_command(self)
+        check_email(
+            self,
+            email_number=1,
+            text_strings=[
+                body_text_one,
+            ],
+        )
+
+    def test_email_content(self):
+        test_headline = 'Headline for testing email content'
+        self.subscription_one = create_subscription(
+            list_name=self.list_one_name,
+        )
+        create_email(
+            headline=test_headline,
+            list_name=self.list_one_name,
+            sendable=True,
+        )
+        subscriber = create_subscriber_subscription_state(
+            self,
+            self.subscriber_one_email,
+            'Anonymous',
+            'Subscriber',
+            2,
+        )
+        call_test_command(self)
+        tracker = get_tracker(test_headline)
+        tracking_url = reverse(
+            'django_simple_bulk_emailer:opened_email',
+            kwargs={
+                'pk': tracker.pk,
+                'subscriber_key': subscriber.subscriber_key,
+            },
+        )
+        '''
+        Checking email:
+            * is correct instance
+            * is using text and HTML templates correctly
+            * has correct protocol_domain
+            * has correct tracking image
+        '''
+        check_email(
+            self,
+            subject=test_headline,
+            text_strings=[
+                'To unsubscribe, go to:',
+                'http://127.0.0.1:8000',
+            ],
+            html_strings=[
+                '<!DOCTYPE html>',
+                tracking_url,
+            ],
+        )
+
+    def test_attributes_after_sending(self):
+        create_subscription(
+            list_name=self.list_one_name,
+        )
+        bulk_email = create_email(
+            list_name=self.list_one_name,
+            sendable=True,
+        )
+        call_test_command(self)
+        bulk_email.refresh_from_db()
+        self.test_instance = bulk_email
+        attribute_equals(
+            self,
+            {
+                'sendable': False,
+                'sending': False,
+            },
+            command=True,
+        )
+
+    def test_send_record(self):
+        with patch(
+            'django_simple_bulk_emailer.management.commands.send_bulk_email.timezone.now',
+            fake_now,
+        ):
+            create_subscription(
+                list_name=self.list_one_name,
+            )
+            bulk_email = create_email(
+                list_name=self.list_one_name,
+                sendable=True,
+            )
+            for number in range(2):
+                subscriber = create_subscriber(
+                    subscriber_email=f'subscriber_{number}@example.com',
+                )
+                subscriber.subscriptions.add(bulk_email.subscription_list)
+            call_test_command(self)
+            self.test_instance = bulk_email.send_records().get()
+            attribute_equals(
+                self,
+                {
+                    'completed': fake_now(),
+                    'subscription_name': self.list_one_name,
+                    'number_sent': 2,
+                    'number_failed': 0,
+                    'tracker': EmailTracker.objects.get(),
+                },
+                command=True,
+            )
+
+    def test_tracker_attributes(self):
+        with patch(
+            'django_simple_bulk_emailer.management.commands.send_bulk_email.timezone.now',
+            fake_now,
+        ):
+            test_headline = 'Headline for testing tracker'
+            self.subscription_one = create_subscription(
+                list_name=self.list_one_name,
+            )
+            create_email(
+                list_name=self.list_one_name,
+                headline=test_headline,
+                sendable=True,
+            )
+            create_subscriber_subscription_state(
+                self,
+                self.subscriber_one_email,
+                'Anonymous',
+                'Subscriber',
+                2,
+            )
+            call_test_command(self)
+            self.test_instance = get_tracker(test_headline)
+            attribute_equals(
+                self,
+                {
+                    'subject': test_headline,
+                    'subscription_name': self.list_one_name,
+                    'send_complete': fake_now(),
+                    'number_sent': 1,
+                },
+                command=True,
+            )
+
+    def test_connection_reused(self):
+        test_headline = 'Headline for testing connection reuse'
+        self.subscription_one = create_subscription(
+            list_name=self.list_one_name,
+        )
+        create_email(
+            list_name=self.list_one_name,
+            headline=test_headline,
+            sendable=True,
+        )
+        for number in range(5):
+            subscriber = create_subscriber(
+                subscriber_email=f'subscriber_{number}@example.com',
+            )
+            subscriber.subscriptions.add(self.subscription_one)
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+        ):
+            call_test_command(self)
+        check_quantity_email_sent(
+            self,
+            5,
+        )
+        self.test_instance = get_tracker(test_headline)
+        attribute_equals(
+            self,
+            {
+                'number_sent': 5,
+                'connection_count': 1,
+            },
+            command=True,
+        )
+
+    def create_queued_emails(self, email_count):
+        self.subscription_one = create_subscription(
+            list_name=self.list_one_name,
+        )
+        for number in range(email_count):
+            create_email(
+                list_name=self.list_one_name,
+                headline=f'Headline for queued email {number}',
+                sendable=True,
+            )
+        for number in range(2):
+            subscriber = create_subscriber(
+                subscriber_email=f'subscriber_{number}@example.com',
+            )
+            subscriber.subscriptions.add(self.subscription_one)
+
+    def test_drain(self):
+        self.create_queued_emails(3)
+        call_test_command(
+            self,
+            drain=True,
+        )
+        check_quantity_email_sent(
+            self,
+            6,
+        )
+        trackers = EmailTracker.objects.all()
+        self.assertEqual(len(trackers), 3, f"For command '{self.test_command}', draining did not send every queued email")
+        self.assertEqual(sum(tracker.connection_count for tracker in trackers), 1, f"For command '{self.test_command}', draining did not reuse the mail connection between emails")
+
+    def test_max_emails(self):
+        self.create_queued_emails(3)
+        call_test_command(
+            self,
+            max_emails=2,
+        )
+        check_quantity_email_sent(
+            self,
+            4,
+        )
+        self.assertEqual(EmailTracker.objects.count(), 2, f"For command '{self.test_command}', the email limit was not applied")
+
+    def test_time_budget(self):
+        self.create_queued_emails(2)
+        call_test_command(
+            self,
+            time_budget=0,
+        )
+        check_quantity_email_sent(
+            self,
+            0,
+        )
+        call_test_command(
+            self,
+            time_budget=60,
+        )
+        check_quantity_email_sent(
+            self,
+            4,
+        )
+
+    def test_reconnect_after_disconnect(self):
+        test_headline = 'Headline for testing reconnection'
+        self.subscription_one = create_subscription(
+            list_name=self.list_one_name,
+        )
+        create_email(
+            list_name=self.list_one_name,
+            headline=test_headline,
+            sendable=True,
+        )
+        for number in range(3):
+            subscriber = create_subscriber(
+                subscriber_email=f'subscriber_{number}@example.com',
+            )
+            subscriber.subscriptions.add(self.subscription_one)
+        connection = DroppingConnection(drop_at=2)
+        with patch(
+            'django_simple_bulk_emailer.sending.get_connection',
+            return_value=connection,
+        ):
+            call_test_command(self)
+        self.assertEqual(len(connection.sent), 3, 'A message was lost or duplicated after the connection dropped')
+        self.test_instance = get_tracker(test_headline)
+        attribute_equals(
+            self,
+            {
+                'number_sent': 3,
+                'connection_count': 2,
+            },
+            command=True,
+        )
+
+    def test_worker_threads(self):
+        test_headline = 'Headline for testing worker threads'
+        self.subscription_one = create_subscription(
+            list_name=self.list_one_name,
+        )
+        create_email(
+            list_name=self.list_one_name,
+            headline=test_headline,
+            sendable=True,
+        )
+        for number in range(7):
+            subscriber = create_subscriber(
+                subscriber_email=f'subscriber_{number}@example.com',
+            )
+            subscriber.subscriptions.add(self.subscription_one)
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+        ):
+            call_test_command(
+                self,
+                workers=3,
+            )
+        check_quantity_email_sent(
+            self,
+            7,
+        )
+        recipients = sorted(email.to[0] for email in mail.outbox)
+        expected = sorted(f'"Anonymous Subscriber" <subscriber_{number}@example.com>' for number in range(7))
+        self.assertEqual(recipients, expected, f"For command '{self.test_command}', worker threads did not send one email to each subscriber")
+        self.test_instance = get_tracker(test_headline)
+        attribute_equals(
+            self,
+            {
+                'number_sent': 7,
+            },
+            command=True,
+        )
+        error_msg = f"For command '{self.test_command}', worker threads opened more connections than there were workers"
+        self.assertTrue(1 <= self.test_instance.connection_count <= 3, error_msg)
+
+    def test_worker_batch_failure(self):
+        self.sharded_headline = 'Headline for testing failed worker batches'
+        self.create_sharded_send(5)
+        deliver = BulkMailer.deliver
+
+        def failing_deliver(mailer, batch):
+            if any(subscriber.subscriber_email == 'subscriber_2@example.com' for subscriber, message in batch):
+                raise RuntimeError('Failed batch')
+            return deliver(mailer, batch)
+
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+        ):
+            with patch(
+                'django_simple_bulk_emailer.sending.BulkMailer.deliver',
+                failing_deliver,
+            ):
+                call_test_command(
+                    self,
+                    workers=2,
+                )
+            call_test_command(
+                self,
+                resume=True,
+            )
+        recipients = sorted(email.to[0] for email in mail.outbox)
+        expected = [f'"Anonymous Subscriber" <subscriber_{number}@example.com>' for number in [0, 1, 4]]
+        self.assertEqual(recipients, expected, f"For command '{self.test_command}', the batches around a failed batch were not each sent once")
+        self.test_instance = get_tracker(self.sharded_headline)
+        failed_emails = sorted(self.test_instance.failed_deliveries.values_list('subscriber__subscriber_email', flat=True))
+        self.assertEqual(failed_emails, ['subscriber_2@example.com', 'subscriber_3@example.com'], f"For command '{self.test_command}', the recipients of the failed batch were not kept for retrying")
+        attribute_equals(
+            self,
+            {
+                'number_sent': 3,
+                'sending': False,
+            },
+            command=True,
+        )
+
+    def create_sharded_send(self, subscriber_count):
+        self.subscription_one = create_subscription(
+            list_name=self.list_one_name,
+        )
+        bulk_email = create_email(
+            list_name=self.list_one_name,
+            headline=self.sharded_headline,
+            sendable=True,
+        )
+        for number in range(subscriber_count):
+            subscriber = create_subscriber(
+                subscriber_email=f'subscriber_{number}@example.com',
+            )
+            subscriber.subscriptions.add(self.subscription_one)
+        return bulk_email
+
+    def test_sharded_worker(self):
+        self.sharded_headline = 'Headline for testing sharded sends'
+        bulk_email = self.create_sharded_send(5)
+        with self.settings(
+            EMAILER_SHARD_SIZE=2,
+        ):
+            call_test_command(
+                self,
+                worker=True,
+            )
+        check_quantity_email_sent(
+            self,
+            5,
+        )
+        self.test_instance = get_tracker(self.sharded_headline)
+        attribute_equals(
+            self,
+            {
+                'number_sent': 5,
+                'sending': False,
+                'email_pk': bulk_email.pk,
+            },
+            command=True,
+        )
+        batch_statuses = list(self.test_instance.batches.values_list('status', flat=True))
+        self.assertEqual(batch_statuses, [SendBatch.DONE] * 3, f"For command '{self.test_command}', the batches were not all sent")
+        bulk_email.refresh_from_db()
+        self.test_instance = bulk_email
+        attribute_equals(
+            self,
+            {
+                'sendable': False,
+                'sending': False,
+            },
+            command=True,
+        )
+        self.assertEqual(bulk_email.send_records().count(), 1, f"For command '{self.test_command}', the send history was not written once")
+
+    def test_sharded_worker_shares_batches(self):
+        self.sharded_headline = 'Headline for testing shared batches'
+        bulk_email = self.create_sharded_send(5)
+        with self.settings(
+            EMAILER_SHARD_SIZE=2,
+        ):
+            ''' Another worker holds the second batch while this one runs '''
+            with patch(
+                'django_simple_bulk_emailer.management.commands.send_bulk_email.Command.send_batch',
+                return_value=False,
+            ):
+                call_test_command(
+                    self,
+                    worker=True,
+                )
+            tracker = get_tracker(self.sharded_headline)
+            held_batch = tracker.batches.all()[1]
+            held_batch.status = SendBatch.CLAIMED
+            held_batch.claimed_by = 'other-worker'
+            held_batch.save()
+            call_test_command(
+                self,
+                worker=True,
+            )
+            check_quantity_email_sent(
+                self,
+                3,
+                clear_outbox=True,
+            )
+            tracker.refresh_from_db()
+            self.assertTrue(tracker.sending, f"For command '{self.test_command}', the send finished while a batch was still claimed")
+            ''' The other worker gives the batch back and a worker picks it up '''
+            held_batch.status = SendBatch.PENDING
+            held_batch.save()
+            call_test_command(
+                self,
+                worker=True,
+            )
+        check_quantity_email_sent(
+            self,
+            2,
+        )
+        self.test_instance = get_tracker(self.sharded_headline)
+        attribute_equals(
+            self,
+            {
+                'number_sent': 5,
+                'sending': False,
+            },
+            command=True,
+        )
+        bulk_email.refresh_from_db()
+        self.assertFalse(bulk_email.sending, f"For command '{self.test_command}', the email was not released after the last batch")
+        self.assertEqual(bulk_email.send_records().count(), 1, f"For command '{self.test_command}', the send history was not written once")
+
+    def interrupt_send(self, **kwargs):
+        """ """
+        ''' Fail while creating the third message, after the first batch of two has been delivered '''
+        create_message = EmailSend.create_message
+        calls = []
+
+        def failing_create_message(email_send, subscriber):
+            calls.append(subscriber)
+            if len(calls) == 3:
+                raise RuntimeError('Interrupted send')
+            return create_message(email_send, subscriber)
+
+        with patch(
+            'django_simple_bulk_emailer.sending.EmailSend.create_message',
+            failing_create_message,
+        ):
+            with self.assertRaises(RuntimeError):
+                call_test_command(
+                    self,
+                    **kwargs,
+                )
+        check_quantity_email_sent(
+            self,
+            2,
+            clear_outbox=True,
+        )
+
+    def check_resumed_send(self, bulk_email):
+        check_quantity_email_sent(
+            self,
+            3,
+        )
+        self.test_instance = get_tracker(self.sharded_headline)
+        attribute_equals(
+            self,
+            {
+                'number_sent': 5,
+                'sending': False,
+            },
+            command=True,
+        )
+        bulk_email.refresh_from_db()
+        self.assertFalse(bulk_email.sending, f"For command '{self.test_command}', the email was not released after resuming")
+        self.assertEqual(bulk_email.send_records().count(), 1, f"For command '{self.test_command}', the send history was not written once")
+
+    def test_resume_send(self):
+        self.sharded_headline = 'Headline for testing resumed sends'
+        bulk_email = self.create_sharded_send(5)
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+        ):
+            self.interrupt_send()
+            tracker = get_tracker(self.sharded_headline)
+            subscriber_pks = list(Subscriber.objects.order_by('pk').values_list('pk', flat=True))
+            self.assertEqual(tracker.checkpoint_pk, subscriber_pks[1], f"For command '{self.test_command}', the checkpoint was not saved after the delivered batch")
+            self.assertEqual(tracker.number_sent, 2, f"For command '{self.test_command}', the delivered batch was not counted")
+            self.assertTrue(tracker.sending, f"For command '{self.test_command}', the interrupted send was marked finished")
+            ''' Without --resume, the interrupted email is not picked up again '''
+            call_test_command(
+                self,
+            )
+            check_quantity_email_sent(
+                self,
+                0,
+            )
+            call_test_command(
+                self,
+                resume=True,
+            )
+        self.check_resumed_send(bulk_email)
+
+    def test_resume_sharded_worker(self):
+        self.sharded_headline = 'Headline for testing resumed workers'
+        bulk_email = self.create_sharded_send(5)
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+            EMAILER_SHARD_SIZE=4,
+        ):
+            self.interrupt_send(worker=True)
+            tracker = get_tracker(self.sharded_headline)
+            first_batch = tracker.batches.all()[0]
+            self.assertEqual(first_batch.status, SendBatch.CLAIMED, f"For command '{self.test_command}', the interrupted batch was not left claimed")
+            self.assertEqual(first_batch.number_sent, 2, f"For command '{self.test_command}', the delivered part of the batch was not counted")
+            call_test_command(
+                self,
+                worker=True,
+                resume=True,
+            )
+        self.check_resumed_send(bulk_email)
+
+    def run_out_of_time(self, **kwargs):
+        """ """
+        ''' Let a minute pass for every message delivered, so a half-minute budget runs out after the first batch of two '''
+        with patch(
+            'django_simple_bulk_emailer.management.commands.send_bulk_email.monotonic',
+            lambda: len(mail.outbox) * 60,
+        ):
+            call_test_command(
+                self,
+                time_budget=30,
+                **kwargs,
+            )
+        check_quantity_email_sent(
+            self,
+            2,
+            clear_outbox=True,
+        )
+
+    def test_time_budget_partway(self):
+        self.sharded_headline = 'Headline for testing sends stopped partway'
+        bulk_email = self.create_sharded_send(5)
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+        ):
+            self.run_out_of_time()
+            tracker = get_tracker(self.sharded_headline)
+            self.assertEqual(tracker.number_sent, 2, f"For command '{self.test_command}', the batch delivered before the time budget ran out was not counted")
+            self.assertTrue(tracker.sending, f"For command '{self.test_command}', the stopped send was marked finished")
+            self.assertIsNone(tracker.lease_expires, f"For command '{self.test_command}', the stopped send was not released")
+            ''' Without --resume, the released send is picked up again '''
+            call_test_command(
+                self,
+            )
+        self.check_resumed_send(bulk_email)
+
+    def test_time_budget_partway_worker(self):
+        self.sharded_headline = 'Headline for testing batches stopped partway'
+        bulk_email = self.create_sharded_send(5)
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+            EMAILER_SHARD_SIZE=4,
+        ):
+            self.run_out_of_time(worker=True)
+            first_batch = get_tracker(self.sharded_headline).batches.all()[0]
+            self.assertEqual(first_batch.status, SendBatch.PENDING, f"For command '{self.test_command}', the stopped batch was not released")
+            self.assertEqual(first_batch.number_sent, 2, f"For command '{self.test_command}', the part of the batch delivered before the time budget ran out was not counted")
+            call_test_command(
+                self,
+                worker=True,
+            )
+        self.check_resumed_send(bulk_email)
+
+    def check_deleted_email(self, bulk_email, **kwargs):
+        bulk_email.delete()
+        output = StringIO()
+        call_test_command(
+            self,
+            resume=True,
+            stderr=output,
+            **kwargs,
+        )
+        check_quantity_email_sent(
+            self,
+            0,
+        )
+        self.test_instance = get_tracker(self.sharded_headline)
+        attribute_equals(
+            self,
+            {
+                'number_sent': 2,
+                'sending': False,
+            },
+            command=True,
+        )
+        self.assertFalse(self.test_instance.batches.exclude(status=SendBatch.DONE).exists(), f"For command '{self.test_command}', batches of a deleted email were left to be claimed")
+        self.assertIn('because the email was deleted', output.getvalue(), f"For command '{self.test_command}', the stopped send was not reported")
+
+    def test_resume_deleted_email(self):
+        self.sharded_headline = 'Headline for testing deleted emails'
+        bulk_email = self.create_sharded_send(5)
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+        ):
+            self.interrupt_send()
+            self.check_deleted_email(bulk_email)
+
+    def test_resume_deleted_email_worker(self):
+        self.sharded_headline = 'Headline for testing deleted emails with workers'
+        bulk_email = self.create_sharded_send(5)
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+            EMAILER_SHARD_SIZE=4,
+        ):
+            self.interrupt_send(worker=True)
+            self.check_deleted_email(bulk_email, worker=True)
+
+    def test_next_email_selection(self):
+        for number in range(4):
+            create_subscription(
+                list_name=f'Ranked list {number}',
+                sort_order=4 - number,
+            )
+        create_email(
+            list_name='Ranked list 1',
+            headline='Queued first for a lower-ranked list',
+            sendable=True,
+        )
+        create_email(
+            list_name='Ranked list 2',
+            headline='Queued last for a higher-ranked list',
+            sendable=True,
+        )
+        create_email(
+            list_name='Ranked list 2',
+            headline='Queued later for a higher-ranked list',
+            sendable=True,
+        )
+        with self.assertNumQueries(2):
+            email_instance = Command().get_next_email()
+        self.assertEqual(email_instance.headline, 'Queued last for a higher-ranked list', f"For command '{self.test_command}', the oldest email for the highest-ranked list was not chosen")
+
+    def test_claim_race(self):
+        self.sharded_headline = 'Headline for testing claim races'
+        bulk_email = self.create_sharded_send(2)
+        ''' Another instance claims the email after this one has read it '''
+        BulkEmail.objects.filter(
+            pk=bulk_email.pk,
+        ).update(
+            sendable=False,
+        )
+        with patch(
+            'django_simple_bulk_emailer.management.commands.send_bulk_email.Command.get_next_email',
+            side_effect=[bulk_email, None],
+        ):
+            call_test_command(self)
+        check_quantity_email_sent(
+            self,
+            0,
+        )
+        self.assertFalse(EmailTracker.objects.exists(), f"For command '{self.test_command}', an email claimed by another instance was sent")
+
+    def test_expired_lease_reclaimed(self):
+        self.sharded_headline = 'Headline for testing send leases'
+        bulk_email = self.create_sharded_send(5)
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+        ):
+            self.interrupt_send()
+            tracker = get_tracker(self.sharded_headline)
+            self.assertTrue(tracker.claimed_by, f"For command '{self.test_command}', the send was not claimed with an owner token")
+            self.assertGreater(tracker.lease_expires, timezone.now(), f"For command '{self.test_command}', the send lease was not set")
+            ''' The lease is still held, so the send is left alone '''
+            call_test_command(self)
+            check_quantity_email_sent(
+                self,
+                0,
+            )
+            tracker.lease_expires = timezone.now() - timedelta(seconds=1)
+            tracker.save()
+            call_test_command(self)
+        self.check_resumed_send(bulk_email)
+
+    def take_over_send(self, taken_over, **kwargs):
+        """ """
+        ''' Another process takes the send over while the third message is being created, after the first batch of two has been delivered '''
+        create_message = EmailSend.create_message
+        calls = []
+
+        def taking_over_create_message(email_send, subscriber):
+            calls.append(subscriber)
+            if len(calls) == 3:
+                taken_over.update(
+                    claimed_by='other-worker',
+                )
+            return create_message(email_send, subscriber)
+
+        with patch(
+            'django_simple_bulk_emailer.sending.EmailSend.create_message',
+            taking_over_create_message,
+        ):
+            call_test_command(
+                self,
+                **kwargs,
+            )
+        return calls
+
+    def test_lease_taken_over(self):
+        self.sharded_headline = 'Headline for testing lost send leases'
+        bulk_email = self.create_sharded_send(5)
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+        ):
+            calls = self.take_over_send(EmailTracker.objects.all())
+        self.assertEqual(len(calls), 4, f"For command '{self.test_command}', the send continued after another process took it over")
+        self.test_instance = get_tracker(self.sharded_headline)
+        attribute_equals(
+            self,
+            {
+                'checkpoint_pk': Subscriber.objects.order_by('pk')[1].pk,
+                'number_sent': 2,
+                'sending': True,
+                'claimed_by': 'other-worker',
+            },
+            command=True,
+        )
+        self.assertFalse(bulk_email.send_records().exists(), f"For command '{self.test_command}', a send taken over by another process was finished")
+
+    def test_batch_lease_taken_over(self):
+        self.sharded_headline = 'Headline for testing lost batch leases'
+        self.create_sharded_send(5)
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+            EMAILER_SHARD_SIZE=4,
+        ):
+            calls = self.take_over_send(SendBatch.objects.filter(first_subscriber_pk=Subscriber.objects.order_by('pk')[0].pk), worker=True)
+        self.assertEqual(len(calls), 5, f"For command '{self.test_command}', the batch continued after another process took it over")
+        tracker = get_tracker(self.sharded_headline)
+        self.test_instance = tracker.batches.all()[0]
+        attribute_equals(
+            self,
+            {
+                'status': SendBatch.CLAIMED,
+                'checkpoint_pk': Subscriber.objects.order_by('pk')[1].pk,
+                'number_sent': 2,
+            },
+            command=True,
+        )
+        self.assertTrue(tracker.sending, f"For command '{self.test_command}', a send with a batch taken over by another process was finished")
+
+    def test_lease_renewed_on_timer(self):
+        tracker = create_tracker()
+        EmailTracker.objects.filter(
+            pk=tracker.pk,
+        ).update(
+            sending=True,
+            claimed_by='test-worker',
+            lease_expires=timezone.now(),
+        )
+        lease = SendLease('test-worker', tracker)
+        self.assertTrue(lease.renew(), f"For command '{self.test_command}', a held lease was not renewed")
+        tracker.refresh_from_db()
+        self.assertGreater(tracker.lease_expires, timezone.now() + timedelta(seconds=60), f"For command '{self.test_command}', the lease was not extended")
+        EmailTracker.objects.filter(
+            pk=tracker.pk,
+        ).update(
+            claimed_by='other-worker',
+        )
+        self.assertFalse(lease.renew(), f"For command '{self.test_command}', a lease taken over by another process was renewed")
+        self.assertTrue(lease.lost, f"For command '{self.test_command}', a lease taken over by another process was not marked lost")
+        ''' The lease is renewed from a thread, without waiting for messages to be delivered '''
+        renewed = Event()
+        lease = SendLease('test-worker', tracker)
+        with self.settings(
+            EMAILER_SEND_LEASE=0.03,
+        ):
+            with patch.object(
+                lease,
+                'renew',
+                side_effect=lambda: renewed.set() or True,
+            ):
+                lease.start()
+                self.assertTrue(renewed.wait(5), f"For command '{self.test_command}', the lease was not renewed on a timer")
+                lease.stop()
+
+    def test_expired_batch_lease_reclaimed(self):
+        self.sharded_headline = 'Headline for testing batch leases'
+        bulk_email = self.create_sharded_send(5)
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+            EMAILER_SHARD_SIZE=4,
+        ):
+            self.interrupt_send(worker=True)
+            tracker = get_tracker(self.sharded_headline)
+            tracker.batches.filter(
+                status=SendBatch.CLAIMED,
+            ).update(
+                claimed_at=timezone.now() - timedelta(hours=1),
+            )
+            call_test_command(
+                self,
+                worker=True,
+            )
+        self.check_resumed_send(bulk_email)
+
+    def test_streamed_recipients(self):
+        self.sharded_headline = 'Headline for testing streamed recipients'
+        self.create_sharded_send(5)
+        with self.assertNumQueries(3):
+            recipients = list(iterate_recipients(get_recipients(self.subscription_one), chunk_size=2))
+        expected = list(Subscriber.objects.order_by('pk').values_list('pk', 'subscriber_email'))
+        self.assertEqual([(recipient.pk, recipient.subscriber_email) for recipient in recipients], expected, f"For command '{self.test_command}', recipients were not streamed in primary key order")
+        output = StringIO()
+        with self.settings(
+            EMAILER_RECIPIENT_CHUNK_SIZE=2,
+        ):
+            call_test_command(
+                self,
+                verbosity=2,
+                stdout=output,
+            )
+        check_quantity_email_sent(
             self,
-            email_number=1,
-            text_strings=[
-                body_text_one,
-            ],
+            5,
         )
+        self.assertIn('Sent 5 emails', output.getvalue(), f"For command '{self.test_command}', the run summary did not report the emails sent")
 
-    def test_sort_order_updated(self):
-        self.subscription_one = create_subscription(
-            list_name=self.list_one_name,
-        )
-        body_text_one = 'Newer update body text'
-        body_text_two = 'Older update body text'
-        updated_email = create_email(
-            list_name=self.list_one_name,
-            body_text=body_text_one,
-            sendable=True,
-        )
-        create_email(
-            list_name=self.list_one_name,
-            body_text=body_text_two,
-            sendable=True,
-        )
-        updated_email.save()
-        create_subscriber_subscription_state(
+    def create_domain_send(self):
+        self.sharded_headline = 'Headline for testing domain grouping'
+        self.create_sharded_send(0)
+        for number, domain in enumerate(['b.example.com', 'A.example.com', 'b.example.com', 'a.example.com']):
+            subscriber = create_subscriber(
+                subscriber_email=f'subscriber_{number}@{domain}',
+            )
+            subscriber.subscriptions.add(self.subscription_one)
+
+    def test_send_run(self):
+        self.sharded_headline = 'Headline for testing send runs'
+        self.create_sharded_send(3)
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+        ):
+            call_test_command(self)
+        self.test_instance = SendRun.objects.get()
+        attribute_equals(
             self,
-            self.subscriber_one_email,
-            'Anonymous',
-            'Subscriber',
-            2,
+            {
+                'recipient_count': 3,
+                'number_sent': 3,
+                'number_failed': 0,
+            },
+            command=True,
         )
+        self.assertIsNotNone(self.test_instance.finished, f"For command '{self.test_command}', the send run was not marked finished")
+        for phase in ['query', 'render', 'deliver']:
+            self.assertGreater(getattr(self.test_instance, f'{phase}_seconds'), 0, f"For command '{self.test_command}', no time was recorded for the '{phase}' phase")
+
+    def test_recipient_snapshot(self):
+        self.sharded_headline = 'Headline for testing the recipient snapshot'
+        self.create_sharded_send(3)
         call_test_command(self)
-        check_email(
+        tracker = get_tracker(self.sharded_headline)
+        self.assertEqual(list(tracker.open_bitmap.recipient_pks()), list(Subscriber.objects.order_by('pk').values_list('pk', flat=True)), f"For command '{self.test_command}', the recipients of the send were not snapshotted")
+
+    def test_query_plan(self):
+        self.sharded_headline = 'Headline for testing query plans'
+        self.create_sharded_send(3)
+        ''' The subscription lists are read in full to rank them, and there are only ever a few '''
+        with CaptureQueriesContext(connection) as queries:
+            call_test_command(self)
+        check_query_plans(
             self,
-            text_strings=[
-                body_text_two,
+            queries,
+            [
+                BulkEmail,
+                EmailTracker,
+                Membership,
+                OpenBitmap,
+                SendBatch,
+                Subscriber,
             ],
         )
-        call_test_command(self)
-        check_email(
+        ''' Queued emails are few enough to sort, but recipients are snapshotted and chunked in index order '''
+        check_query_plans(
             self,
-            email_number=1,
-            text_strings=[
-                body_text_one,
+            queries,
+            [
+                Membership,
+                Subscriber,
             ],
+            ordered=True,
         )
 
-    def test_email_content(self):
-        test_headline = 'Headline for testing email content'
-        self.subscription_one = create_subscription(
-            list_name=self.list_one_name,
-        )
-        create_email(
-            headline=test_headline,
-            list_name=self.list_one_name,
-            sendable=True,
-        )
-        subscriber = create_subscriber_subscription_state(
-            self,
-            self.subscriber_one_email,
-            'Anonymous',
-            'Subscriber',
-            2,
-        )
-        call_test_command(self)
-        tracker = get_tracker(test_headline)
-        tracking_url = reverse(
-            'django_simple_bulk_emailer:opened_email',
-            kwargs={
-                'pk': tracker.pk,
-                'subscriber_key': subscriber.subscriber_key,
-            },
-        )
-        '''
-        Checking email:
-            * is correct instance
-            * is using text and HTML templates correctly
-            * has correct protocol_domain
-            * has correct tracking image
-        '''
-        check_email(
+    def test_signed_tokens(self):
+        self.sharded_headline = 'Headline for testing signed tokens'
+        self.create_sharded_send(1)
+        with self.settings(
+            EMAILER_SIGNED_TOKENS=True,
+        ):
+            call_test_command(self)
+        subscriber = Subscriber.objects.get()
+        subscriber_token = make_subscriber_token(subscriber.pk, self.subscription_one.pk)
+        html_contains(
             self,
-            subject=test_headline,
-            text_strings=[
-                'To unsubscribe, go to:',
-                'http://127.0.0.1:8000',
+            mail.outbox[0].alternatives[0][0],
+            true_strings=[
+                f'/subscriptions/manage/{subscriber_token}/',
+                f'/{subscriber_token}.png',
             ],
-            html_strings=[
-                '<!DOCTYPE html>',
-                tracking_url,
+            false_strings=[
+                subscriber.subscriber_key,
             ],
         )
 
-    def test_attributes_after_sending(self):
-        create_subscription(
-            list_name=self.list_one_name,
-        )
-        bulk_email = create_email(
-            list_name=self.list_one_name,
-            sendable=True,
-        )
-        call_test_command(self)
-        bulk_email.refresh_from_db()
-        self.test_instance = bulk_email
+    def test_send_run_progress(self):
+        self.sharded_headline = 'Headline for testing send run progress'
+        self.create_sharded_send(3)
+        with self.settings(
+            EMAILER_SEND_BATCH_SIZE=2,
+        ):
+            self.interrupt_send()
+        self.test_instance = SendRun.objects.get()
         attribute_equals(
             self,
             {
-                'sendable': False,
-                'sending': False,
+                'number_sent': 2,
+                'finished': None,
             },
             command=True,
         )
 
-    def test_send_history_string(self):
-        with patch(
-            'django_simple_bulk_emailer.management.commands.send_bulk_email.timezone.now',
-            fake_now,
-        ):
-            create_subscription(
-                list_name=self.list_one_name,
-            )
-            bulk_email = create_email(
-                list_name=self.list_one_name,
-                sendable=True,
-            )
-            call_test_command(self)
-            bulk_email.refresh_from_db()
-            completed_string = f'<ul><li>Completed: {localize(timezone.localtime(fake_now()))}'
-            list_name_string = f'<ul><li>Sent to: {self.list_one_name}</li></ul></li></ul>'
-            html_contains(
+    def test_recipients_grouped_by_domain(self):
+        self.create_domain_send()
+        subscriber_list = get_recipients(self.subscription_one)
+        recipients = list(iterate_recipients(subscriber_list, chunk_size=3, group_by_domain=True))
+        expected = ['subscriber_1@a.example.com', 'subscriber_3@a.example.com', 'subscriber_0@b.example.com', 'subscriber_2@b.example.com']
+        self.assertEqual([recipient.subscriber_email for recipient in recipients], expected, f"For command '{self.test_command}', recipients were not grouped by domain")
+        self.assertEqual(recipients[0].email_domain, 'a.example.com', f"For command '{self.test_command}', the recipient domain was not taken from the email address")
+        after = (recipients[1].email_domain, recipients[1].pk)
+        remaining = list(iterate_recipients(subscriber_list, after=after, group_by_domain=True))
+        self.assertEqual(remaining, recipients[2:], f"For command '{self.test_command}', grouped recipients did not continue after the checkpoint")
+
+    def test_recipient_query_plan(self):
+        self.create_domain_send()
+        ''' Every chunk, the first included, reads only the list's members, in index order '''
+        for group_by_domain in [True, False]:
+            with CaptureQueriesContext(connection) as queries:
+                list(iterate_recipients(get_recipients(self.subscription_one), chunk_size=1, group_by_domain=group_by_domain))
+            check_query_plans(
                 self,
-                bulk_email.send_history,
-                true_strings=[
-                    completed_string,
-                    list_name_string,
+                queries,
+                [
+                    Membership,
+                    Subscriber,
                 ],
+                ordered=True,
             )
 
-    def test_tracker_attributes(self):
-        with patch(
-            'django_simple_bulk_emailer.management.commands.send_bulk_email.timezone.now',
-            fake_now,
+    def test_grouped_send_connections(self):
+        self.create_domain_send()
+        connection = ThrottlingConnection(throttle_count=0)
+        with self.settings(
+            EMAILER_GROUP_BY_DOMAIN=True,
         ):
-            test_headline = 'Headline for testing tracker'
-            self.subscription_one = create_subscription(
-                list_name=self.list_one_name,
+            with patch(
+                'django_simple_bulk_emailer.sending.get_connection',
+                return_value=connection,
+            ):
+                call_test_command(self)
+        domains = [message.to[0].rpartition('@')[2].lower().rstrip('>') for message in connection.sent]
+        self.assertEqual(domains, ['a.example.com', 'a.example.com', 'b.example.com', 'b.example.com'], f"For command '{self.test_command}', grouped recipients were not sent domain by domain")
+        self.test_instance = get_tracker(self.sharded_headline)
+        attribute_equals(
+            self,
+            {
+                'connection_count': 2,
+                'checkpoint_domain': 'b.example.com',
+            },
+            command=True,
+        )
+
+    def test_send_context(self):
+        self.sharded_headline = 'Headline for testing send context'
+        bulk_email = self.create_sharded_send(3)
+        recipients = list(iterate_recipients(get_recipients(self.subscription_one)))
+        with self.settings(
+            SITE_ID=self.profile_instance.site_ptr.id,
+            EMAILER_SPLICE_RENDERING=False,
+        ):
+            send_context = SendContext()
+            tracker = EmailTracker.objects.create(
+                subscription=self.subscription_one,
+                email_pk=bulk_email.pk,
             )
-            create_email(
-                list_name=self.list_one_name,
-                headline=test_headline,
-                sendable=True,
+            email_send = EmailSend(tracker, send_context)
+            with CaptureQueriesContext(connection) as queries:
+                for recipient in recipients:
+                    message = email_send.create_message(recipient)
+        site_queries = [query['sql'] for query in queries if 'django_site' in query['sql'] or 'siteprofile' in query['sql']]
+        self.assertEqual(site_queries, [], f"For command '{self.test_command}', building messages looked up the site again")
+        self.assertIn(send_context.protocol_domain, message.body, f"For command '{self.test_command}', the message did not use the send context's domain")
+        self.assertEqual(message.from_email, send_context.from_address, f"For command '{self.test_command}', the message did not use the send context's from address")
+
+    def test_subscriber_url_templates(self):
+        protocol_domain = 'http://127.0.0.1:8000'
+        subscriber_keys = [
+            create_subscriber().subscriber_key,
+            'key with spaces',
+            'key%with?reserved#characters',
+            'ключ',
+        ]
+        for list_slug in ['test-list', '']:
+            subscriber_urls = SubscriberUrls(
+                protocol_domain,
+                list_slug=list_slug,
+                tracker_pk=7,
             )
-            create_subscriber_subscription_state(
-                self,
-                self.subscriber_one_email,
-                'Anonymous',
-                'Subscriber',
-                2,
+            for subscriber_key in subscriber_keys:
+                if list_slug:
+                    unsubscribe_url = reverse(
+                        'django_simple_bulk_emailer:quick_unsubscribe',
+                        kwargs={
+                            'list_slug': list_slug,
+                            'subscriber_key': subscriber_key,
+                        },
+                    )
+                else:
+                    unsubscribe_url = ''
+                expected = {
+                    'subscriptions_url': protocol_domain + reverse(
+                        'django_simple_bulk_emailer:manage_subscriptions',
+                        kwargs={
+                            'subscriber_key': subscriber_key,
+                        },
+                    ),
+                    'quick_unsubscribe_url': protocol_domain + unsubscribe_url,
+                    'tracking_image': reverse(
+                        'django_simple_bulk_emailer:opened_email',
+                        kwargs={
+                            'pk': 7,
+                            'subscriber_key': subscriber_key,
+                        },
+                    ),
+                }
+                self.assertEqual(subscriber_urls.build(subscriber_key), expected, f"For command '{self.test_command}', URLs built from templates did not match reverse() for key '{subscriber_key}'")
+
+    def throttled_send(self, connection):
+        messages = [create_message('Subject', 'Text', '<p>HTML</p>', f'subscriber_{number}@example.com') for number in range(3)]
+        rate_limiter = RateLimiter(
+            rate=100,
+            domain_rates={
+                '*': 50,
+            },
+        )
+        with self.settings(
+            EMAILER_THROTTLE_DELAY=0,
+        ):
+            with BulkMailer(connection=connection, rate_limiter=rate_limiter) as mailer:
+                for message in messages:
+                    mailer.add(message)
+        return mailer, rate_limiter
+
+    def test_throttled_retry(self):
+        connection = ThrottlingConnection(throttle_count=2)
+        mailer, rate_limiter = self.throttled_send(connection)
+        self.assertEqual(len(connection.sent), 3, 'Throttled messages were not retried')
+        self.assertEqual(mailer.number_sent, 3, 'Retried messages were not counted')
+        self.assertLess(rate_limiter.bucket.rate, 100, 'The send rate was not reduced after throttling')
+        self.assertLess(rate_limiter.domain_buckets['example.com'].rate, 50, 'The domain send rate was not reduced after throttling')
+
+    def test_throttled_retries_exhausted(self):
+        connection = ThrottlingConnection(throttle_count=100)
+        with self.settings(
+            EMAILER_THROTTLE_RETRIES=2,
+        ):
+            mailer, rate_limiter = self.throttled_send(connection)
+        self.assertEqual(mailer.number_sent, 0, 'Messages were counted as sent while throttled')
+        self.assertEqual(connection.attempts, 9, 'Throttled messages were not retried the configured number of times')
+
+    def test_permanent_refusal_not_retried(self):
+        connection = ThrottlingConnection(throttle_count=1, code=550)
+        mailer, rate_limiter = self.throttled_send(connection)
+        self.assertEqual(connection.attempts, 3, 'A permanently refused message was retried')
+        self.assertEqual(mailer.number_sent, 2, 'Messages after a refused one were not sent')
+
+    def test_token_bucket(self):
+        clock = [0]
+        bucket = TokenBucket(2, clock=lambda: clock[0])
+        self.assertEqual([bucket.take(), bucket.take()], [0, 0], 'A full bucket did not allow a burst of its rate')
+        self.assertEqual(bucket.take(), 0.5, 'An empty bucket did not wait for the next token')
+        self.assertEqual(bucket.take(), 1, 'Waiting takers were not queued in turn')
+        clock[0] = 10
+        self.assertEqual(bucket.take(), 0, 'The bucket did not refill over time')
+        bucket.decrease()
+        self.assertEqual(bucket.rate, 1, 'Throttling did not halve the rate')
+        for number in range(60):
+            bucket.increase()
+        self.assertEqual(bucket.rate, 2, 'The rate did not climb back to its limit')
+
+    def check_renderer(self, email_directory, spliceable):
+        create_subscription(
+            list_name=self.list_one_name,
+        )
+        bulk_email = create_email(
+            list_name=self.list_one_name,
+        )
+        email_content = {
+            'basic_template': 'django_simple_bulk_emailer/universal/emails/bulk_email_send.html',
+            'protocol_domain': 'http://127.0.0.1:8000',
+            'email_instance': bulk_email,
+        }
+        with self.settings(
+            SITE_ID=self.profile_instance.site_ptr.id,
+        ):
+            renderer = EmailRenderer(
+                email_content,
+                f'{email_directory}/email_template_text.txt',
+                f'{email_directory}/email_template_html.html',
             )
-            call_test_command(self)
-            self.test_instance = get_tracker(test_headline)
-            attribute_equals(
-                self,
-                {
-                    'subject': test_headline,
-                    'subscription_name': self.list_one_name,
-                    'send_complete': fake_now(),
-                    'number_sent': 1,
-                },
-                command=True,
+            for subscriber_key in ['firstkey', 'secondkey']:
+                recipient_content = {
+                    'tracking_image': f'/load-image/1/{subscriber_key}.png',
+                    'subscriptions_url': f'http://127.0.0.1:8000/manage/{subscriber_key}/',
+                    'quick_unsubscribe_url': f'http://127.0.0.1:8000/unsubscribe/{subscriber_key}/?a=1&b="2"',
+                }
+                error_msg = f"For command '{self.test_command}', the rendered email for '{subscriber_key}' did not match a full template render"
+                self.assertEqual(renderer.render(recipient_content), renderer.full_render(recipient_content), error_msg)
+        error_msg = f"For command '{self.test_command}', splice rendering was not '{spliceable}' for templates in '{email_directory}'"
+        self.assertEqual(renderer.spliceable, spliceable, error_msg)
+
+    def test_splice_rendering(self):
+        self.check_renderer(
+            'django_simple_bulk_emailer/subscription/emails',
+            True,
+        )
+
+    def test_splice_rendering_fallback(self):
+        self.check_renderer(
+            'emailer_tests',
+            False,
+        )
+
+    def test_splice_rendering_setting(self):
+        with self.settings(
+            EMAILER_SPLICE_RENDERING=False,
+        ):
+            self.check_renderer(
+                'django_simple_bulk_emailer/subscription/emails',
+                False,
             )
 
+class ThrottlingConnection:
+    def __init__(self, throttle_count, code=450):
+        self.throttle_count = throttle_count
+        self.code = code
+        self.attempts = 0
+        self.sent = []
+
+    def open(self):
+        return True
+
+    def close(self):
+        pass
+
+    def send_messages(self, email_messages):
+        self.attempts += 1
+        if self.attempts <= self.throttle_count:
+            raise SMTPRecipientsRefused({email_messages[0].to[0]: (self.code, b'Too many messages, slow down')})
+        self.sent += email_messages
+        return len(email_messages)
+
+
+class SlowConnection:
+    def __init__(self, delay, during_send=None):
+        self.delay = delay
+        self.during_send = during_send
+        self.sent = []
+
+    def open(self):
+        return True
+
+    def close(self):
+        pass
+
+    def send_messages(self, email_messages):
+        sleep(self.delay)
+        if self.during_send:
+            self.during_send()
+        self.sent += email_messages
+        return len(email_messages)
+
+
+class DroppingConnection:
+    def __init__(self, drop_at):
+        self.drop_at = drop_at
+        self.attempts = 0
+        self.sent = []
+
+    def open(self):
+        return True
+
+    def close(self):
+        pass
+
+    def send_messages(self, email_messages):
+        self.attempts += 1
+        if self.attempts == self.drop_at:
+            raise SMTPServerDisconnected('Connection unexpectedly closed')
+        self.sent += email_messages
+        return len(email_messages)
+
 
 @patch(
     'mailchimp3.MailChimp',
@@ -721,6 +2290,24 @@ class SyncMailChimpTests(MixinWrap.BaseMixin):
                 subscriber=self.subscriber_one,
             )
 
+    def test_query_plan(self, MockMailChimp):
+        with patch.object(MockMailChimp().lists.members, 'create_or_update', new=self.mock_create_or_update):
+            self.called_with_one = self.generate_data(
+                self,
+                subscriber=self.subscriber_one,
+                subscriber_hash=self.subscriber_hash_one,
+                subscription=self.subscription_one,
+            )
+            with CaptureQueriesContext(connection) as queries:
+                call_test_command(self)
+        check_query_plans(
+            self,
+            queries,
+            [
+                Subscriber,
+            ],
+        )
+
     def test_new_subscriber_with_error(self, MockMailChimp):
         with patch.object(MockMailChimp().lists.members, 'create_or_update', new=self.mock_create_or_update):
             self.called_with_one = self.generate_data(
@@ -958,7 +2545,7 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 year=2020,
                 month=1,
             ),
-            json_data={
+            opens={
                 'test_key': [2020, 1],
             },
         )
@@ -969,7 +2556,7 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 year=2019,
                 month=12,
             ),
-            json_data={
+            opens={
                 'test_key': [2020, 1],
             },
         )
@@ -980,7 +2567,7 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 year=2020,
                 month=1,
             ),
-            json_data={
+            opens={
                 'test_key': [2019, 12],
             },
         )
@@ -1016,7 +2603,7 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 year=2020,
                 month=1,
             ),
-            json_data={
+            opens={
                 'test_key': [2020, 1],
             },
         )
@@ -1026,7 +2613,7 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 year=2020,
                 month=1,
             ),
-            json_data={
+            opens={
                 'test_key': [2020, 1],
             },
         )
@@ -1036,7 +2623,7 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 year=2020,
                 month=1,
             ),
-            json_data={
+            opens={
                 'test_key': [2020, 1],
             },
         )
@@ -1046,7 +2633,7 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 year=2020,
                 month=1,
             ),
-            json_data={
+            opens={
                 'test_key': [2020, 1],
             },
         )
@@ -1087,7 +2674,7 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 year=2020,
                 month=1,
             ),
-            json_data={
+            opens={
                 'test_key': [2020, 1],
             },
         )
@@ -1097,7 +2684,7 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 year=2020,
                 month=1,
             ),
-            json_data={
+            opens={
                 'test_key': [2020, 1],
             },
         )
@@ -1106,7 +2693,7 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 year=2019,
                 month=12,
             ),
-            json_data={
+            opens={
                 'test_key': [2020, 1],
             },
         )
@@ -1148,7 +2735,7 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 month=1,
             ),
             number_sent=2,
-            json_data={
+            opens={
                 'test_key': [2020, 1],
             },
         )
@@ -1161,7 +2748,7 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 month=1,
             ),
             number_sent=4,
-            json_data={
+            opens={
                 'test_key_one': [2020, 1],
                 'test_key_two': [2020, 1],
                 'test_key_three': [2020, 1],
@@ -1176,7 +2763,7 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 month=11,
             ),
             number_sent=4,
-            json_data={
+            opens={
                 'test_key': [2020, 1],
             },
         )
@@ -1189,7 +2776,7 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 month=12,
             ),
             number_sent=3,
-            json_data={
+            opens={
                 'test_key_one': [2020, 1],
                 'test_key_two': [2020, 1],
                 'test_key_three': [2020, 1],
@@ -1305,3 +2892,49 @@ class UpdateEmailStatsTests(MixinWrap.BaseMixin):
                 '</tr>',
             ],
         )
+
+    def test_unique_openers(self):
+        tracker_one = create_tracker(
+            subscription_name=self.list_one_name,
+            send_complete=fake_now(),
+        )
+        tracker_two = create_tracker(
+            subscription_name=self.list_one_name,
+            send_complete=fake_now(
+                year=2019,
+                month=12,
+            ),
+        )
+        tracker_three = create_tracker(
+            subscription_name=self.list_two_name,
+            send_complete=fake_now(),
+        )
+        OpenEvent.objects.bulk_create(
+            [OpenEvent(tracker=tracker_one, subscriber_key=f'test_opener_{number}', opened=fake_now()) for number in range(10)]
+            + [OpenEvent(tracker=tracker_two, subscriber_key=f'test_opener_{number}', opened=fake_now()) for number in range(5, 15)]
+            + [OpenEvent(tracker=tracker_two, subscriber_key=f'test_opener_{number}', opened=fake_now(year=2019, month=12)) for number in range(20, 30)]
+            + [OpenEvent(tracker=tracker_three, subscriber_key='test_opener_0', opened=fake_now())]
+        )
+        call_test_command(self)
+        self.test_instance = get_monthly_stat(
+            year_int=2020,
+            month_int=1,
+        )
+        test_string_list = self.test_instance.opener_data.split('<tr')
+        html_contains(
+            self,
+            test_string_list[2],
+            true_strings=[
+                f'<td>{self.list_one_name}</td>',
+                '<td id="emailer_numerical">15</td>',
+                '<td id="emailer_numerical">25</td>',
+            ],
+        )
+        html_contains(
+            self,
+            test_string_list[3],
+            true_strings=[
+                f'<td>{self.list_two_name}</td>',
+                '<td id="emailer_numerical">1</td>',
+            ],
+        )
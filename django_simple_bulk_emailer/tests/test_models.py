@@ -1,6 +1,9 @@
 from datetime import (
     timedelta,
 )
+from importlib import (
+    import_module,
+)
 from unittest.mock import (
     patch,
 )
@@ -20,11 +23,30 @@ from django.utils.formats import (
 )
 
 
+from django_simple_bulk_emailer.checks import (
+    check_email_classes,
+)
 from django_simple_bulk_emailer.models import (
     BulkEmail,
     EmailDocument,
     EmailImage,
+    Membership,
+    OpenBitmap,
+    OpenEvent,
+    OpenerSketch,
+    SendRun,
     Subscription,
+    get_month_number,
+)
+from django_simple_bulk_emailer.sending import (
+    SendContext,
+)
+from django_simple_bulk_emailer.sketches import (
+    add_to_sketch,
+    empty_sketch,
+    estimate_sketch,
+    get_sketch_position,
+    merge_sketches,
 )
 
 
@@ -95,6 +117,36 @@ class SubscriptionTests(MixinWrap.BaseMixin):
             BulkEmail,
         )
 
+    def test_get_email_class_cached(self):
+        with patch(
+            'django_simple_bulk_emailer.models.import_module',
+            wraps=import_module,
+        ) as mock_import:
+            self.test_instance.save()
+            self.test_instance.get_email_class()
+            self.test_instance.get_email_class()
+            self.assertEqual(mock_import.call_count, 1, 'The email class was imported more than once')
+            self.test_instance.save()
+            self.test_instance.get_email_class()
+            self.assertEqual(mock_import.call_count, 2, 'Saving a subscription did not clear the email class registry')
+
+    def test_email_class_check(self):
+        self.test_instance.associated_model = 'django_simple_bulk_emailer.models.MissingEmail'
+        self.test_instance.save()
+        mailchimp_subscription = create_subscription(
+            list_name='Second test list',
+        )
+        mailchimp_subscription.associated_model = 'None'
+        mailchimp_subscription.save()
+        errors = check_email_classes(
+            None,
+            databases=[
+                'default',
+            ],
+        )
+        self.assertEqual([error.id for error in errors], ['django_simple_bulk_emailer.E001'], 'An associated model that cannot be imported was not reported')
+        self.assertEqual(check_email_classes(None), [], 'The check queried the database without being given one')
+
     def test_list_link(self):
         method_output_contains(
             self,
@@ -154,6 +206,14 @@ class SubscriberTests(MixinWrap.BaseMixin):
             'Test Subscription One, Test Subscription Two',
         )
 
+    def test_membership_domains(self):
+        test_subscription_three = create_subscription(list_name='Test Subscription Three')
+        test_subscription_three.subscriber_set.add(self.test_instance)
+        self.assertEqual(set(Membership.objects.values_list('email_domain', flat=True)), {'example.com'}, 'The domain was not copied onto new memberships')
+        self.test_instance.subscriber_email = 'example@other.example.com'
+        self.test_instance.save()
+        self.assertEqual(set(Membership.objects.values_list('email_domain', flat=True)), {'other.example.com'}, 'A changed domain was not copied onto memberships')
+
 
 class BulkEmailTests(MixinWrap.BaseMixin):
     def __init__(self, *args, **kwargs):
@@ -410,6 +470,33 @@ class BulkEmailTests(MixinWrap.BaseMixin):
                 '',
             )
 
+    def test_send_context_domains(self):
+        site_instance = Site.objects.get(
+            domain=self.profile_instance.domain,
+        )
+        with self.settings(
+            STATIC_URL='http://www.example.com/static/',
+            MEDIA_URL='/media/',
+            SITE_ID=site_instance.id,
+        ):
+            self.test_instance.send_context = SendContext()
+        with self.assertNumQueries(0):
+            method_output_equals(
+                self,
+                'protocol_domain',
+                'http://127.0.0.1:8000',
+            )
+            method_output_equals(
+                self,
+                'static_domain',
+                '',
+            )
+            method_output_equals(
+                self,
+                'media_domain',
+                'http://127.0.0.1:8000',
+            )
+
 
 class EmailImageTests(MixinWrap.BaseMixin):
     def __init__(self, *args, **kwargs):
@@ -451,6 +538,141 @@ class EmailTrackerTests(MixinWrap.BaseMixin):
             localize(timezone.localtime(self.test_instance.send_complete)),
         )
 
+    def test_open_count(self):
+        self.test_instance = create_tracker(
+            opens={
+                'test_key_1': [2019, 12],
+                'test_key_2': [2020, 1],
+            },
+        )
+        method_output_equals(
+            self,
+            'open_count',
+            2,
+        )
+
+
+class OpenBitmapTests(MixinWrap.BaseMixin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def setUp(self):
+        self.tracker = create_tracker()
+        self.test_instance = OpenBitmap(
+            tracker=self.tracker,
+            first_month=get_month_number(fake_now()),
+        )
+        self.test_instance.set_recipients([2, 5, 9, 12, 20, 21, 30, 31, 40])
+        self.test_instance.save()
+        super().setUp()
+
+    def test_ordinal(self):
+        self.test_instance = OpenBitmap.objects.get(pk=self.test_instance.pk)
+        self.assertEqual([self.test_instance.ordinal(pk) for pk in [2, 9, 40, 3, 41]], [0, 2, 8, None, None], 'Recipients were not numbered by their place in the snapshot')
+
+    def test_add_open(self):
+        self.assertTrue(self.test_instance.add_open(8, fake_now()), 'A first open was not recorded')
+        self.assertFalse(self.test_instance.add_open(8, fake_now(month=2)), 'A repeat open was recorded')
+        self.test_instance.add_open(0, fake_now(month=3))
+        self.test_instance.save()
+        self.test_instance = OpenBitmap.objects.get(pk=self.test_instance.pk)
+        self.assertTrue(self.test_instance.is_open(8) and self.test_instance.is_open(0) and not self.test_instance.is_open(1), 'Open bits were not saved')
+        method_output_equals(
+            self,
+            'open_count',
+            2,
+        )
+        self.assertEqual([self.test_instance.month_count(2020, month) for month in [1, 2, 3, 4]], [1, 0, 1, 0], 'Opens were not counted in the month of the first open')
+
+    def test_tracker_open_count(self):
+        self.test_instance.add_open(3, fake_now())
+        self.test_instance.save()
+        OpenEvent.objects.create(
+            tracker=self.tracker,
+            subscriber_key='test_key',
+            opened=fake_now(),
+        )
+        self.assertEqual(self.tracker.open_count(), 2, 'Opens in the bitmap and unfolded events were not both counted')
+        self.assertEqual(self.tracker.month_open_count(2020, 1), 2, 'Opens in the bitmap and unfolded events were not both counted for the month')
+
+
+class OpenerSketchTests(MixinWrap.BaseMixin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def setUp(self):
+        self.test_instance = OpenerSketch.objects.create(
+            tracker=create_tracker(),
+            year_int=2020,
+            month_int=1,
+        )
+        super().setUp()
+
+    def test_estimate(self):
+        method_output_equals(
+            self,
+            'estimate',
+            0,
+        )
+        registers = bytearray(self.test_instance.registers)
+        add_to_sketch(registers, [get_sketch_position(f'test_opener_{number}') for number in range(20000)])
+        add_to_sketch(registers, [get_sketch_position(f'test_opener_{number}') for number in range(10000)])
+        self.test_instance.registers = registers
+        self.assertAlmostEqual(self.test_instance.estimate(), 20000, delta=1000, msg='Unique openers were not estimated to within 5%')
+
+    def test_merge(self):
+        registers_one = empty_sketch()
+        registers_two = empty_sketch()
+        add_to_sketch(registers_one, [get_sketch_position(f'test_opener_{number}') for number in range(20)])
+        add_to_sketch(registers_two, [get_sketch_position(f'test_opener_{number}') for number in range(10, 30)])
+        self.assertEqual(estimate_sketch(merge_sketches(registers_one, registers_two)), 30, 'Merged sketches did not count openers in either sketch once')
+
+
+class SendRunTests(MixinWrap.BaseMixin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def setUp(self):
+        send_run = SendRun.objects.create(
+            tracker=create_tracker(),
+            recipient_count=100,
+            number_sent=20,
+            number_failed=5,
+        )
+        self.updated = timezone.now()
+        SendRun.objects.filter(
+            pk=send_run.pk,
+        ).update(
+            created=self.updated - timedelta(seconds=10),
+            updated=self.updated,
+        )
+        self.test_instance = SendRun.objects.get(
+            pk=send_run.pk,
+        )
+        super().setUp()
+
+    def test_send_rate(self):
+        method_output_equals(
+            self,
+            'send_rate',
+            2,
+        )
+
+    def test_estimated_completion(self):
+        method_output_equals(
+            self,
+            'estimated_completion',
+            self.updated + timedelta(seconds=37.5),
+        )
+
+    def test_estimated_completion_finished(self):
+        self.test_instance.finished = self.updated
+        method_output_equals(
+            self,
+            'estimated_completion',
+            self.updated,
+        )
+
 
 class MonthlyStatTests(MixinWrap.BaseMixin):
     def __init__(self, *args, **kwargs):
@@ -490,3 +712,16 @@ class MonthlyStatTests(MixinWrap.BaseMixin):
             'stat_table',
             '</table>',
         )
+
+    def test_opener_table(self):
+        method_output_equals(
+            self,
+            'opener_table',
+            '',
+        )
+        self.test_instance.opener_data = 'Test opener data'
+        method_output_equals(
+            self,
+            'opener_table',
+            '<table id="emailer_table">Test opener data</table>',
+        )
@@ -1,16 +1,50 @@
+from shutil import (
+    rmtree,
+)
+from tempfile import (
+    mkdtemp,
+)
 from unittest.mock import (
     patch,
 )
 
 
+from django.contrib.sessions.middleware import (
+    SessionMiddleware,
+)
+from django.db import (
+    connection,
+)
 from django.test import (
     TestCase,
 )
+from django.test.utils import (
+    CaptureQueriesContext,
+)
 from django.urls import (
     reverse,
 )
+from django.utils import (
+    timezone,
+)
 
+from django_simple_bulk_emailer.models import (
+    BulkEmail,
+    EmailTracker,
+    OpenerSketch,
+    OpenEvent,
+    SendRecord,
+    Subscriber,
+    Subscription,
+)
+from django_simple_bulk_emailer.tokens import (
+    make_subscriber_token,
+)
+from django_simple_bulk_emailer.tracking import (
+    OpenBuffer,
+)
 from django_simple_bulk_emailer.views import (
+    TRACKING_PIXEL,
     email_preview,
     get_subscriptions,
     list_view,
@@ -30,6 +64,7 @@ from .functions import (
     check_not_found,
     check_permission,
     check_quantity_email_sent,
+    check_query_plans,
     compare_secret_keys,
     check_subscriber_attributes,
     check_subscriber_count,
@@ -45,6 +80,7 @@ from .functions import (
     create_tracker,
     create_subscriber_subscription_state,
     create_user,
+    dummy_get_response,
     fake_now,
     json_contains,
     subscriber_exists,
@@ -349,6 +385,73 @@ class ManageSubscriptionsTests(MixinWrap.BaseMixin):
             ],
         )
 
+    def test_get_signed_token(self):
+        self.kwargs['subscriber_key'] = make_subscriber_token(self.subscriber.pk)
+        create_request_response(
+            self,
+            'get',
+        )
+        check_http_response(
+            self,
+            true_strings=[
+                'name="subscriber_email" value="example@example.com"',
+                '" checked> List One',
+            ],
+            false_strings=[
+                'The access link is invalid or has expired.',
+            ],
+        )
+
+    def test_get_forged_token(self):
+        self.kwargs['subscriber_key'] = f'{self.subscriber.pk}-0-{"0" * 32}'
+        with self.assertNumQueries(0):
+            create_request_response(
+                self,
+                'get',
+            )
+        check_http_response(
+            self,
+            true_strings=[
+                'The access link is invalid or has expired.',
+            ],
+            false_strings=[
+                'First name:',
+            ],
+        )
+
+    def test_get_key_not_accepted(self):
+        with self.settings(
+            EMAILER_ACCEPT_SUBSCRIBER_KEYS=False,
+        ):
+            create_request_response(
+                self,
+                'get',
+            )
+        check_http_response(
+            self,
+            true_strings=[
+                'The access link is invalid or has expired.',
+            ],
+            false_strings=[
+                'First name:',
+            ],
+        )
+
+    def test_query_plan(self):
+        ''' Every list is shown for the subscriber to choose from, so only the subscriber has to be found by index '''
+        with CaptureQueriesContext(connection) as queries:
+            create_request_response(
+                self,
+                'get',
+            )
+        check_query_plans(
+            self,
+            queries,
+            [
+                Subscriber,
+            ],
+        )
+
     def test_post_unsubscribe_all(self):
         self.data = {
             'unsubscribe_all': 'Unsubscribe from all',
@@ -472,6 +575,60 @@ class QuickUnsubscribeTests(MixinWrap.BaseMixin):
             ],
         )
 
+    def test_get_signed_token(self):
+        self.kwargs['subscriber_key'] = make_subscriber_token(self.subscriber.pk, self.subscription_one.pk)
+        with self.settings(
+            EMAILER_SIGNED_TOKENS=True,
+        ):
+            create_request_response(
+                self,
+                'get',
+            )
+        check_subscription_count(
+            self,
+            0,
+        )
+        check_http_response(
+            self,
+            true_strings=[
+                'You have been unsubscribed from the List One email distribution list.',
+                f'/subscriptions/manage/{make_subscriber_token(self.subscriber.pk, self.subscription_one.pk)}/',
+            ],
+        )
+
+    def test_get_token_for_other_list(self):
+        self.subscriber.subscriptions.add(self.subscription_two)
+        self.kwargs['subscriber_key'] = make_subscriber_token(self.subscriber.pk, self.subscription_two.pk)
+        create_request_response(
+            self,
+            'get',
+        )
+        check_subscription_count(
+            self,
+            2,
+        )
+        check_http_response(
+            self,
+            true_strings=[
+                'The access link is invalid or has expired.',
+            ],
+        )
+
+    def test_query_plan(self):
+        with CaptureQueriesContext(connection) as queries:
+            create_request_response(
+                self,
+                'get',
+            )
+        check_query_plans(
+            self,
+            queries,
+            [
+                Subscriber,
+                Subscription,
+            ],
+        )
+
     def test_get_invalid_slug(self):
         self.kwargs['list_slug'] = 'InvalidListSlug'
         create_request_response(
@@ -656,6 +813,7 @@ class EmailPreviewTests(MixinWrap.BaseMixin):
             permission_list=[
                 'change_bulkemail',
                 'view_bulkemail',
+                'view_sendrun',
             ],
         )
         create_request_response(
@@ -706,9 +864,24 @@ class EmailPreviewTests(MixinWrap.BaseMixin):
             ],
         )
         self.bulk_email.sendable = False
-        self.bulk_email.send_history = 'Test sending history'
         self.bulk_email.sending = False
         self.bulk_email.save()
+        tracker = create_tracker()
+        SendRecord.objects.create(
+            email_model=self.bulk_email.email_model(),
+            email_pk=self.bulk_email.pk,
+            tracker=tracker,
+            completed=timezone.now(),
+            subscription_name='Test sending list',
+            number_sent=12,
+            number_failed=1,
+        )
+        SendRecord.objects.create(
+            email_model=self.bulk_email.email_model(),
+            email_pk=self.bulk_email.pk,
+            completed=timezone.now(),
+            legacy_history='Test sending history',
+        )
         create_request_response(
             self,
             'get',
@@ -717,6 +890,9 @@ class EmailPreviewTests(MixinWrap.BaseMixin):
             self,
             true_strings=[
                 'Sending history:',
+                'Sent to: Test sending list',
+                'Messages sent: 12 (1 failed)',
+                f'<a href="/admin/django_simple_bulk_emailer/sendrun/?tracker={tracker.pk}">View send runs</a>',
                 'Test sending history',
                 'Send email again',
                 'Return to list',
@@ -913,6 +1089,21 @@ class ListViewTests(MixinWrap.BaseMixin):
             ],
         )
 
+    def test_query_plan(self):
+        with CaptureQueriesContext(connection) as queries:
+            create_request_response(
+                self,
+                'get',
+            )
+        check_query_plans(
+            self,
+            queries,
+            [
+                Subscription,
+                BulkEmail,
+            ],
+        )
+
 
 class PageViewPreviewBase(MixinWrap.BaseMixin):
     def __init__(self, *args, **kwargs):
@@ -1003,6 +1194,21 @@ class PageViewTests(PageViewPreviewBase):
             True,
         )
 
+    def test_query_plan(self):
+        with CaptureQueriesContext(connection) as queries:
+            create_request_response(
+                self,
+                'get',
+            )
+        check_query_plans(
+            self,
+            queries,
+            [
+                Subscription,
+                BulkEmail,
+            ],
+        )
+
     def test_get_meta_tags(self):
         create_request_response(
             self,
@@ -1090,15 +1296,9 @@ class PagePreviewTests(PageViewPreviewBase):
         )
 
 
-@patch(
-    'django.utils.timezone.now',
-    fake_now,
-)
 class OpenedEmailTests(MixinWrap.BaseMixin):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.current_year = fake_now().year,
-        self.current_month = fake_now().month,
 
     def setUp(self):
         self.subscriber = create_subscriber()
@@ -1114,16 +1314,23 @@ class OpenedEmailTests(MixinWrap.BaseMixin):
             'mode': 'RGBA',
             'format': 'PNG',
         }
-        self.test_json_dict = {
-            self.subscriber.subscriber_key: [
-                self.current_year[0],
-                self.current_month[0],
-            ]
-        }
         super().setUp()
 
     def test_get_invalid_pk(self):
-        self.kwargs['pk'] = 999
+        for pk in [999, 'invalid']:
+            self.kwargs['pk'] = pk
+            create_request_response(
+                self,
+                'get',
+            )
+            check_http_response(
+                self,
+                image_dict=self.image_dict,
+            )
+        self.assertFalse(OpenEvent.objects.exists(), f"For view '{self.view_name}', an open was recorded for a tracker that does not exist")
+
+    def test_get_first_open(self):
+        start_time = timezone.now()
         create_request_response(
             self,
             'get',
@@ -1132,34 +1339,124 @@ class OpenedEmailTests(MixinWrap.BaseMixin):
             self,
             image_dict=self.image_dict,
         )
+        self.test_instance = self.tracker.open_events.get()
+        attribute_equals(
+            self,
+            {
+                'subscriber_key': self.subscriber.subscriber_key,
+            },
+        )
+        self.assertTrue(start_time <= self.test_instance.opened <= timezone.now(), f"For view '{self.view_name}', the open was not recorded at the time of the request")
+        self.assertFalse(self.tracker.opener_sketches.exists(), f"For view '{self.view_name}', the month's sketch was written on an open instead of when opens are folded")
 
-    def test_get_no_existing_data(self):
-        create_request_response(
+    def test_cache_headers(self):
+        with self.settings(
+            EMAILER_PIXEL_CACHE_SECONDS=3600,
+        ):
+            create_request_response(
+                self,
+                'get',
+            )
+        response = SessionMiddleware(dummy_get_response).process_response(self.request, self.response)
+        self.assertEqual(response.content, TRACKING_PIXEL, f"For view '{self.view_name}', the tracking image was not returned")
+        self.assertEqual(response['Cache-Control'], 'private, max-age=3600', f"For view '{self.view_name}', the tracking image could not be cached by the client")
+        self.assertFalse(response.cookies, f"For view '{self.view_name}', a cookie was set")
+        self.assertFalse(response.has_header('Vary'), f"For view '{self.view_name}', the response varied on request headers")
+
+    def test_query_plan(self):
+        with CaptureQueriesContext(connection) as queries:
+            create_request_response(
+                self,
+                'get',
+            )
+        check_query_plans(
             self,
-            'get',
+            queries,
+            [
+                EmailTracker,
+                OpenEvent,
+                OpenerSketch,
+            ],
         )
-        check_http_response(
+
+    def test_get_buffered(self):
+        buffer_directory = mkdtemp()
+        try:
+            with self.settings(
+                EMAILER_OPEN_BUFFER_DIRECTORY=buffer_directory,
+            ):
+                with self.assertNumQueries(0):
+                    create_request_response(
+                        self,
+                        'get',
+                    )
+            check_http_response(
+                self,
+                image_dict=self.image_dict,
+            )
+            self.assertFalse(OpenEvent.objects.exists(), f"For view '{self.view_name}', a buffered open was saved to the database")
+            buffered = list(OpenBuffer(buffer_directory).claim(everything=True))
+            opens = list(OpenBuffer(buffer_directory).read(buffered[0]))
+            self.assertEqual([(tracker_pk, subscriber_key) for tracker_pk, subscriber_key, opened in opens], [(self.tracker.pk, self.subscriber.subscriber_key)], f"For view '{self.view_name}', the open was not buffered")
+        finally:
+            rmtree(buffer_directory)
+
+    def test_get_signed_token(self):
+        self.kwargs['subscriber_key'] = make_subscriber_token(self.subscriber.pk, 1)
+        create_request_response(
             self,
-            true_dict=self.test_json_dict,
-            image_dict=self.image_dict,
+            'get',
         )
+        self.assertEqual(list(self.tracker.open_events.values_list('subscriber_key', flat=True)), [f'pk-{self.subscriber.pk}'], f"For view '{self.view_name}', the open was not recorded under the subscriber's primary key")
 
-    def test_get_existing_data(self):
-        mock_json_dict = {
-            'test_key': 'Test value',
-        }
-        self.tracker.json_data = mock_json_dict
-        self.tracker.save()
+    def test_get_invalid_key(self):
+        for subscriber_key in ['Invalid-Key', f'{self.subscriber.pk}-1-{"0" * 32}']:
+            self.kwargs['subscriber_key'] = subscriber_key
+            with self.assertNumQueries(0):
+                create_request_response(
+                    self,
+                    'get',
+                )
+            check_http_response(
+                self,
+                image_dict=self.image_dict,
+            )
+
+    def test_get_repeat_open(self):
+        self.tracker = create_tracker(
+            opens={
+                'test_key': [2019, 12],
+                self.subscriber.subscriber_key: [2019, 12],
+            },
+        )
+        self.kwargs['pk'] = self.tracker.pk
         create_request_response(
             self,
             'get',
         )
-        merged_json_dict = {**mock_json_dict, **self.test_json_dict}
+        ''' A repeat open checks the tracker and makes one insert that is ignored '''
+        with self.assertNumQueries(2):
+            create_request_response(
+                self,
+                'get',
+            )
         check_http_response(
             self,
-            true_dict=merged_json_dict,
             image_dict=self.image_dict,
         )
+        self.test_instance = self.tracker.open_events.get(
+            subscriber_key=self.subscriber.subscriber_key,
+        )
+        attribute_equals(
+            self,
+            {
+                'opened': fake_now(
+                    year=2019,
+                    month=12,
+                ),
+            },
+        )
+        self.assertEqual(self.tracker.open_count(), 2, f"For view '{self.view_name}', a repeat open was counted again")
 
 
 @patch(
@@ -1590,6 +1887,6 @@ class MCSyncTests(MixinWrap.BaseMixin):
                 }
                 json_contains(
                     self,
-                    json_data=self.outgoing_json,
+                    self.outgoing_json,
                     true_dict=mock_data,
                 )
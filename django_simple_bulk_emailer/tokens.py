@@ -0,0 +1,61 @@
+import re
+
+
+from django.conf import (
+    settings,
+)
+from django.utils.crypto import (
+    constant_time_compare,
+    salted_hmac,
+)
+
+
+TOKEN_SALT = 'django_simple_bulk_emailer.subscriber_token'
+TOKEN_PATTERN = re.compile(r'([0-9]{1,18})-([0-9]{1,18})-([0-9a-f]{32})')
+
+
+def get_signed_tokens():
+    try:
+        return settings.EMAILER_SIGNED_TOKENS
+    except AttributeError:
+        return False
+
+
+def get_accept_subscriber_keys():
+    try:
+        return settings.EMAILER_ACCEPT_SUBSCRIBER_KEYS
+    except AttributeError:
+        return True
+
+
+def get_token_signature(value):
+    return salted_hmac(TOKEN_SALT, value, algorithm='sha256').hexdigest()[:32]
+
+
+def make_subscriber_token(subscriber_pk, subscription_pk=0):
+    value = f'{subscriber_pk}-{subscription_pk}'
+    return f'{value}-{get_token_signature(value)}'
+
+
+def read_subscriber_token(token):
+    """ """
+    ''' Return the subscriber and subscription primary keys of a correctly signed token, without reading the database '''
+    token_match = TOKEN_PATTERN.fullmatch(token)
+    if not token_match:
+        return None
+    subscriber_pk, subscription_pk, signature = token_match.groups()
+    if not constant_time_compare(signature, get_token_signature(f'{subscriber_pk}-{subscription_pk}')):
+        return None
+    return int(subscriber_pk), int(subscription_pk)
+
+
+def is_subscriber_key(subscriber_key):
+    """ """
+    ''' Subscriber keys are letters and digits only, so anything else can be turned away without a query '''
+    return get_accept_subscriber_keys() and subscriber_key.isascii() and subscriber_key.isalnum()
+
+
+def get_subscriber_token(subscriber, subscription_pk=0):
+    if get_signed_tokens():
+        return make_subscriber_token(subscriber.pk, subscription_pk)
+    return subscriber.subscriber_key
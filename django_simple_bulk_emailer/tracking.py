@@ -0,0 +1,215 @@
+from datetime import (
+    datetime,
+    timezone as dt_timezone,
+)
+from os import (
+    getpid,
+    listdir,
+    makedirs,
+    path,
+    remove,
+    replace,
+)
+from socket import (
+    gethostname,
+)
+from time import (
+    gmtime,
+    strftime,
+    time,
+)
+
+
+from django.conf import (
+    settings,
+)
+from django.db import (
+    transaction,
+)
+
+
+from .models import (
+    OpenBitmap,
+    OpenerSketch,
+    OpenEvent,
+    make_opener_key,
+    resolve_opener_keys,
+)
+from .sketches import (
+    add_to_sketch,
+    empty_sketch,
+    get_sketch_position,
+    merge_sketches,
+)
+
+
+def get_open_buffer_directory():
+    try:
+        return settings.EMAILER_OPEN_BUFFER_DIRECTORY
+    except AttributeError:
+        return None
+
+
+def get_flush_batch_size():
+    try:
+        return settings.EMAILER_OPEN_FLUSH_BATCH_SIZE
+    except AttributeError:
+        return 1000
+
+
+def fold_open_events():
+    """ """
+    ''' Move opens by recipients in a send's snapshot into its bitmap, leaving any others as events, and add every opener to the send's sketches '''
+    batch_size = get_flush_batch_size()
+    ''' Sends are found from the opens waiting to be folded, so sends without any are not read '''
+    tracker_pks = OpenEvent.objects.values_list(
+        'tracker',
+        flat=True,
+    ).distinct()
+    for tracker_pk in tracker_pks:
+        ''' Each send's bitmap is locked and its snapshot read once, and saved once all of its opens are folded '''
+        with transaction.atomic():
+            open_bitmap = OpenBitmap.objects.select_for_update().filter(
+                tracker=tracker_pk,
+            ).first()
+            month_registers = {}
+            after_pk = 0
+            changed = False
+            while True:
+                open_events = list(
+                    OpenEvent.objects.filter(
+                        tracker=tracker_pk,
+                        pk__gt=after_pk,
+                    ).order_by(
+                        'pk',
+                    ).values_list(
+                        'pk',
+                        'subscriber_key',
+                        'opened',
+                    )[:batch_size]
+                )
+                if not open_events:
+                    break
+                after_pk = open_events[-1][0]
+                subscriber_pks = resolve_opener_keys([subscriber_key for event_pk, subscriber_key, opened in open_events])
+                folded_pks = []
+                for event_pk, subscriber_key, opened in open_events:
+                    ordinal = None
+                    opener_key = subscriber_key
+                    if subscriber_key in subscriber_pks:
+                        ''' Subscriber keys change whenever a subscriber is saved, so openers are counted by primary key '''
+                        opener_key = make_opener_key(subscriber_pks[subscriber_key])
+                        if open_bitmap:
+                            ordinal = open_bitmap.ordinal(subscriber_pks[subscriber_key])
+                    opened = opened.astimezone(dt_timezone.utc)
+                    registers = month_registers.setdefault((opened.year, opened.month), empty_sketch())
+                    add_to_sketch(registers, [get_sketch_position(opener_key)])
+                    if ordinal is not None:
+                        if open_bitmap.add_open(ordinal, opened):
+                            changed = True
+                        folded_pks.append(event_pk)
+                if folded_pks:
+                    OpenEvent.objects.filter(
+                        pk__in=folded_pks,
+                    ).delete()
+                if len(open_events) < batch_size:
+                    break
+            if changed:
+                open_bitmap.save(
+                    update_fields=[
+                        'opens',
+                        'month_counts',
+                        'updated',
+                    ],
+                )
+            record_openers(tracker_pk, month_registers)
+
+
+def record_openers(tracker_pk, month_registers):
+    """ """
+    ''' Merge openers into the email's sketch for each month, so an open left as an event and read again by a later run adds nothing '''
+    for (year, month), registers in month_registers.items():
+        opener_sketch, created = OpenerSketch.objects.select_for_update().get_or_create(
+            tracker_id=tracker_pk,
+            year_int=year,
+            month_int=month,
+            defaults={
+                'registers': registers,
+            },
+        )
+        if not created:
+            merged_registers = merge_sketches(opener_sketch.registers, registers)
+            if merged_registers != opener_sketch.registers:
+                opener_sketch.registers = merged_registers
+                opener_sketch.save(
+                    update_fields=[
+                        'registers',
+                        'updated',
+                    ],
+                )
+
+
+def get_buffer_minute(timestamp):
+    return strftime('%Y%m%d%H%M', gmtime(timestamp))
+
+
+class OpenBuffer:
+    def __init__(self, directory):
+        """ """
+        ''' Each process appends opens to its own file for the current minute, in open, and flush_open_events moves finished files to cur '''
+        self.directory = directory
+
+    def file_path(self, folder, name=''):
+        return path.join(self.directory, folder, name)
+
+    def append(self, tracker_pk, subscriber_key, timestamp=None):
+        if timestamp is None:
+            timestamp = time()
+        ''' Lines are split on spaces with the key last, so a primary key that is not a number or a key with a line break could not be read back '''
+        if not str(tracker_pk).isdigit() or '\n' in subscriber_key or '\r' in subscriber_key:
+            return
+        name = f'{get_buffer_minute(timestamp)}-{gethostname()}-{getpid()}.log'
+        line = f'{tracker_pk} {timestamp} {subscriber_key}\n'
+        try:
+            buffer_file = open(self.file_path('open', name), 'a', encoding='utf-8')
+        except FileNotFoundError:
+            makedirs(self.file_path('open'), exist_ok=True)
+            buffer_file = open(self.file_path('open', name), 'a', encoding='utf-8')
+        with buffer_file:
+            buffer_file.write(line)
+
+    def claim(self, everything=False):
+        """ """
+        ''' Files from before the last minute are no longer appended to; files left in cur by an earlier flush are claimed again '''
+        makedirs(self.file_path('open'), exist_ok=True)
+        makedirs(self.file_path('cur'), exist_ok=True)
+        last_minute = get_buffer_minute(time() - 60)
+        for name in sorted(listdir(self.file_path('open'))):
+            if everything or name[:12] < last_minute:
+                try:
+                    replace(self.file_path('open', name), self.file_path('cur', name))
+                except FileNotFoundError:
+                    continue
+        return sorted(listdir(self.file_path('cur')))
+
+    def read(self, name):
+        """ """
+        ''' Lines cut short by a process stopping mid-write, and primary keys no database column could hold, are skipped '''
+        with open(self.file_path('cur', name), encoding='utf-8') as buffer_file:
+            for line in buffer_file:
+                if not line.endswith('\n'):
+                    continue
+                try:
+                    tracker_pk, timestamp, subscriber_key = line[:-1].split(' ', 2)
+                    opened = datetime.fromtimestamp(float(timestamp), tz=dt_timezone.utc)
+                    tracker_pk = int(tracker_pk)
+                except (OverflowError, ValueError):
+                    continue
+                if 0 < tracker_pk < 2 ** 63:
+                    yield tracker_pk, subscriber_key, opened
+
+    def remove(self, name):
+        try:
+            remove(self.file_path('cur', name))
+        except FileNotFoundError:
+            pass
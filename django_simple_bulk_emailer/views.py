@@ -1,8 +1,3 @@
-from io import (
-    BytesIO,
-)
-
-
 from django.conf import (
     settings,
 )
@@ -13,9 +8,6 @@ from django.core.exceptions import (
     ObjectDoesNotExist,
     PermissionDenied,
 )
-from django.core.mail import (
-    EmailMultiAlternatives,
-)
 from django.core.paginator import (
     EmptyPage,
     PageNotAnInteger,
@@ -41,33 +33,47 @@ from django.urls import (
 from django.utils import (
     timezone,
 )
+from django.utils.cache import (
+    patch_cache_control,
+)
 from django.views.decorators.csrf import (
     csrf_exempt,
 )
 
 
-from PIL import (
-    Image,
-)
-
-
 from .forms import (
     GetSubscriberForm,
     ModifySubscriberForm,
 )
 from .models import (
     EmailTracker,
+    OpenEvent,
     SiteProfile,
     Subscriber,
     Subscription,
+    make_opener_key,
+)
+from .sending import (
+    SendContext,
+    SubscriberUrls,
+    create_message,
+    get_universal_email_directory,
+)
+from .tokens import (
+    get_subscriber_token,
+    is_subscriber_key,
+    read_subscriber_token,
+)
+from .tracking import (
+    OpenBuffer,
+    get_open_buffer_directory,
 )
 
 
-def get_universal_email_directory():
-    try:
-        return settings.EMAILER_EMAIL_TEMPLATES
-    except AttributeError:
-        return 'django_simple_bulk_emailer/universal/emails'
+''' A transparent 1 by 1 PNG returned for every tracked open '''
+TRACKING_PIXEL = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89' \
+                 b'\x00\x00\x00\rIDATx\x9cc````\x00\x00\x00\x05\x00\x01\xa5\xf6E@' \
+                 b'\x00\x00\x00\x00IEND\xaeB`\x82'
 
 
 def get_universal_page_directory():
@@ -77,50 +83,53 @@ def get_universal_page_directory():
         return 'django_simple_bulk_emailer/universal/pages'
 
 
-def send_email(email_content, list_slug='', subscriber_key='', subject='', text_template='', html_template='', to_address=''):
+def get_pixel_cache_seconds():
     try:
-        from_address = settings.EMAILER_FROM_ADDRESS
+        return settings.EMAILER_PIXEL_CACHE_SECONDS
     except AttributeError:
-        from_address = settings.DEFAULT_FROM_EMAIL
-    try:
-        reply_address = settings.EMAILER_REPLY_ADDRESS
-    except AttributeError:
-        reply_address = from_address
-    site_domain = Site.objects.get_current().domain
-    site_profile = SiteProfile.objects.filter(
-        domain=site_domain,
-    ).first()
-    protocol_domain = site_profile.protocol_domain()
-    manage_url = reverse(
-        'django_simple_bulk_emailer:manage_subscriptions',
-        kwargs={
-            'subscriber_key': subscriber_key,
-        },
-    )
-    if list_slug != '':
-        unsubscribe_url = reverse(
-            'django_simple_bulk_emailer:quick_unsubscribe',
-            kwargs={
-                'list_slug': list_slug,
-                'subscriber_key': subscriber_key,
-            },
+        return 31536000
+
+
+def get_subscriber_urls(protocol_domain, subscriber_key, list_slug=''):
+    return SubscriberUrls(
+        protocol_domain,
+        list_slug=list_slug,
+    ).build(subscriber_key)
+
+
+def build_email(email_content, list_slug='', subscriber_key='', subject='', text_template='', html_template='', to_address='', send_context=None):
+    if send_context is None:
+        send_context = SendContext()
+    email_content['send_context'] = send_context
+    email_content.update(
+        get_subscriber_urls(
+            send_context.protocol_domain,
+            subscriber_key,
+            list_slug=list_slug,
         )
-    else:
-        unsubscribe_url = ''
-    subscriptions_url = f'{protocol_domain}{manage_url}'
-    quick_unsubscribe_url = f'{protocol_domain}{unsubscribe_url}'
-    email_content['subscriptions_url'] = subscriptions_url
-    email_content['quick_unsubscribe_url'] = quick_unsubscribe_url
+    )
     text_email = get_template(text_template).render(email_content)
     html_email = get_template(html_template).render(email_content)
-    message = EmailMultiAlternatives(
+    return create_message(
         subject,
         text_email,
-        from_address,
-        [to_address],
-        reply_to=[reply_address],
+        html_email,
+        to_address,
+        send_context=send_context,
+    )
+
+
+def send_email(email_content, list_slug='', subscriber_key='', subject='', text_template='', html_template='', to_address='', send_context=None):
+    message = build_email(
+        email_content,
+        list_slug=list_slug,
+        subscriber_key=subscriber_key,
+        subject=subject,
+        text_template=text_template,
+        html_template=html_template,
+        to_address=to_address,
+        send_context=send_context,
     )
-    message.attach_alternative(html_email, 'text/html')
     try:
         message.send(
             fail_silently=True,
@@ -172,7 +181,7 @@ def get_subscriptions(request):
                 subject = 'Manage your email subscriptions'
             send_email(
                 email_content,
-                subscriber_key=subscriber.subscriber_key,
+                subscriber_key=get_subscriber_token(subscriber),
                 text_template=text_template,
                 html_template=html_template,
                 subject=subject,
@@ -200,11 +209,34 @@ def get_subscriptions(request):
     )
 
 
+def get_subscriber_by_key(subscriber_key):
+    """ """
+    ''' Signed tokens are checked without a query and go straight to a primary key lookup, and anything that is neither a token nor a subscriber key is turned away '''
+    subscriber_token = read_subscriber_token(subscriber_key)
+    if subscriber_token:
+        subscriber_pk, subscription_pk = subscriber_token
+        return Subscriber.objects.get(
+            pk=subscriber_pk,
+        ), subscription_pk
+    if is_subscriber_key(subscriber_key):
+        return Subscriber.objects.get(
+            subscriber_key=subscriber_key,
+        ), None
+    raise Subscriber.DoesNotExist
+
+
+def get_opener_key(subscriber_key):
+    subscriber_token = read_subscriber_token(subscriber_key)
+    if subscriber_token:
+        return make_opener_key(subscriber_token[0])
+    if is_subscriber_key(subscriber_key):
+        return subscriber_key
+    return None
+
+
 def manage_subscriptions(request, subscriber_key):
     try:
-        subscriber = Subscriber.objects.get(
-            subscriber_key=subscriber_key,
-        )
+        subscriber, subscription_pk = get_subscriber_by_key(subscriber_key)
         subscription_set = subscriber.subscriptions.all()
         form = ModifySubscriberForm(
             initial={
@@ -260,17 +292,21 @@ def manage_subscriptions(request, subscriber_key):
 
 def quick_unsubscribe(request, list_slug, subscriber_key):
     try:
-        subscriber = Subscriber.objects.get(
-            subscriber_key=subscriber_key,
-        )
-        subscription = subscriber.subscriptions.get(
+        subscriber, subscription_pk = get_subscriber_by_key(subscriber_key)
+        subscriptions = subscriber.subscriptions.filter(
             list_slug=list_slug,
         )
+        if subscription_pk is not None:
+            ''' A signed token only unsubscribes from the list it was sent for '''
+            subscriptions = subscriptions.filter(
+                pk=subscription_pk,
+            )
+        subscription = subscriptions.get()
         subscriber.subscriptions.remove(subscription)
         manage_url = reverse(
             'django_simple_bulk_emailer:manage_subscriptions',
             kwargs={
-                'subscriber_key': subscriber.subscriber_key,
+                'subscriber_key': get_subscriber_token(subscriber, subscription.pk),
             }
         )
         page_template = f'{get_universal_page_directory()}/quick_unsubscribe.html'
@@ -442,40 +478,41 @@ def page_preview(request, list_slug, year, month, day, pk, headline_slug):
     return page_view(request, list_slug, year, month, day, pk, headline_slug, preview=True)
 
 
+@csrf_exempt
 def opened_email(request, pk, subscriber_key):
-    try:
-        email_tracker = EmailTracker.objects.get(
-            pk=pk,
-        )
-        if email_tracker.json_data:
-            dict_data = email_tracker.json_data
-        else:
-            dict_data = {}
-        if subscriber_key not in dict_data:
-            dict_data[subscriber_key] = [
-                timezone.now().year,
-                timezone.now().month,
-            ]
-            email_tracker.json_data = dict_data
-            email_tracker.save()
-    except (ObjectDoesNotExist, ValueError) as e:
-        pass
-    temp_handle = BytesIO()
-    image_file = Image.new(
-        'RGBA',
-        (1, 1),
-        (0, 0, 0, 0),
-    )
-    image_file.save(
-        temp_handle,
-        'png',
-    )
-    temp_handle.seek(0)
-    image_data = temp_handle.read()
-    return HttpResponse(
-        image_data,
+    ''' Opens by a signed token are recorded under the subscriber's primary key, and anything else unrecognised is ignored '''
+    subscriber_key = get_opener_key(subscriber_key)
+    open_buffer_directory = get_open_buffer_directory()
+    if subscriber_key and open_buffer_directory:
+        ''' Opens are appended to a file without touching the database, and saved by flush_open_events '''
+        OpenBuffer(open_buffer_directory).append(pk, subscriber_key)
+    elif subscriber_key:
+        try:
+            ''' Record each subscriber's first open with one insert, which later opens leave as it is '''
+            if EmailTracker.objects.filter(pk=pk).exists():
+                OpenEvent.objects.bulk_create(
+                    [
+                        OpenEvent(
+                            tracker_id=pk,
+                            subscriber_key=subscriber_key,
+                        ),
+                    ],
+                    ignore_conflicts=True,
+                )
+        except ValueError as e:
+            pass
+    ''' The session and user are never touched, so no session is loaded and no cookie is set '''
+    response = HttpResponse(
+        TRACKING_PIXEL,
         content_type='image/png',
     )
+    ''' Only the first open is counted, so later opens can be served from the client's cache '''
+    patch_cache_control(
+        response,
+        private=True,
+        max_age=get_pixel_cache_seconds(),
+    )
+    return response
 
 
 def get_subscriber(email):